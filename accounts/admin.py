@@ -1,16 +1,5 @@
 from .models import User, Follow
 from django.contrib import admin
-from rest_framework_simplejwt.token_blacklist.admin import OutstandingTokenAdmin
-from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
-
-
-class CustomOutstandingTokenAdmin(OutstandingTokenAdmin):
-    def has_delete_permission(self, *args, **kwargs):
-        return True
-
-
-admin.site.unregister(OutstandingToken)
-admin.site.register(OutstandingToken, CustomOutstandingTokenAdmin)
 
 
 @admin.register(User)
@@ -0,0 +1,100 @@
+import pickle
+from collections import OrderedDict
+from threading import Lock
+
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+from django_redis import get_redis_connection
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from core import settings
+from .models import User
+from .tokens import get_blacklist_key
+
+r = get_redis_connection("default")
+
+
+def get_version_key(user_id):
+    return f"user:{user_id}:auth_version"
+
+
+def get_snapshot_key(user_id, version):
+    return f"user:{user_id}:auth:{version}"
+
+
+def invalidate_user_snapshot(user_id):
+    # bumped once the change is committed, a snapshot built from the old row before that is never read again
+    transaction.on_commit(lambda: r.incr(get_version_key(user_id)))
+
+
+def get_user_row(request):
+    # the snapshot can be older than the row, saving it would write its stale columns back
+    return User.objects.select_related('brand_user').get(pk=request.user.pk)
+
+
+class SnapshotCache:
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+
+local_snapshots = SnapshotCache(settings.AUTH_SNAPSHOT_LOCAL_SIZE)
+
+
+# Token user and brand membership come from a versioned snapshot, bumped by signals on every change
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        pipe = r.pipeline()
+        pipe.get(get_version_key(user_id))
+        pipe.exists(get_blacklist_key(validated_token[api_settings.JTI_CLAIM]))
+        version, blacklisted = pipe.execute()
+        if blacklisted:
+            raise InvalidToken(_('Token is blacklisted'))
+        key = get_snapshot_key(user_id, int(version) if version else 0)
+        snapshot = local_snapshots.get(key)
+        if snapshot is None:
+            snapshot = r.get(key)
+            if snapshot is None:
+                user = User.objects.select_related('brand_user') \
+                    .filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+                if user is None:
+                    raise AuthenticationFailed(_('User not found'), code='user_not_found')
+                # brand_user (or its absence) is pickled with the user, so views do not query it again
+                try:
+                    user.brand_user
+                except User.brand_user.RelatedObjectDoesNotExist:
+                    pass
+                snapshot = pickle.dumps(user, pickle.HIGHEST_PROTOCOL)
+                r.set(key, snapshot, ex=settings.AUTH_SNAPSHOT_TTL)
+            local_snapshots.set(key, snapshot)
+        # request.user is for reading, views that write load the row with get_user_row
+        user = pickle.loads(snapshot)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        return user
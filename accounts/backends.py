@@ -1,8 +1,10 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.core.exceptions import MultipleObjectsReturned
-from django.db.models import Q
+from django.core.exceptions import PermissionDenied
+from rest_framework import exceptions
+from rest_framework.request import Request
 
+from . import hashing
 from .models import User
 
 UserModel = get_user_model()
@@ -12,16 +14,17 @@ class EmailBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None or password is None:
             return
+        user = User.objects.get_by_login(username)
         try:
-            user = User.objects.get(
-                Q(username__iexact=username) | Q(email__iexact=username))
-        except User.DoesNotExist:
-            UserModel().set_password(password)
-        except MultipleObjectsReturned:
-            return User.objects.filter(email=username).order_by('id').first()
-        else:
-            if user.check_password(password) and self.user_can_authenticate(user):
+            if user is None:
+                hashing.make_password(password)
+            elif hashing.check_password(user, password) and self.user_can_authenticate(user):
                 return user
+        except exceptions.Throttled:
+            # only API views turn Throttled into 429, the admin login gets a failed login instead of a 500
+            if isinstance(request, Request):
+                raise
+            raise PermissionDenied
 
     def get_user(self, user_id):
         try:
@@ -1,24 +1,10 @@
-from rest_framework import serializers
 from accounts.models import User
 from django_redis import get_redis_connection
+from other.dynamic_serializers import DynamicFieldsModelSerializer
 
 r = get_redis_connection("default")
 
 
-class DynamicFieldsModelSerializer(serializers.ModelSerializer):
-
-    def __init__(self, *args, **kwargs):
-        fields = kwargs.pop('fields', None)
-
-        super(DynamicFieldsModelSerializer, self).__init__(*args, **kwargs)
-
-        if fields is not None:
-            allowed = set(fields)
-            existing = set(self.fields.keys())
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
-
-
 class UserSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = User
@@ -0,0 +1,106 @@
+from django_redis import get_redis_connection
+
+from core import settings
+
+r = get_redis_connection("default")
+
+
+def get_user_followers_key(user_id):
+    return f"user:{user_id}:followers"
+
+
+def get_following_users_key(user_id):
+    return f"user:{user_id}:following_users"
+
+
+def get_brand_followers_key(brand_id):
+    return f"brand:{brand_id}:followers"
+
+
+def get_following_brands_key(user_id):
+    return f"user:{user_id}:following_brands"
+
+
+def get_product_likers_key(product_id):
+    return f"product:{product_id}:likers"
+
+
+def set_user_follow(from_user_id, to_user_id, following):
+    pipe = r.pipeline()
+    if following:
+        pipe.sadd(get_user_followers_key(to_user_id), from_user_id)
+        pipe.sadd(get_following_users_key(from_user_id), to_user_id)
+    else:
+        pipe.srem(get_user_followers_key(to_user_id), from_user_id)
+        pipe.srem(get_following_users_key(from_user_id), to_user_id)
+    pipe.execute()
+
+
+def set_brand_follow(user_id, brand_id, following):
+    pipe = r.pipeline()
+    if following:
+        pipe.sadd(get_brand_followers_key(brand_id), user_id)
+        pipe.sadd(get_following_brands_key(user_id), brand_id)
+    else:
+        pipe.srem(get_brand_followers_key(brand_id), user_id)
+        pipe.srem(get_following_brands_key(user_id), brand_id)
+    pipe.execute()
+
+
+def set_product_like(user_id, product_id, liked):
+    if liked:
+        r.sadd(get_product_likers_key(product_id), user_id)
+    else:
+        r.srem(get_product_likers_key(product_id), user_id)
+
+
+def is_following_user(user, to_user_id):
+    if not user.is_authenticated:
+        return False
+    return bool(r.sismember(get_following_users_key(user.pk), to_user_id))
+
+
+def is_following_brand(user, brand_id):
+    if not user.is_authenticated:
+        return False
+    return bool(r.sismember(get_following_brands_key(user.pk), brand_id))
+
+
+def are_members(key, members):
+    # SMISMEMBER answers for a whole page in one round trip (redis 6.2+)
+    if not members:
+        return []
+    return [bool(value) for value in r.execute_command('SMISMEMBER', key, *members)]
+
+
+def following_users(user, user_ids):
+    if not user.is_authenticated:
+        return [False] * len(user_ids)
+    return are_members(get_following_users_key(user.pk), user_ids)
+
+
+def following_brands(user, brand_ids):
+    if not user.is_authenticated:
+        return [False] * len(brand_ids)
+    return are_members(get_following_brands_key(user.pk), brand_ids)
+
+
+def get_friends(user, key):
+    # followed users who are members of key, e.g. a product's likers or a brand's followers
+    if not user.is_authenticated:
+        return []
+    following_key = get_following_users_key(user.pk)
+    pipe = r.pipeline()
+    pipe.scard(following_key)
+    pipe.scard(key)
+    following_size, size = pipe.execute()
+    if not following_size or not size:
+        return []
+    if min(following_size, size) <= settings.SOCIAL_PROOF_MAX_SCAN:
+        friends = r.sinter(following_key, key)
+    else:
+        # both sides are huge: test a random sample of the smaller set, so the count is a lower bound
+        smaller, larger = (following_key, key) if following_size <= size else (key, following_key)
+        sample = r.srandmember(smaller, settings.SOCIAL_PROOF_MAX_SCAN)
+        friends = [member for member, found in zip(sample, are_members(larger, sample)) if found]
+    return sorted(int(pk) for pk in friends)
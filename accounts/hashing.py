@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.contrib.auth import hashers
+from django.utils.translation import ugettext_lazy as _
+from django_redis import get_redis_connection
+from rest_framework import exceptions
+
+from core import settings
+
+r = get_redis_connection("default")
+
+_executor = None
+_executor_lock = threading.Lock()
+# Requests waiting for a hash in this process; beyond it callers get 429 instead of a queued thread
+_slots = threading.BoundedSemaphore(settings.PASSWORD_HASHING_QUEUE_SIZE)
+
+SLOTS_KEY = 'password_hashing:slots'
+# Global slots are shared by every web worker: holders sit in a sorted set scored by when they took the slot,
+# and a slot whose holder died is freed once its lease runs out
+ACQUIRE_SCRIPT = r.register_script("""
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+""")
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASHING_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker,
+                                            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'core.settings'),))
+        return _executor
+
+
+def _reset_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _throttled():
+    return exceptions.Throttled(detail=_('Too many requests are being processed, try again later.'))
+
+
+def acquire_global():
+    # a single attempt, callers already waited for a local slot
+    if settings.PASSWORD_HASHING_GLOBAL_LIMIT is None:
+        return None
+    token = uuid.uuid4().hex
+    now = time.time()
+    if not ACQUIRE_SCRIPT(keys=[SLOTS_KEY], args=[now - settings.PASSWORD_HASHING_LEASE,
+                                                  settings.PASSWORD_HASHING_GLOBAL_LIMIT, now, token,
+                                                  settings.PASSWORD_HASHING_LEASE]):
+        raise _throttled()
+    return token
+
+
+def run(fn, *args):
+    # hashes run in the pool's processes, request threads only wait for the result
+    if not _slots.acquire(timeout=settings.PASSWORD_HASHING_WAIT):
+        raise _throttled()
+    try:
+        token = acquire_global()
+        try:
+            executor = get_executor()
+            try:
+                return executor.submit(fn, *args).result()
+            except BrokenProcessPool:
+                _reset_executor(executor)
+                return get_executor().submit(fn, *args).result()
+        finally:
+            if token is not None:
+                r.zrem(SLOTS_KEY, token)
+    finally:
+        _slots.release()
+
+
+def _verify_password(password, encoded):
+    if not hashers.check_password(password, encoded):
+        return False, None
+    # same upgrade of outdated hashes as AbstractBaseUser.check_password does
+    if hashers.identify_hasher(encoded).must_update(encoded):
+        return True, hashers.make_password(password)
+    return True, None
+
+
+def make_password(password):
+    return run(_make_password, password)
+
+
+def set_password(user, password):
+    user.password = make_password(password)
+    user._password = password
+
+
+def check_password(user, password):
+    if password is None or not user.has_usable_password():
+        return False
+    valid, encoded = run(_verify_password, password, user.password)
+    if encoded is not None:
+        user.password = encoded
+        user.save(update_fields=['password'])
+    return valid
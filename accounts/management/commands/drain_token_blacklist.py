@@ -0,0 +1,51 @@
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.tokens import get_blacklist_key, r
+
+OUTSTANDING_TABLE = 'token_blacklist_outstandingtoken'
+BLACKLISTED_TABLE = 'token_blacklist_blacklistedtoken'
+
+
+class Command(BaseCommand):
+    help = 'Moves still valid blacklisted JWTs into redis and empties the SQL token blacklist tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--drop', action='store_true', help='Drop the tables after draining them')
+
+    def handle(self, *args, **options):
+        tables = connection.introspection.table_names()
+        if OUTSTANDING_TABLE not in tables:
+            self.stdout.write("Token blacklist tables do not exist, nothing to drain")
+            return
+        now = timezone.now()
+        moved = 0
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT o.jti, o.expires_at FROM {BLACKLISTED_TABLE} b "
+                           f"JOIN {OUTSTANDING_TABLE} o ON o.id = b.token_id WHERE o.expires_at > %s", [now])
+            while True:
+                rows = cursor.fetchmany(options['batch_size'])
+                if not rows:
+                    break
+                pipe = r.pipeline(transaction=False)
+                for jti, expires_at in rows:
+                    if isinstance(expires_at, str):
+                        expires_at = timezone.datetime.fromisoformat(expires_at)
+                    if timezone.is_naive(expires_at):
+                        expires_at = timezone.make_aware(expires_at, timezone.utc)
+                    ttl = int((expires_at - now).total_seconds())
+                    if ttl > 0:
+                        pipe.set(get_blacklist_key(jti), 1, ex=ttl)
+                        moved += 1
+                pipe.execute()
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options['drop']:
+                cursor.execute(f"DROP TABLE {BLACKLISTED_TABLE}")
+                cursor.execute(f"DROP TABLE {OUTSTANDING_TABLE}")
+                cursor.execute("DELETE FROM django_migrations WHERE app = %s", ['token_blacklist'])
+            else:
+                cursor.execute(f"DELETE FROM {BLACKLISTED_TABLE}")
+                cursor.execute(f"DELETE FROM {OUTSTANDING_TABLE}")
+        self.stdout.write(f"Moved {moved} blacklisted tokens to redis")
@@ -0,0 +1,50 @@
+from django.core.management import BaseCommand
+
+from accounts import follows
+from accounts.models import Follow
+from brand.models import Contact
+from product.models import ProductLike
+
+PATTERNS = ['user:*:followers', 'user:*:following_users', 'user:*:following_brands', 'brand:*:followers',
+            'product:*:likers']
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the redis follow and like membership sets from the Follow, Contact and ProductLike tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        r = follows.r
+        for pattern in PATTERNS:
+            cursor = 0
+            while True:
+                cursor, keys = r.scan(cursor, match=pattern, count=1000)
+                if keys:
+                    r.delete(*keys)
+                if not cursor:
+                    break
+        batch_size = options['batch_size']
+        pipe = r.pipeline(transaction=False)
+        rows = Follow.objects.filter(status=True).values_list('from_user_id', 'to_user_id')
+        for i, (from_user_id, to_user_id) in enumerate(rows.iterator(chunk_size=batch_size), 1):
+            pipe.sadd(follows.get_user_followers_key(to_user_id), from_user_id)
+            pipe.sadd(follows.get_following_users_key(from_user_id), to_user_id)
+            if i % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+        rows = Contact.objects.values_list('from_user_id', 'to_brand_id')
+        for i, (user_id, brand_id) in enumerate(rows.iterator(chunk_size=batch_size), 1):
+            pipe.sadd(follows.get_brand_followers_key(brand_id), user_id)
+            pipe.sadd(follows.get_following_brands_key(user_id), brand_id)
+            if i % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+        rows = ProductLike.objects.values_list('user_id', 'product_id')
+        for i, (user_id, product_id) in enumerate(rows.iterator(chunk_size=batch_size), 1):
+            pipe.sadd(follows.get_product_likers_key(product_id), user_id)
+            if i % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+        self.stdout.write("Follow sets rebuilt")
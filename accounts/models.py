@@ -4,11 +4,14 @@ import secrets
 
 from django.utils import timezone
 from django.contrib.auth.hashers import make_password
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import AbstractUser, UserManager
+from django.db.models.functions import Upper
 from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
 
+from other import geo
+from other.fields import ContentAddressedImageField
 from other.validators import UsernameValidator
 from other.choices import Gender
 
@@ -39,6 +42,16 @@ class CustomUserManager(UserManager):
     def normalize_username(cls, username):
         return unicodedata.normalize('NFKC', username) if isinstance(username, str) else username
 
+    def get_by_login(self, login):
+        # iexact compiles to UPPER(column), which is served by the functional indexes on User
+        login = self.normalize_username(str(login).strip())
+        if '@' in login:
+            return self.filter(email__iexact=login).order_by('pk').first()
+        if '+' in login or login.replace(' ', '').replace('-', '').isdigit():
+            strict_number = login.replace(' ', '').replace('-', '')[-9:]
+            return self.filter(phone_number=strict_number).first()
+        return self.filter(username__iexact=login).first()
+
 
 def get_avatar_upload_path(instance, filename):
     ext = filename.split('.')[-1]
@@ -65,7 +78,7 @@ class User(AbstractUser):
     email = models.EmailField(_('email address'), max_length=60, unique=True, db_index=True, blank=True, null=True)
     slug = models.SlugField(_('slug'), max_length=60, unique=True, blank=True)
     """Profile"""
-    picture = models.ImageField(_('picture'), upload_to=get_avatar_upload_path, blank=True, null=True)
+    picture = ContentAddressedImageField(_('picture'), upload_to=get_avatar_upload_path, blank=True, null=True)
     first_name = models.CharField(_('first name'), max_length=30, blank=True, null=True)
     last_name = models.CharField(_('last name'), max_length=30, blank=True, null=True)
     about_me = models.CharField(_('about me'), max_length=500, blank=True, null=True)
@@ -84,7 +97,11 @@ class User(AbstractUser):
     address = models.CharField(_('address'), max_length=200, blank=True, null=True)
     city = models.ForeignKey('other.City', on_delete=models.SET_NULL, blank=True, null=True)
     geolocation = models.CharField(_('geolocation'), max_length=24, blank=True, null=True)
-    # lat, lon = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    latitude = models.DecimalField(_('latitude'), max_digits=9, decimal_places=6, blank=True, null=True,
+                                   editable=False)
+    longitude = models.DecimalField(_('longitude'), max_digits=9, decimal_places=6, blank=True, null=True,
+                                    editable=False)
+    geocell = models.PositiveIntegerField(_('geocell'), blank=True, null=True, editable=False, db_index=True)
     """Info"""
     date_joined = models.DateTimeField(_('date joined'), default=timezone.now)
     updated_at = models.DateTimeField(_('updated'), auto_now=True)
@@ -104,9 +121,18 @@ class User(AbstractUser):
 
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(Upper('username'), name='accounts_user_username_upper'),
+            models.Index(Upper('email'), name='accounts_user_email_upper'),
+        ]
+
     def save(self, *args, **kwargs):
         self.slug = slugify(self.username.lower())
-        super().save(*args, **kwargs)
+        geo.set_coordinates(self)
+        # the picture's blob reference is counted in the same transaction as the row
+        with transaction.atomic(using=router.db_for_write(User, instance=self)):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.username
@@ -126,6 +152,10 @@ class Follow(models.Model):
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['to_user', 'status', '-created_at']),
+            models.Index(fields=['from_user', 'status', '-created_at']),
+        ]
 
     def __str__(self):
         return f"'{self.from_user}' following '{self.to_user}'"
@@ -2,6 +2,10 @@ from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 from django_redis import get_redis_connection
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
 
 from other.serializers import CitySerializer
 from other.utils import city_get, city_none_get_or_create
@@ -10,14 +14,23 @@ from other.validators import \
     MINIMUM_BIRTH_YEAR, \
     MAXIMUM_BIRTH_YEAR, \
     GeoLocationValidator, UsernameValidator, validate_email
+from accounts import hashing
 from accounts.models import User
+from accounts.tokens import RefreshToken, is_blacklisted
 from other.choices import Gender
 from brand.serializers import BrandSerializer
+from other.dynamic_serializers import DynamicFieldsModelSerializer
 
 pass_min_length = 6
 r = get_redis_connection("default")
 
 
+def get_counters(pks, strokes, prefix='user'):
+    keys = [f"{prefix}:{pk}:{stroke}" for pk in pks for stroke in strokes]
+    values = r.mget(keys) if keys else []
+    return {key: int(value) if value else 0 for key, value in zip(keys, values)}
+
+
 class PasswordField(serializers.CharField):
     def __init__(self, **kwargs):
         kwargs.setdefault('style', {})
@@ -28,20 +41,6 @@ class PasswordField(serializers.CharField):
         super().__init__(**kwargs)
 
 
-class DynamicFieldsModelSerializer(serializers.ModelSerializer):
-
-    def __init__(self, *args, **kwargs):
-        fields = kwargs.pop('fields', None)
-
-        super(DynamicFieldsModelSerializer, self).__init__(*args, **kwargs)
-
-        if fields is not None:
-            allowed = set(fields)
-            existing = set(self.fields.keys())
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
-
-
 class UserRegisterSerializer(serializers.ModelSerializer):
     username = serializers.CharField(min_length=4, max_length=30, required=True, validators=[UsernameValidator])
     phone_or_email = serializers.CharField(max_length=50, required=True)
@@ -95,7 +94,7 @@ class UserRegisterSerializer(serializers.ModelSerializer):
             user = User.objects.create(username=username, phone_number=phone_number)
         user.city = city_none_get_or_create()
         if password is not None:
-            user.set_password(password)
+            hashing.set_password(user, password)
         user.save()
         return user
 
@@ -110,7 +109,7 @@ class PasswordChangeSerializer(serializers.ModelSerializer):
         fields = ['password', 'new_password1', 'new_password2']
 
     def validate_password(self, password):
-        if not self.instance.check_password(password):
+        if not hashing.check_password(self.instance, password):
             raise serializers.ValidationError(_('Incorrect password.'))
         return password
 
@@ -128,7 +127,7 @@ class PasswordChangeSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         new_password = validated_data.get("new_password1")
-        instance.set_password(new_password)
+        hashing.set_password(instance, new_password)
         instance.save()
         return instance
 
@@ -185,8 +184,13 @@ class UserSerializer(DynamicFieldsModelSerializer):
         data = super().to_representation(instance)
         count_strokes = ['followings_count_brand', 'followings_count_user', 'followers_count', 'account_views']
         input_fields = self.context.get('fields')
+        # list views prefetch counters of the whole page with get_counters
+        counters = self.context.get('counters')
         for stroke in count_strokes:
             if input_fields is not None and stroke in input_fields:
+                if counters is not None and stroke != 'account_views':
+                    data[stroke] = counters.get(f"user:{instance.pk}:{stroke}", 0)
+                    continue
                 count = r.get(f"user:{instance.pk}:{stroke}")
                 if stroke == 'account_views':
                     count = len(r.zrange(f"user:views:{instance.pk}", 0, -1))
@@ -248,3 +252,27 @@ class UserSerializer(DynamicFieldsModelSerializer):
             instance.city = city_get(city)
         instance.save()
         return instance
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # of concurrent refreshes with one token only the first blacklists it and gets a new pair
+            if api_settings.BLACKLIST_AFTER_ROTATION and not refresh.blacklist():
+                raise TokenError(_('Token is blacklisted'))
+            refresh.set_jti()
+            refresh.set_exp()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class TokenVerifySerializer(jwt_serializers.TokenVerifySerializer):
+
+    def validate(self, attrs):
+        token = UntypedToken(attrs['token'])
+        if is_blacklisted(token[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+        return {}
@@ -1,10 +1,27 @@
 from django.db.models.signals import post_save, post_delete
 from django_redis import get_redis_connection
 
-from .models import Follow
+from other import search
+from other.models import MediaBlob
+from . import follows
+from .authentication import invalidate_user_snapshot
+from .models import Follow, User
 
 r = get_redis_connection("default")
 
+SEARCH_INDEX = 'user'
+SEARCH_FIELDS = {'username', 'first_name', 'last_name', 'is_active'}
+
+
+def index_user(user):
+    if not user.is_active:
+        search.remove_object(SEARCH_INDEX, user.pk)
+        return
+    search.index_object(SEARCH_INDEX, user.pk, [
+        (user.username, 3),
+        (f"{user.first_name or ''} {user.last_name or ''}", 2),
+    ], int(r.get(f"user:{user.pk}:followers_count") or 0))
+
 
 def followers_changed(instance, *args, **kwargs):
     if instance.status:
@@ -13,7 +30,33 @@ def followers_changed(instance, *args, **kwargs):
         followers_count = Follow.objects.filter(to_user=to_user, status=True).count()
         r.set(f"user:{from_user.pk}:followings_count_user", followings_count_user)
         r.set(f"user:{to_user.pk}:followers_count", followers_count)
+        search.set_popularity(SEARCH_INDEX, to_user.pk, followers_count)
+
+
+def follow_saved(instance, *args, **kwargs):
+    follows.set_user_follow(instance.from_user_id, instance.to_user_id, instance.status)
+    followers_changed(instance)
+
+
+def follow_deleted(instance, *args, **kwargs):
+    follows.set_user_follow(instance.from_user_id, instance.to_user_id, False)
+    followers_changed(instance)
+
+
+def user_changed(instance, update_fields=None, *args, **kwargs):
+    invalidate_user_snapshot(instance.pk)
+    # saves like update_last_login touch nothing that is indexed
+    if update_fields is None or set(update_fields) & SEARCH_FIELDS:
+        index_user(instance)
+
+
+def user_deleted(instance, *args, **kwargs):
+    MediaBlob.objects.release_on_commit(instance.picture.name, instance.picture.storage)
+    invalidate_user_snapshot(instance.pk)
+    search.remove_object(SEARCH_INDEX, instance.pk)
 
 
-post_save.connect(followers_changed, sender=Follow)
-post_delete.connect(followers_changed, sender=Follow)
+post_save.connect(follow_saved, sender=Follow)
+post_delete.connect(follow_deleted, sender=Follow)
+post_save.connect(user_changed, sender=User)
+post_delete.connect(user_deleted, sender=User)
@@ -0,0 +1,40 @@
+import time
+
+from django.utils.translation import ugettext_lazy as _
+from django_redis import get_redis_connection
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+r = get_redis_connection("default")
+
+
+def get_blacklist_key(jti):
+    return f"token:blacklist:{jti}"
+
+
+def blacklist_token(token):
+    # Entry lives exactly as long as the token could still be accepted; NX makes the check and the write
+    # one command, False means the token had already been blacklisted
+    ttl = int(token['exp'] - time.time())
+    if ttl <= 0:
+        return True
+    return bool(r.set(get_blacklist_key(token[api_settings.JTI_CLAIM]), 1, ex=ttl, nx=True))
+
+
+def is_blacklisted(jti):
+    return bool(r.exists(get_blacklist_key(jti)))
+
+
+class RefreshToken(BaseRefreshToken):
+
+    def verify(self, *args, **kwargs):
+        self.check_blacklist()
+        super().verify(*args, **kwargs)
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        return blacklist_token(self)
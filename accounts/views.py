@@ -1,30 +1,35 @@
-import random
 from itertools import chain
 
-import requests
 from django.contrib.auth import login, logout
 from django.contrib.auth.models import update_last_login
-from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+from django.db import transaction
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django_redis import get_redis_connection
 from rest_framework import exceptions, status
-from rest_framework import filters
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
 
 from accounts.models import User, Follow
 from actions.models import Action
 from actions.serializers import ActionSerializer
-from core import settings
-from other.models import RegisterSecretCode
+from brand.models import Contact
+from brand.serializers import BrandSerializer
+from other import otp, search
+from other.notifications import enqueue_email, enqueue_sms
 from other.permissions import IsAnonymous
 from other.utils import get_client_ip
 from other.validators import validate_email
-from .serializers import UserRegisterSerializer, PasswordChangeSerializer, UserSerializer, UserPasswordReset
+from . import follows, hashing
+from .authentication import get_user_row
+from .paginator import FollowListPaginator, UserSearchPaginator
+from .serializers import UserRegisterSerializer, PasswordChangeSerializer, UserSerializer, UserPasswordReset, \
+    get_counters
+from .signals import SEARCH_INDEX
+from .tokens import RefreshToken, blacklist_token
 
 # from django_filters import rest_framework as df_filters
 
@@ -51,7 +56,7 @@ class UsersActionsAPI(APIView):
         }, status=status.HTTP_200_OK)
 
 
-class UserFollowListAPI(APIView):
+class UserFollowListAPI(APIView, FollowListPaginator):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, follow):
@@ -59,21 +64,31 @@ class UserFollowListAPI(APIView):
         fields = ['uuid', 'username', 'slug', 'picture', 'first_name', 'last_name',
                   'short_bio', 'is_official', 'followers_count']
         if follow == 'followers':
-            followers = User.objects.filter(followings_user=user, rel_from_user__status=True)
-            serializer = UserSerializer(followers, fields=fields, many=True, context={"fields": fields})
-            return Response({
-                'status': True,
-                'data': serializer.data,
-                'data_length': len(serializer.data),
-            }, status=status.HTTP_200_OK)
+            relations = Follow.objects.filter(to_user=user, status=True).select_related('from_user__brand_user__brand')
+            related, count = 'from_user', r.get(f"user:{user.pk}:followers_count")
         elif follow == 'followings':
-            followings = User.objects.filter(followers=user, rel_to_user__status=True)
-            serializer = UserSerializer(followings, fields=fields, many=True, context={"fields": fields})
+            relations = Follow.objects.filter(from_user=user, status=True).select_related('to_user__brand_user__brand')
+            related, count = 'to_user', r.get(f"user:{user.pk}:followings_count_user")
+        elif follow == 'brands':
+            relations = Contact.objects.filter(from_user=user).select_related('to_brand')
+            brands = [relation.to_brand for relation in self.paginate_queryset(relations, self.request)]
+            serializer = BrandSerializer(brands, many=True, fields=['name', 'logo', 'slogan', 'suffix', 'slug'])
+            count = r.get(f"user:{user.pk}:followings_count_brand")
             return Response({
                 'status': True,
-                'data': serializer.data,
-                'data_length': len(serializer.data),
+                'data': self.get_paginated_response(serializer.data),
+                'data_length': int(count) if count else 0,
             }, status=status.HTTP_200_OK)
+        else:
+            raise exceptions.NotFound()
+        users = [getattr(relation, related) for relation in self.paginate_queryset(relations, self.request)]
+        counters = get_counters([follow_user.pk for follow_user in users], ['followers_count'])
+        serializer = UserSerializer(users, fields=fields, many=True, context={'fields': fields, 'counters': counters})
+        return Response({
+            'status': True,
+            'data': self.get_paginated_response(serializer.data),
+            'data_length': int(count) if count else 0,
+        }, status=status.HTTP_200_OK)
 
 
 class UserFollowAcceptAPI(APIView):
@@ -99,8 +114,10 @@ class UserFollowActionAPI(APIView):
         to_user = get_object_or_404(User, is_active=True, username=username)
         if from_user == to_user:
             raise exceptions.ValidationError({'detail': _('You can not follow to self :) BAD BOY!')})
+        # writes are decided by the database, the redis sets only annotate reads
+        followed = Follow.objects.filter(from_user=from_user, to_user=to_user, status=True).exists()
         if action == 'follow':
-            if Follow.objects.filter(from_user=from_user, to_user=to_user, status=True).exists():
+            if followed:
                 return Response({
                     'success': False,
                     'detail': _(f"You already following to '{to_user}'.")
@@ -123,16 +140,16 @@ class UserFollowActionAPI(APIView):
                 'detail': _(f"You following to '{to_user}'.")
             }, status=status.HTTP_200_OK)
         elif action == 'unfollow':
-            if Follow.objects.filter(from_user=from_user, to_user=to_user, status=True).exists():
-                follow = Follow.objects.get(from_user=from_user, to_user=to_user, status=True)
-                follow.delete()
+            if followed:
+                for follow in Follow.objects.filter(from_user=from_user, to_user=to_user, status=True):
+                    follow.delete()
                 return Response({
                     'success': True,
                     'detail': _(f"You unfollowed from '{to_user}'.")
                 }, status=status.HTTP_200_OK)
             elif Follow.objects.filter(from_user=from_user, to_user=to_user, status=False).exists():
-                follow = Follow.objects.get(from_user=from_user, to_user=to_user, status=False)
-                follow.delete()
+                for follow in Follow.objects.filter(from_user=from_user, to_user=to_user, status=False):
+                    follow.delete()
                 return Response({
                     'success': True,
                     'detail': _(f"Request removed from '{to_user}'.")
@@ -144,33 +161,23 @@ class UserFollowActionAPI(APIView):
         raise exceptions.ValidationError({'detail': _('Wrong action request.')})
 
 
-class UserSearchAPI(APIView):
-    class CustomSearchFilter(filters.SearchFilter):
-        search_param = 'u'
-
-        def get_search_terms(self, request):
-            params = request.query_params.get(self.search_param, '')
-            check_params = params.replace(' ', '')
-            if len(check_params) < 3:
-                raise exceptions.ValidationError({'detail': _('Minimum search character is 3.')})
-            params = params.replace('\x00', '')  # strip null characters
-            params = params.replace(',', ' ')
-            return params.split()
-
-    filter_backends = [CustomSearchFilter]
-    search_fields = ['username']
+class UserSearchAPI(APIView, UserSearchPaginator):
 
     def get(self, request):
         fields = ['uuid', 'username', 'slug', 'picture', 'first_name', 'last_name',
                   'short_bio', 'is_official', 'followers_count']
-        users = User.objects.filter(is_active=True)
-        for backend in list(self.filter_backends):
-            users = backend().filter_queryset(self.request, users, self)
-        serializer = UserSerializer(users, many=True, fields=fields)
+        query = request.query_params.get('u', '').replace(',', ' ')
+        if len(query.replace(' ', '')) < 3:
+            raise exceptions.ValidationError({'detail': _('Minimum search character is 3.')})
+        pks = self.paginate_queryset(search.search(SEARCH_INDEX, query), self.request)
+        users = User.objects.filter(pk__in=pks, is_active=True).select_related('brand_user__brand').in_bulk()
+        users = [users[pk] for pk in pks if pk in users]
+        counters = get_counters(pks, ['followers_count'])
+        serializer = UserSerializer(users, many=True, fields=fields, context={'fields': fields, 'counters': counters})
         return Response({
             'success': True,
-            'data': serializer.data,
-            'data_length': len(serializer.data),
+            'data': self.get_paginated_response(serializer.data),
+            'data_length': self.page.paginator.count,
         })
 
 
@@ -190,7 +197,7 @@ class MeDetailAPI(APIView):
         }, status=status.HTTP_200_OK)
 
     def put(self, request):
-        user = self.request.user
+        user = get_user_row(request)
         fields = ['username', 'picture', 'first_name', 'last_name',
                   'birth_date', 'address', 'city', 'gender', 'receive_sms', 'geolocation',
                   'about_me', 'short_bio', 'is_private']
@@ -209,7 +216,7 @@ class MeDetailAPI(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request):
-        user = self.request.user
+        user = get_user_row(request)
         user.delete()
         return Response({'success': True}, status=status.HTTP_204_NO_CONTENT)
 
@@ -232,6 +239,7 @@ class UserDetailAPI(APIView):
             'success': True,
             'data': serializer.data,
         }
+        data['data']['user_followed'] = follows.is_following_user(request.user, user.pk)
         return Response(data, status=status.HTTP_200_OK)
 
 
@@ -240,7 +248,7 @@ class PasswordChangeAPI(APIView):
 
     @staticmethod
     def put(request):
-        user = request.user
+        user = get_user_row(request)
         serializer = PasswordChangeSerializer(user, data=request.data)
         if serializer.is_valid():
             serializer.save()
@@ -262,6 +270,14 @@ class LogoutAPI(APIView):
         response['Authorization'] = ''
         # response.delete_cookie(key='jwt')
         # response.delete_cookie(key='rt')
+        if request.auth is not None:
+            blacklist_token(request.auth)
+        refresh = request.data.get('refresh', None)
+        if refresh:
+            try:
+                RefreshToken(refresh).blacklist()
+            except TokenError:
+                pass
         logout(request)
         return Response({
             'success': True
@@ -283,32 +299,15 @@ class LoginAPI(APIView):
         password = request.data['password']
         remember = request.data.get('remember_me', None)
 
-        email, user_name, phone_number = False, False, False
-        # Define username or email
-        if '+' in login_ or login_.isdigit():
-            phone_number = str(login_)
-        elif '@' in login_:
-            email = str(login_)
-        else:
-            user_name = str(login_)
         # Get user by username or email or phone_number
-        try:
-            if email:
-                user = User.objects.get(email__iexact=email)
-            elif phone_number:
-                strict_number = phone_number.replace(' ', '').replace('-', '')[-9:]
-                user = User.objects.get(phone_number=strict_number)
-            elif user_name:
-                user = User.objects.get(username__iexact=user_name)
-        except User.DoesNotExist:
+        user = User.objects.get_by_login(login_)
+        if user is None:
             return Response({
                 'success': False,
                 'error': 'Incorrect input credentials!'
             }, status=status.HTTP_401_UNAUTHORIZED)
-        except Exception:
-            raise exceptions.AuthenticationFailed({'detail': Exception})
         # Check user password
-        if not user.check_password(password):
+        if not hashing.check_password(user, password):
             return Response({
                 'success': False,
                 'error': 'Incorrect input credentials!'
@@ -336,20 +335,22 @@ class RegisterUserAPI(APIView):
         secret_code = request.data.get('secret_code', None)
         if not secret_code:
             raise exceptions.ValidationError({'errors': {'secret_code': _('Type secret code')}})
-        get_model = RegisterSecretCode.objects.filter(phone_or_email=phone_or_email, secret_code=secret_code,
-                                                      type='user').first()
-        if not get_model:
+        code_data = otp.verify_code(otp.REGISTER, phone_or_email, secret_code, consume=False)
+        if not code_data:
             raise exceptions.ValidationError({'errors': {'secret_code': _('Incorrect secret code')}})
-        data = {'username': get_model.username,
-                'phone_or_email': get_model.phone_or_email,
-                'password': get_model.password}
+        data = {'username': code_data['username'],
+                'phone_or_email': phone_or_email,
+                'password': code_data['password']}
         serializer = UserRegisterSerializer(data=data)
         if serializer.is_valid():
-            user = serializer.save()
+            with transaction.atomic():
+                user = serializer.save()
+                # the code is only used up by a registration that succeeded
+                if not otp.verify_code(otp.REGISTER, phone_or_email, secret_code):
+                    raise exceptions.ValidationError({'errors': {'secret_code': _('Incorrect secret code')}})
             refresh = RefreshToken.for_user(user)
             login(request, user)
             update_last_login(None, user)
-            get_model.delete()
             return Response({
                 'success': True,
                 'token': {
@@ -370,34 +371,19 @@ class ValidateSendRegister(APIView):
     def post(request):
         serializer = UserRegisterSerializer(data=request.data)
         if serializer.is_valid():
-            secret_code = str(random.random())[-6:]
             phone_or_email = serializer.data.get('phone_or_email', None)
+            secret_code = otp.issue_code(otp.REGISTER, phone_or_email,
+                                         username=serializer.data['username'],
+                                         password=request.data['password'])
             if '@' in phone_or_email:
                 subject, from_email, to = 'Код подтверждения', 'imager - Код подтверждения <imager@umail.uz>', phone_or_email
                 text_content = f'Код для подтверждения регистрации: {secret_code}'
                 html_content = f'Код для подтверждения регистрации: \n<strong>{secret_code}</strong>'
-                msg = EmailMultiAlternatives(subject, text_content, from_email, [to])
-                msg.attach_alternative(html_content, "text/html")
-                msg.send()
-                # send_mail(subject, text_content, from_email, [to])
+                enqueue_email(to, subject, text_content, html_content, from_email)
             else:
-                payload = {'mobile_phone': f"998{phone_or_email}",
-                           'message': f"#imager - Имя аккаунта: {serializer.data['username']}\n"
-                                      f'Код подтверждения:  {secret_code}',
-                           'from': '4546',
-                           'callback_url': 'https://imager.uz/sms.html'}
-                response = requests.request("POST", settings.SMS_url, headers=settings.SMS_headers, data=payload)
-                print(response.text)
-
-            get_model = RegisterSecretCode.objects.filter(phone_or_email=serializer.data['phone_or_email'])
-            if get_model:
-                for model in get_model:
-                    model.delete()
-            RegisterSecretCode.objects.create(secret_code=secret_code,
-                                              phone_or_email=serializer.data['phone_or_email'],
-                                              username=serializer.data['username'],
-                                              password=request.data['password'],
-                                              type='user')
+                enqueue_sms(phone_or_email,
+                            f"#imager - Имя аккаунта: {serializer.data['username']}\n"
+                            f'Код подтверждения:  {secret_code}')
             return Response({
                 'success': True,
                 'data': {
@@ -416,31 +402,19 @@ class ValidateResendRegister(APIView):
 
     @staticmethod
     def post(request, phone_or_email):
-        model = RegisterSecretCode.objects.filter(phone_or_email=phone_or_email).first()
-        if not model:
+        code_data = otp.get_code_data(otp.REGISTER, phone_or_email)
+        if not code_data:
             raise exceptions.ValidationError(_("Incorrect phone number or email. Try again."))
-        secret_code = str(random.random())[-6:]
+        secret_code = otp.issue_code(otp.REGISTER, phone_or_email, **code_data)
         if '@' in phone_or_email:
             subject, from_email, to = 'Код подтверждения', 'imager - Код подтверждения <imager@umail.uz>', phone_or_email
             text_content = f'Код для подтверждения регистрации: \n{secret_code}'
             html_content = f'Код для подтверждения регистрации: \n<strong>{secret_code}</strong>'
-            msg = EmailMultiAlternatives(subject, text_content, from_email, [to])
-            msg.attach_alternative(html_content, "text/html")
-            msg.send()
+            enqueue_email(to, subject, text_content, html_content, from_email)
         else:
-            payload = {'mobile_phone': f"998{phone_or_email}",
-                       'message': f'#imager - Имя аккаунта: {model.username}\n'
-                                  f'Код подтверждения:  {secret_code}',
-                       'from': '4546',
-                       'callback_url': 'https://imager.uz/sms.html'}
-            response = requests.request("POST", settings.SMS_url, headers=settings.SMS_headers, data=payload)
-            print(response.text)
-
-        RegisterSecretCode.objects.create(secret_code=secret_code,
-                                          phone_or_email=phone_or_email,
-                                          username=model.username,
-                                          password=model.password)
-        model.delete()
+            enqueue_sms(phone_or_email,
+                        f"#imager - Имя аккаунта: {code_data['username']}\n"
+                        f'Код подтверждения:  {secret_code}')
 
         return Response({
             'success': True,
@@ -481,37 +455,21 @@ class ResetPasswordValidate(APIView):
                 'success': False,
                 'error': {"not_found": _('User with that data not found')}
             }, status=status.HTTP_401_UNAUTHORIZED)
-        secret_code = str(random.random())[-6:]
+        secret_code = otp.issue_code(otp.RESET, phone_or_email, username=user.username)
         if email:
             subject, from_email, to = 'Код для восстановления пароля', 'imager - Код восстановления <imager@umail.uz>', email
             text_content = f'Код для восстановления пароля: \n{secret_code}'
             html_content = f'Код для восстановления пароля: \n<strong>{secret_code}</strong>'
-            msg = EmailMultiAlternatives(subject, text_content, from_email, [to])
-            msg.attach_alternative(html_content, "text/html")
-            msg.send()
+            enqueue_email(to, subject, text_content, html_content, from_email)
         elif phone:
-            payload = {'mobile_phone': f"998{phone}",
-                       'message': f'#imager - Имя аккаунта: {user.username}\n'
-                                  f'Код восстановления:  {secret_code}',
-                       'from': '4546',
-                       'callback_url': 'https://imager.uz/sms.html'}
-            response = requests.request("POST", settings.SMS_url, headers=settings.SMS_headers, data=payload)
-            print(response.text)
+            enqueue_sms(phone,
+                        f'#imager - Имя аккаунта: {user.username}\n'
+                        f'Код восстановления:  {secret_code}')
         else:
             return Response({
                 'success': False,
                 'error': {"error": _('Something went wrong, try again')}
             }, status=status.HTTP_401_UNAUTHORIZED)
-
-        get_model = RegisterSecretCode.objects.filter(phone_or_email=phone_or_email)
-        if get_model:
-            for model in get_model:
-                model.delete()
-
-        RegisterSecretCode.objects.create(secret_code=secret_code,
-                                          phone_or_email=phone,
-                                          username=user.username,
-                                          type='user')
         return Response({
             'success': True,
             'data': {
@@ -526,8 +484,7 @@ class PasswordResetResendRegister(APIView):
 
     @staticmethod
     def post(request, phone_or_email):
-        model = RegisterSecretCode.objects.filter(phone_or_email=phone_or_email).first()
-        if not model:
+        if not otp.get_code_data(otp.RESET, phone_or_email):
             raise exceptions.ValidationError(_("Incorrect phone number or email, try again"))
         email, phone, user = False, False, False
         if '@' in phone_or_email:
@@ -549,28 +506,17 @@ class PasswordResetResendRegister(APIView):
                 'success': False,
                 'error': {"not_found": _('User with that data not found')}
             }, status=status.HTTP_401_UNAUTHORIZED)
-        secret_code = str(random.random())[-6:]
+        secret_code = otp.issue_code(otp.RESET, phone_or_email, username=user.username)
         if email:
             subject, from_email, to = 'Код для восстановления пароля', 'imager - Код восстановления <imager@umail.uz>', email
             text_content = f'Код для восстановления пароля: \n{secret_code}'
             html_content = f'Код для восстановления пароля: \n<strong>{secret_code}</strong>'
-            msg = EmailMultiAlternatives(subject, text_content, from_email, [to])
-            msg.attach_alternative(html_content, "text/html")
-            msg.send()
+            enqueue_email(to, subject, text_content, html_content, from_email)
         elif phone:
-            payload = {'mobile_phone': f"998{phone}",
-                       'message': f'#imager - Имя аккаунта: {user.username}\n'
-                                  f'Код восстановления:  {secret_code}',
-                       'from': '4546',
-                       'callback_url': 'https://imager.uz/sms.html'}
-            response = requests.request("POST", settings.SMS_url, headers=settings.SMS_headers, data=payload)
-            print(response.text)
-
-        model.delete()
-        RegisterSecretCode.objects.create(secret_code=secret_code,
-                                          phone_or_email=phone,
-                                          username=user.username,
-                                          type='user')
+            enqueue_sms(phone,
+                        f'#imager - Имя аккаунта: {user.username}\n'
+                        f'Код восстановления:  {secret_code}')
+
         return Response({
             'success': True,
             'data': {
@@ -587,12 +533,10 @@ class ResetPasswordCode(APIView):
         secret_code = request.data.get('secret_code', None)
         if not secret_code:
             raise exceptions.ValidationError(_('Type secret code'))
-        get_model = RegisterSecretCode.objects.filter(phone_or_email=phone_or_email, secret_code=secret_code,
-                                                      type='user').first()
-        if not get_model:
+        code_data = otp.verify_code(otp.RESET, phone_or_email, secret_code)
+        if not code_data:
             raise exceptions.ValidationError(_('Incorrect secret code'))
-        user = get_object_or_404(User, username__iexact=get_model.username)
-        get_model.delete()
+        user = get_object_or_404(User, username__iexact=code_data['username'])
         return Response({
             'success': True,
             'data': {
@@ -612,8 +556,7 @@ class ResetPassword(APIView):
             raise exceptions.ValidationError(_('User not found'))
         if serializer.is_valid():
             password = request.data.get('password1')
-            print(password)
-            get_user.set_password(password)
+            hashing.set_password(get_user, password)
             get_user.save()
             return Response({
                 'success': True
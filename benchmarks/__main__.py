@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import django
+
+BUDGETS = Path(__file__).resolve().parent / 'budgets.json'
+# small enough for SQLite in a minute, fixed so query counts and budgets stay comparable between runs
+DATASET = {
+    'users': 2000,
+    'brands': 100,
+    'products': 4000,
+    'likes': 30000,
+    'ratings': 6000,
+    'follows': 15000,
+    'contacts': 4000,
+    'comments': 4000,
+    'seed': 0,
+    'end': '2024-01-01',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Measures the hot GET endpoints on a seeded dataset '
+                                                 'and fails when one goes over its budget')
+    parser.add_argument('--update', action='store_true', help='Writes the measured values as the new budgets')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed calls per endpoint, the median is kept')
+    parser.add_argument('--budgets', type=Path, default=BUDGETS)
+    options = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection
+
+    from benchmarks import runner
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    # forked workers share the sqlite file badly, postgres gets the parallel generation
+    workers = 1 if connection.vendor == 'sqlite' else None
+    call_command('generate_dataset', workers=workers or os.cpu_count(), stdout=open(os.devnull, 'w'), **DATASET)
+
+    results = runner.run(options.repeat, sys.stdout)
+    if options.update:
+        runner.save_budgets(options.budgets, runner.get_budgets(results))
+        print(f"Budgets written to {options.budgets}")
+        return 0
+    failures = runner.compare(results, runner.load_budgets(options.budgets))
+    if failures:
+        print(f"\n{len(failures)} over budget:")
+        print('\n'.join(failures))
+        return 1
+    print("\nAll endpoints within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
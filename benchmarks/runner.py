@@ -0,0 +1,157 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.db.models import Count, Q
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from brand.models import Brand
+from core import instrumentation
+from other.models import Category, Comment
+from product import bitmap
+from product.models import Product
+
+# name, path; the placeholders are filled from the fixtures picked out of the generated dataset
+ENDPOINTS = [
+    ('product_list', '/api/v1/product/list'),
+    ('product_following', '/api/v1/product/following'),
+    ('product_search_bitmap', '/api/v1/product/search?color={color}&is_sale=true'),
+    ('product_search_sql', '/api/v1/product/search?min_price=100'),
+    ('product_detail', '/api/v1/product/detail/{product}'),
+    ('product_comment_list', '/api/v1/product/comment/list/{commented_product}'),
+    ('brand_list', '/api/v1/brand/list'),
+    ('brand_search', '/api/v1/brand/search?q={brand_query}'),
+    ('brand_detail', '/api/v1/brand/detail/{brand}'),
+    ('brand_followers', '/api/v1/brand/followers/{brand}'),
+    ('user_detail', '/api/v1/user/detail/{user}'),
+    ('user_search', '/api/v1/user/search?u={user_query}'),
+    ('user_actions', '/api/v1/user/actions'),
+    ('user_followers', '/api/v1/user/follow-list/followers'),
+    ('user_followings', '/api/v1/user/follow-list/followings'),
+    ('user_brands', '/api/v1/user/follow-list/brands'),
+    ('other_categories', '/api/v1/other/categories'),
+    ('other_subcategories', '/api/v1/other/subcategories/{category}'),
+    ('other_types', '/api/v1/other/types'),
+    ('other_cities', '/api/v1/other/cities'),
+    ('other_colors', '/api/v1/other/colors'),
+]
+# measured values above their budget are regressions, time and memory budgets carry headroom for noisy machines
+METRICS = ['queries', 'redis', 'time_ms', 'memory_kb']
+
+
+def get_fixtures():
+    viewer = User.objects.annotate(count=Count('rel_from_user', distinct=True) + Count('rel_from', distinct=True)) \
+        .order_by('-count', 'pk').first()
+    user = User.objects.annotate(count=Count('rel_to_user')).order_by('-count', 'pk').first()
+    brand = Brand.objects.filter(is_active=True, status=True).annotate(count=Count('followers')) \
+        .order_by('-count', 'pk').first()
+    products = Product.objects.filter(is_active=True, status=True, brand__is_active=True, brand__status=True)
+    product = products.annotate(count=Count('liked')).order_by('-count', 'pk').first()
+    commented = products.annotate(count=Count('comments', filter=Q(comments__is_active=True))) \
+        .order_by('-count', 'pk').first()
+    color = Product.color.through.objects.values_list('color__name', flat=True) \
+        .annotate(count=Count('pk')).order_by('-count').first()
+    category = Category.objects.order_by('pk').first()
+    if None in (viewer, user, brand, product, commented, color, category) or not Comment.objects.exists():
+        raise RuntimeError("The dataset is missing users, brands, products, comments or the catalog")
+    return viewer, {
+        'user': user.username,
+        'user_query': user.username[:3],
+        'brand': brand.slug,
+        'brand_query': brand.name[:3],
+        'product': product.slug,
+        'commented_product': commented.slug,
+        'color': color,
+        'category': category.slug,
+    }
+
+
+def call(client, path):
+    instrumentation.start_request()
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(instrumentation.time_query):
+            response = client.get(path)
+    finally:
+        costs = instrumentation.finish_request()
+    elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {path} answered {response.status_code}")
+    return costs, elapsed
+
+
+def measure(client, path, repeat):
+    # the first call fills caches, so it is left out
+    call(client, path)
+    times = []
+    for _ in range(repeat):
+        costs, elapsed = call(client, path)
+        times.append(elapsed)
+    tracemalloc.start()
+    try:
+        call(client, path)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'queries': costs['db_queries'],
+        'redis': costs['redis_commands'],
+        'time_ms': round(statistics.median(times), 2),
+        'memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run(repeat, stdout):
+    instrumentation.install()
+    viewer, fixtures = get_fixtures()
+    # searches fall back to SQL until the bitmaps exist, so they are built up front like a worker does
+    bitmap.index.warm_up()
+    client = APIClient()
+    client.force_authenticate(viewer)
+    results = {}
+    for name, path in ENDPOINTS:
+        results[name] = measure(client, path.format(**fixtures), repeat)
+        stdout.write(f"{name:<24}" + ''.join(f"{metric} {results[name][metric]:<10}" for metric in METRICS) + '\n')
+    return results
+
+
+def get_budgets(results):
+    # queries and redis commands are deterministic for a seeded dataset and kept exact
+    return {
+        name: {
+            'queries': measured['queries'],
+            'redis': measured['redis'],
+            'time_ms': round(measured['time_ms'] * 3 + 20),
+            'memory_kb': round(measured['memory_kb'] * 1.5 + 256),
+        } for name, measured in results.items()
+    }
+
+
+def compare(results, budgets):
+    failures = []
+    for name, measured in results.items():
+        if name not in budgets:
+            failures.append(f"{name:<24} has no budget, run with --update to add it")
+            continue
+        for metric in METRICS:
+            budget = budgets[name].get(metric)
+            if budget is not None and measured[metric] > budget:
+                failures.append(f"{name:<24} {metric:<10} {measured[metric]} > {budget} "
+                                f"(+{round(measured[metric] - budget, 2)})")
+    for name in budgets.keys() - results.keys():
+        failures.append(f"{name:<24} is budgeted but no longer measured")
+    return failures
+
+
+def load_budgets(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_budgets(path, budgets):
+    with open(path, 'w') as file:
+        json.dump(budgets, file, indent=2, sort_keys=True)
+        file.write('\n')
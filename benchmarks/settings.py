@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+import fakeredis
+
+# the project settings read these from the environment, the benchmarks run without any of the services
+for name in ['SECRET_KEY', 'DB_NAME', 'DB_USER', 'DB_PASSWORD', 'DB_HOST', 'CLOUDINARY_NAME',
+             'CLOUDINARY_API_KEY', 'CLOUDINARY_API_SECRET', 'EMAIL_HOST', 'EMAIL_PORT', 'EMAIL_HOST_USER',
+             'EMAIL_HOST_PASSWORD', 'G_REDIS_HOST', 'G_REDIS_PORT', 'G_REDIS_DB', 'SMS_URL', 'SMS_BEARER']:
+    os.environ.setdefault(name, 'benchmark')
+os.environ.setdefault('REDIS_LOCATION', 'redis://localhost:6379/0')
+os.environ.setdefault('ALLOWED_HOSTS', '*')
+os.environ.setdefault('CORS_ALLOWED_ORIGINS', 'http://localhost')
+os.environ.setdefault('SENTRY_DSN', '')
+
+from core.settings import *  # noqa: E402
+
+DEBUG = False
+WORK_DIR = tempfile.mkdtemp(prefix='imager-benchmarks-')
+
+# SQLite by default, a local postgres through BENCHMARK_DATABASE_URL
+DATABASES = {
+    'default': env.db('BENCHMARK_DATABASE_URL', default=f"sqlite:///{WORK_DIR}/db.sqlite3"),
+}
+# tables are created straight from the models
+MIGRATION_MODULES = {app.split('.')[0]: None for app in LOCAL_APPS}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://localhost:6379/0',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'REDIS_CLIENT_CLASS': 'core.instrumentation.InstrumentedRedis',
+            'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeConnection, 'server': fakeredis.FakeServer()},
+        }
+    }
+}
+
+DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+MEDIA_ROOT = f"{WORK_DIR}/media"
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# the runner measures every call itself, and core.metrics reads core.settings rather than these overrides
+MIDDLEWARE = [name for name in MIDDLEWARE if name != 'core.metrics.MetricsMiddleware']
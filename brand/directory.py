@@ -0,0 +1,106 @@
+import json
+
+from django_redis import get_redis_connection
+
+from core import settings
+
+r = get_redis_connection("default")
+
+NEWEST = 'newest'
+FOLLOWERS = 'followers'
+VERIFIED = 'verified'
+SORTS = [NEWEST, FOLLOWERS, VERIFIED]
+
+VERSION_KEY = 'brands:directory:version'
+# verified brands are ranked above every unverified one, then by followers
+VERIFIED_WEIGHT = 10 ** 12
+
+
+def get_sort_key(sort):
+    return f"brands:directory:{sort}"
+
+
+def get_page_key(version, sort, page, page_size):
+    return f"brands:directory:{version}:{sort}:{page}:{page_size}"
+
+
+def is_listed(brand):
+    return brand.is_active and brand.status
+
+
+def get_scores(brand, followers_count):
+    return {
+        NEWEST: brand.created_at.timestamp(),
+        FOLLOWERS: followers_count,
+        VERIFIED: VERIFIED_WEIGHT * int(brand.verified) + followers_count,
+    }
+
+
+def update_brand(brand, pipe=None):
+    execute = pipe is None
+    if execute:
+        pipe = r.pipeline()
+    if is_listed(brand):
+        followers_count = int(r.get(f"brand:{brand.pk}:followers_count") or 0)
+        for sort, score in get_scores(brand, followers_count).items():
+            pipe.zadd(get_sort_key(sort), {brand.pk: score})
+    else:
+        for sort in SORTS:
+            pipe.zrem(get_sort_key(sort), brand.pk)
+    pipe.incr(VERSION_KEY)
+    if execute:
+        pipe.execute()
+
+
+def remove_brand(brand_id):
+    pipe = r.pipeline()
+    for sort in SORTS:
+        pipe.zrem(get_sort_key(sort), brand_id)
+    pipe.incr(VERSION_KEY)
+    pipe.execute()
+
+
+def update_followers(brand_id, followers_count):
+    # follows only move the sorted sets, cached pages catch up when they expire
+    if r.zscore(get_sort_key(NEWEST), brand_id) is None:
+        return
+    verified = r.zscore(get_sort_key(VERIFIED), brand_id) >= VERIFIED_WEIGHT
+    pipe = r.pipeline()
+    pipe.zadd(get_sort_key(FOLLOWERS), {brand_id: followers_count})
+    pipe.zadd(get_sort_key(VERIFIED), {brand_id: VERIFIED_WEIGHT * int(verified) + followers_count})
+    pipe.execute()
+
+
+def get_version():
+    return int(r.get(VERSION_KEY) or 0)
+
+
+def get_cached_page(version, sort, page, page_size):
+    data = r.get(get_page_key(version, sort, page, page_size))
+    return json.loads(data) if data is not None else None
+
+
+def set_cached_page(version, sort, page, page_size, data):
+    r.set(get_page_key(version, sort, page, page_size), json.dumps(data), ex=settings.BRAND_DIRECTORY_CACHE_TTL)
+
+
+# brand ids of a directory sorted set, sliced straight from redis by the paginator
+class SortedSetSequence:
+
+    def __init__(self, sort):
+        self.key = get_sort_key(sort)
+
+    def __len__(self):
+        return r.zcard(self.key)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError('Only slices without step are supported')
+        start = item.start or 0
+        if item.stop is None:
+            stop = -1
+        elif item.stop <= start:
+            return []
+        else:
+            stop = item.stop - 1
+        return [int(pk) for pk in r.zrevrange(self.key, start, stop)]
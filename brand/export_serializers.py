@@ -1,20 +1,5 @@
-from rest_framework import serializers
-
 from brand.models import Brand
-
-
-class DynamicFieldsModelSerializer(serializers.ModelSerializer):
-
-    def __init__(self, *args, **kwargs):
-        fields = kwargs.pop('fields', None)
-
-        super(DynamicFieldsModelSerializer, self).__init__(*args, **kwargs)
-
-        if fields is not None:
-            allowed = set(fields)
-            existing = set(self.fields.keys())
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
+from other.dynamic_serializers import DynamicFieldsModelSerializer
 
 
 class BrandExportSerializer(DynamicFieldsModelSerializer):
@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from brand import directory
+from brand.models import Brand
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the redis sorted sets behind the brand directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        directory.r.delete(*[directory.get_sort_key(sort) for sort in directory.SORTS])
+        listed = 0
+        pipe = directory.r.pipeline(transaction=False)
+        for brand in Brand.objects.filter(is_active=True, status=True).iterator(chunk_size=options['batch_size']):
+            directory.update_brand(brand, pipe)
+            listed += 1
+            if listed % options['batch_size'] == 0:
+                pipe.execute()
+        pipe.execute()
+        self.stdout.write(f"Listed {listed} brands in the directory")
@@ -4,9 +4,10 @@ import uuid
 from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, router, transaction
 
-from other.fields import OrderField
+from other import geo
+from other.fields import OrderField, OrderedQuerySet, ContentAddressedImageField, ContentAddressedFileField
 from other.validators import UsernameValidator, NameValidator, TitleValidator, PhoneNumberValidator
 
 
@@ -33,8 +34,8 @@ class Brand(models.Model):
     rating = models.PositiveIntegerField(_('rating'), default=0, blank=True)
     delivery = models.BooleanField(_('delivery'), default=False)
     """File upload"""
-    logo = models.ImageField(_('logo'), upload_to=get_upload_path, blank=True, null=True)
-    poster = models.FileField(_('poster'), upload_to=get_upload_path, blank=True, null=True)
+    logo = ContentAddressedImageField(_('logo'), upload_to=get_upload_path, blank=True, null=True)
+    poster = ContentAddressedFileField(_('poster'), upload_to=get_upload_path, blank=True, null=True)
     advert = models.FileField(_('advertisement'), upload_to=get_upload_path, blank=True, null=True)
     """Parameters"""
     is_active = models.BooleanField(_('active'), default=True)
@@ -44,6 +45,11 @@ class Brand(models.Model):
     address = models.CharField(_('address'), max_length=200, blank=True, null=True)
     cities = models.ManyToManyField("other.City", blank=True)
     geolocation = models.CharField(_('geolocation'), max_length=100, blank=True, null=True)
+    latitude = models.DecimalField(_('latitude'), max_digits=9, decimal_places=6, blank=True, null=True,
+                                   editable=False)
+    longitude = models.DecimalField(_('longitude'), max_digits=9, decimal_places=6, blank=True, null=True,
+                                    editable=False)
+    geocell = models.PositiveIntegerField(_('geocell'), blank=True, null=True, editable=False, db_index=True)
     """Info"""
     created_at = models.DateTimeField(_('created date'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated date'), auto_now=True)
@@ -56,7 +62,10 @@ class Brand(models.Model):
     def save(self, *args, **kwargs):
         self.suffix = self.suffix.lower()
         self.slug = slugify(self.suffix, allow_unicode=True)
-        super().save(*args, **kwargs)
+        geo.set_coordinates(self)
+        # logo and poster blob references are counted in the same transaction as the row
+        with transaction.atomic(using=router.db_for_write(Brand, instance=self)):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -109,6 +118,10 @@ class Contact(models.Model):
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['to_brand', '-created_at']),
+            models.Index(fields=['from_user', '-created_at']),
+        ]
 
     def __str__(self):
         return f'{self.from_user} following {self.to_brand}'
@@ -123,6 +136,8 @@ class OwnCategory(models.Model):
     order = OrderField(blank=True, for_fields=['brand'], start=1)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = OrderedQuerySet.as_manager()
+
     class Meta:
         ordering = ('order',)
         verbose_name = 'Own Category'
@@ -131,10 +146,14 @@ class OwnCategory(models.Model):
     def __str__(self):
         return f"'{self.brand}' category: '{self.name}'"
 
-    def save(self, *args, **kwargs):
+    def prepare_save(self):
         self.name = self.name.title()
         self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.prepare_save()
+        with transaction.atomic(using=router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
 
 
 class BrandUserRequest(models.Model):
@@ -0,0 +1,21 @@
+from collections import OrderedDict
+
+from rest_framework.pagination import PageNumberPagination
+
+
+class BrandListPaginator(PageNumberPagination):
+    page_query_param = 'p'
+    page_size = 20
+    max_page_size = 30
+
+    def get_paginated_response(self, data):
+        return OrderedDict([
+            ('count', self.page.paginator.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+
+class BrandSearchPaginator(BrandListPaginator):
+    pass
@@ -9,24 +9,11 @@ from other.validators import PhoneNumberValidator, GeoLocationValidator, Usernam
 from other.serializers import CitySerializer
 
 from accounts.export_serializers import UserSerializer
+from other.dynamic_serializers import DynamicFieldsModelSerializer
 
 r = get_redis_connection("default")
 
 
-class DynamicFieldsModelSerializer(serializers.ModelSerializer):
-
-    def __init__(self, *args, **kwargs):
-        fields = kwargs.pop('fields', None)
-
-        super(DynamicFieldsModelSerializer, self).__init__(*args, **kwargs)
-
-        if fields is not None:
-            allowed = set(fields)
-            existing = set(self.fields.keys())
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
-
-
 class BrandContactSerializer(DynamicFieldsModelSerializer):
     contact = serializers.CharField(min_length=9, max_length=20, validators=[PhoneNumberValidator], required=False)
 
@@ -133,18 +120,16 @@ class BrandSerializer(DynamicFieldsModelSerializer):
     status = serializers.BooleanField(default=True, required=False)
     """Relations"""
     owner = UserSerializer(read_only=True, fields=['username', 'picture', 'first_name', 'last_name', 'slug'])
-    followers = UserSerializer(read_only=True, many=True,
-                               fields=['username', 'picture', 'first_name', 'last_name', 'slug'])
 
     class Meta:
         model = Brand
-        fields = '__all__'
+        # followers are served paginated by BrandFollowersListAPI
+        exclude = ['followers']
         extra_kwargs = {
             'id': {'read_only': True},
             'uuid': {'read_only': True},
             'is_active': {'read_only': True},
             'rating': {'read_only': True},
-            'followers': {'read_only': True},
             'created_at': {'read_only': True, 'format': '%Y-%m-%d'},
             'updated_at': {'read_only': True, 'format': '%Y-%m-%d'},
         }
@@ -153,8 +138,13 @@ class BrandSerializer(DynamicFieldsModelSerializer):
         instance_data = super().to_representation(instance)
         context = self.context.get('fields')
         if context and 'followers_count' in context:
-            data = r.get(f"brand:{instance.pk}:followers_count")
-            instance_data['followers_count'] = int(data) if data else 0
+            # list views prefetch counters of the whole page with get_counters
+            counters = self.context.get('counters')
+            if counters is not None:
+                instance_data['followers_count'] = counters.get(f"brand:{instance.pk}:followers_count", 0)
+            else:
+                data = r.get(f"brand:{instance.pk}:followers_count")
+                instance_data['followers_count'] = int(data) if data else 0
         return instance_data
 
     def validate_name(self, name):
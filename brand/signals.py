@@ -1,10 +1,30 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django_redis import get_redis_connection
 
-from .models import Contact
+from accounts import follows
+from accounts.authentication import invalidate_user_snapshot
+from other import search
+from product import bitmap, ranking
+from other.models import MediaBlob
+from . import directory
+from .models import Contact, Brand, BrandUser
 
 r = get_redis_connection("default")
 
+SEARCH_INDEX = 'brand'
+
+
+def index_brand(brand):
+    if not brand.is_active:
+        search.remove_object(SEARCH_INDEX, brand.pk)
+        return
+    search.index_object(SEARCH_INDEX, brand.pk, [
+        (brand.name, 3),
+        (brand.suffix, 3),
+        (brand.slogan, 1),
+    ], int(r.get(f"brand:{brand.pk}:followers_count") or 0))
+
 
 def followers_changed(instance, *args, **kwargs):
     from_user, to_brand = instance.from_user, instance.to_brand
@@ -12,7 +32,51 @@ def followers_changed(instance, *args, **kwargs):
     followers_count = Contact.objects.filter(to_brand=to_brand).count()
     r.set(f"user:{from_user.pk}:followings_count_brand", followings_count_brand)
     r.set(f"brand:{to_brand.pk}:followers_count", followers_count)
+    directory.update_followers(to_brand.pk, followers_count)
+    search.set_popularity(SEARCH_INDEX, to_brand.pk, followers_count)
+
+
+def contact_saved(instance, *args, **kwargs):
+    follows.set_brand_follow(instance.from_user_id, instance.to_brand_id, True)
+    ranking.invalidate_feed(instance.from_user_id)
+    followers_changed(instance)
+
+
+def contact_deleted(instance, *args, **kwargs):
+    follows.set_brand_follow(instance.from_user_id, instance.to_brand_id, False)
+    ranking.invalidate_feed(instance.from_user_id)
+    followers_changed(instance)
+
+
+def brand_user_changed(instance, *args, **kwargs):
+    invalidate_user_snapshot(instance.user_id)
+
+
+def brand_changed(instance, *args, **kwargs):
+    index_brand(instance)
+    directory.update_brand(instance)
+    brand_id = instance.pk
+    transaction.on_commit(lambda: bitmap.publish('brand', brand_id))
+
+
+def brand_cities_changed(instance, action, reverse, pk_set, *args, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    for brand_id in (pk_set if reverse else [instance.pk]) or ():
+        transaction.on_commit(lambda brand_id=brand_id: bitmap.publish('brand', brand_id))
+
+
+def brand_deleted(instance, *args, **kwargs):
+    MediaBlob.objects.release_on_commit(instance.logo.name, instance.logo.storage)
+    MediaBlob.objects.release_on_commit(instance.poster.name, instance.poster.storage)
+    search.remove_object(SEARCH_INDEX, instance.pk)
+    directory.remove_brand(instance.pk)
 
 
-post_save.connect(followers_changed, sender=Contact)
-post_delete.connect(followers_changed, sender=Contact)
+post_save.connect(contact_saved, sender=Contact)
+post_delete.connect(contact_deleted, sender=Contact)
+post_save.connect(brand_changed, sender=Brand)
+post_delete.connect(brand_deleted, sender=Brand)
+m2m_changed.connect(brand_cities_changed, sender=Brand.cities.through)
+post_save.connect(brand_user_changed, sender=BrandUser)
+post_delete.connect(brand_user_changed, sender=BrandUser)
@@ -9,9 +9,12 @@ urlpatterns = [
     path('mybrand', views.MyBrandAPI.as_view(), name='brand_mybrand'),
     path('list', views.BrandListAPI.as_view(), name='brand_list'),
     path('search', views.BrandSearchListAPI.as_view(), name='brand_search_list'),
+    path('nearby', views.BrandNearbyListAPI.as_view(), name='brand_nearby_list'),
     path('contact/<str:contact>', views.BrandContactDetailAPI.as_view(), name='brand_contact_remove'),
     path('detail/<str:brand_slug>', views.BrandDetailAPI.as_view(), name='brand_detail'),
     path('follow/<str:brand_slug>/<str:action>', views.UserFollowingAPI.as_view(), name='brand_follow'),
+    path('followers/<str:brand_slug>', views.BrandFollowersListAPI.as_view(), name='brand_followers'),
+    path('friends-followed/<str:brand_slug>', views.BrandFriendsFollowedAPI.as_view(), name='brand_friends_followed'),
     path('member/list/<str:brand_slug>', views.BrandMembersListAPI.as_view(), name='brand_member_list'),
     path('member/detail/<str:brand_slug>/<str:member>', views.BrandMemberDetailAPI.as_view(), name='brand_member_detail'),
     path('member/set-owner/<str:brand_slug>/<str:member>', views.BrandSetOwnerAPI.as_view(), name='brand_set_owner'),
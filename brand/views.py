@@ -1,19 +1,23 @@
-import random
-import requests
-
-from core import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db import transaction
 from django.utils.translation import ugettext_lazy as _
+from django_redis import get_redis_connection
 from rest_framework import exceptions, status
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from accounts import follows
+from accounts.paginator import FollowListPaginator
+from accounts.serializers import UserSerializer, get_counters
+from core import settings
 from core.settings import MAXIMUM_BRAND_CATEGORIES
-from other.models import RegisterSecretCode
+from other import geo, otp, search
+from other.notifications import enqueue_sms
+from . import directory
 from .models import Brand, BrandUser, Contact, OwnCategory, BrandCustomerContacts
+from .paginator import BrandListPaginator, BrandSearchPaginator
 from .serializers import \
     BrandRegisterSerializer, \
     BrandSerializer, \
@@ -21,38 +25,84 @@ from .serializers import \
     BrandUserCreateSerializer, \
     OwnCategoryCreateSerializer, \
     OwnCategorySerializer, BrandContactSerializer
+from .signals import SEARCH_INDEX
 
+r = get_redis_connection("default")
 
-class BrandSearchListAPI(APIView):
 
-    @staticmethod
-    def get(request):
+class BrandSearchListAPI(APIView, BrandSearchPaginator):
+
+    def get(self, request):
         fields = ['name', 'suffix', 'logo', 'rating', 'slug', 'slogan', 'followers_count']
-        if not request.query_params or len(request.query_params.get('q')) <= 2:
+        query = request.query_params.get('q', '')
+        if len(query.strip()) <= 2:
             raise exceptions.NotFound()
-        query = request.query_params.get('q')
-        brands = Brand.objects.filter(
-            Q(is_active=True) |
-            Q(name__icontains=query) |
-            Q(suffix__icontains=query) |
-            Q(slogan__icontains=query))
-        serializer = BrandSerializer(brands, many=True, fields=fields, context={'fields': fields})
+        pks = self.paginate_queryset(search.search(SEARCH_INDEX, query), self.request)
+        brands = Brand.objects.filter(pk__in=pks, is_active=True).in_bulk()
+        brands = [brands[pk] for pk in pks if pk in brands]
+        counters = get_counters(pks, ['followers_count'], prefix='brand')
+        serializer = BrandSerializer(brands, many=True, fields=fields, context={'fields': fields, 'counters': counters})
+        data = serializer.data
+        for item, followed in zip(data, follows.following_brands(request.user, [brand.pk for brand in brands])):
+            item['user_followed'] = followed
         return Response({
             'success': True,
-            'data': serializer.data
+            'data': self.get_paginated_response(data),
         }, status=status.HTTP_200_OK)
 
 
-class BrandListAPI(APIView):
+class BrandListAPI(APIView, BrandListPaginator):
 
-    @staticmethod
-    def get(request):
-        brand = Brand.objects.filter(is_active=True, status=True)
+    def get(self, request):
         fields = ['name', 'suffix', 'slug', 'logo', 'rating', 'slogan', 'verified', 'followers_count']
-        serializer = BrandSerializer(brand, many=True, fields=fields, context={'fields': fields})
+        sort = request.query_params.get('s', directory.NEWEST)
+        if sort not in directory.SORTS:
+            raise exceptions.ValidationError({'detail': _('Unknown sort option.')})
+        page_number = request.query_params.get(self.page_query_param, 1)
+        page_size = self.get_page_size(request)
+        version = directory.get_version()
+        cached = directory.get_cached_page(version, sort, page_number, page_size)
+        if cached is None:
+            pks = self.paginate_queryset(directory.SortedSetSequence(sort), self.request)
+            brands = Brand.objects.filter(pk__in=pks).in_bulk()
+            brands = [brands[pk] for pk in pks if pk in brands]
+            counters = get_counters(pks, ['followers_count'], prefix='brand')
+            serializer = BrandSerializer(brands, many=True, fields=fields,
+                                         context={'fields': fields, 'counters': counters})
+            # ids stay next to the shared page, user_followed is added per request
+            cached = {'ids': [brand.pk for brand in brands], 'page': self.get_paginated_response(serializer.data)}
+            directory.set_cached_page(version, sort, page_number, page_size, cached)
+        data = cached['page']
+        for item, followed in zip(data['results'], follows.following_brands(request.user, cached['ids'])):
+            item['user_followed'] = followed
         return Response({
             'success': True,
-            'data': serializer.data
+            'data': data
+        }, status=status.HTTP_200_OK)
+
+
+class BrandNearbyListAPI(APIView, BrandListPaginator):
+
+    def get(self, request):
+        fields = ['name', 'suffix', 'slug', 'logo', 'rating', 'slogan', 'verified', 'address', 'geolocation',
+                  'followers_count']
+        point, radius = geo.get_point(request), geo.get_radius(request)
+        if point is None or radius is None:
+            raise exceptions.ValidationError({'detail': _("Wrong location input. Example: '?lat=42.123456&lon=60.654321'")})
+        nearest = geo.nearest(Brand.objects.filter(is_active=True, status=True), *point, radius,
+                              settings.NEARBY_MAX_RESULTS)
+        page = self.paginate_queryset(nearest, self.request)
+        brands = Brand.objects.filter(pk__in=[pk for pk, distance in page]).in_bulk()
+        page = [(brands[pk], distance) for pk, distance in page if pk in brands]
+        counters = get_counters([brand.pk for brand, distance in page], ['followers_count'], prefix='brand')
+        serializer = BrandSerializer([brand for brand, distance in page], many=True, fields=fields,
+                                     context={'fields': fields, 'counters': counters})
+        data = serializer.data
+        for item, (brand, distance) in zip(data, page):
+            item['distance'] = distance
+        return Response({
+            'success': True,
+            'data': self.get_paginated_response(data),
         }, status=status.HTTP_200_OK)
 
 
@@ -67,7 +117,8 @@ class BrandDetailAPI(APIView):
                   'cities', 'delivery', 'geolocation']
         serializer = BrandSerializer(brand, fields=fields, context={'fields': fields})
         data = serializer.data
-        data['user_followed'] = True if user in brand.followers.all() else False
+        data['user_followed'] = follows.is_following_brand(user, brand.pk)
+        data['friends_followed_count'] = len(follows.get_friends(user, follows.get_brand_followers_key(brand.pk)))
         return Response({
             'success': True,
             'data': data
@@ -80,7 +131,7 @@ class BrandContactDetailAPI(APIView):
     def delete(self, request, contact):
         user = self.request.user
         try:
-            brand_pk = user.brand_user.brand.pk
+            brand_pk = user.brand_user.brand_id
         except:
             raise exceptions.NotFound()
         brand = get_object_or_404(Brand, is_active=True, pk=brand_pk)
@@ -98,17 +149,19 @@ class BrandRegisterAPI(APIView):
         secret_code = request.data.get('secret_code', None)
         if not secret_code:
             raise exceptions.ValidationError({'errors': {'secret_code': _('Type secret code')}})
-        get_model = RegisterSecretCode.objects.filter(phone_or_email=phone_number, type='brand',
-                                                      secret_code=secret_code).first()
-        if not get_model:
+        code_data = otp.verify_code(otp.BRAND, phone_number, secret_code, consume=False)
+        if not code_data:
             raise exceptions.ValidationError({'errors': {'secret_code': _('Incorrect secret code')}})
-        data = {'name': get_model.title,
-                'phone_number': get_model.phone_or_email}
+        data = {'name': code_data['title'],
+                'phone_number': phone_number}
         fields = ['name', 'phone_number']
         serializer = BrandRegisterSerializer(data=data, fields=fields)
         if serializer.is_valid():
-            serializer.save(owner=self.request.user)
-            get_model.delete()
+            with transaction.atomic():
+                serializer.save(owner=self.request.user)
+                # the code is only used up by a registration that succeeded
+                if not otp.verify_code(otp.BRAND, phone_number, secret_code):
+                    raise exceptions.ValidationError({'errors': {'secret_code': _('Incorrect secret code')}})
             return Response({
                 'success': True,
                 'data': serializer.data
@@ -135,23 +188,10 @@ class ValidateBrandRegisterAPI(APIView):
             serializer = BrandRegisterSerializer(data=request.data, fields=fields)
             if serializer.is_valid():
                 phone_number = serializer.data.get('phone_number')
-                secret_code = str(random.random())[-6:]
-                payload = {'mobile_phone': f"998{phone_number}",
-                           'message': f"#imager - Имя бренда: {serializer.data['name']}\n"
-                                      f'Код для регистрации бренда:  {secret_code}',
-                           'from': '4546',
-                           'callback_url': 'https://imager.uz/sms.html'}
-                response = requests.request("POST", settings.SMS_url, headers=settings.SMS_headers, data=payload)
-                print(response.text)
-
-                get_model = RegisterSecretCode.objects.filter(phone_or_email=phone_number)
-                if get_model:
-                    for model in get_model:
-                        model.delete()
-                RegisterSecretCode.objects.create(secret_code=secret_code,
-                                                  phone_or_email=phone_number,
-                                                  title=serializer.data['name'],
-                                                  type='brand')
+                secret_code = otp.issue_code(otp.BRAND, phone_number, title=serializer.data['name'])
+                enqueue_sms(phone_number,
+                            f"#imager - Имя бренда: {serializer.data['name']}\n"
+                            f'Код для регистрации бренда:  {secret_code}')
                 return Response({
                     'success': True,
                     'data': {
@@ -172,24 +212,14 @@ class ValidateResendBrandRegisterAPI(APIView):
 
     @staticmethod
     def post(request, phone_number):
-        model = RegisterSecretCode.objects.filter(phone_or_email=phone_number, type='brand').first()
-        if not model:
+        code_data = otp.get_code_data(otp.BRAND, phone_number)
+        if not code_data:
             raise exceptions.ValidationError(_('Incorrect phone number. Try again'))
-        phone_number = model.phone_or_email
-        secret_code = str(random.random())[-6:]
-        payload = {'mobile_phone': f"998{phone_number}",
-                   'message': f"#imager - Имя бренда: {model.title}\n"
-                              f'Код для регистрации бренда:  {secret_code}',
-                   'from': '4546',
-                   'callback_url': 'https://imager.uz/sms.html'}
-        response = requests.request("POST", settings.SMS_url, headers=settings.SMS_headers, data=payload)
-        print(response.text)
-
-        RegisterSecretCode.objects.create(secret_code=secret_code,
-                                          phone_or_email=phone_number,
-                                          title=model.title,
-                                          type='brand')
-        model.delete()
+        secret_code = otp.issue_code(otp.BRAND, phone_number, **code_data)
+        enqueue_sms(phone_number,
+                    f"#imager - Имя бренда: {code_data['title']}\n"
+                    f'Код для регистрации бренда:  {secret_code}')
+
         return Response({
             'success': True,
             'data': {
@@ -205,7 +235,7 @@ class MyBrandAPI(APIView):
     def get(self, request):
         user = self.request.user
         try:
-            brand_pk = user.brand_user.brand.pk
+            brand_pk = user.brand_user.brand_id
         except Exception:
             raise exceptions.NotFound()
         brand = get_object_or_404(Brand, is_active=True, pk=brand_pk)
@@ -225,7 +255,7 @@ class MyBrandAPI(APIView):
     def put(self, request):
         user = self.request.user
         try:
-            brand_pk = user.brand_user.brand.pk
+            brand_pk = user.brand_user.brand_id
         except Exception:
             raise exceptions.NotFound()
         brand = get_object_or_404(Brand, is_active=True, pk=brand_pk)
@@ -285,17 +315,57 @@ class UserFollowingAPI(APIView):
     def post(self, request, brand_slug, action):
         brand = get_object_or_404(Brand, is_active=True, status=True, slug=brand_slug)
         user = self.request.user
-        if user not in brand.followers.all() and action == 'follow':
+        # writes are decided by the database, the redis sets only annotate reads
+        followed = Contact.objects.filter(from_user=user, to_brand=brand).exists()
+        if not followed and action == 'follow':
             Contact.objects.create(from_user=user, to_brand=brand)
             return Response({'success': True}, status=status.HTTP_200_OK)
-        elif user in brand.followers.all() and action == 'unfollow':
-            follow = Contact.objects.get(from_user=user, to_brand=brand)
-            follow.delete()
+        elif followed and action == 'unfollow':
+            for follow in Contact.objects.filter(from_user=user, to_brand=brand):
+                follow.delete()
             return Response({'success': True}, status=status.HTTP_204_NO_CONTENT)
         else:
             raise exceptions.ValidationError({'detail': _('You already followed or unfollowed.')})
 
 
+class BrandFollowersListAPI(APIView, FollowListPaginator):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, brand_slug):
+        brand = get_object_or_404(Brand, is_active=True, slug=brand_slug)
+        fields = ['uuid', 'username', 'slug', 'picture', 'first_name', 'last_name',
+                  'short_bio', 'is_official', 'followers_count']
+        relations = Contact.objects.filter(to_brand=brand).select_related('from_user__brand_user__brand')
+        users = [relation.from_user for relation in self.paginate_queryset(relations, self.request)]
+        counters = get_counters([user.pk for user in users], ['followers_count'])
+        serializer = UserSerializer(users, fields=fields, many=True, context={'fields': fields, 'counters': counters})
+        count = r.get(f"brand:{brand.pk}:followers_count")
+        return Response({
+            'success': True,
+            'data': self.get_paginated_response(serializer.data),
+            'data_length': int(count) if count else 0,
+        }, status=status.HTTP_200_OK)
+
+
+class BrandFriendsFollowedAPI(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, brand_slug):
+        brand = get_object_or_404(Brand, is_active=True, status=True, slug=brand_slug)
+        fields = ['uuid', 'username', 'slug', 'picture', 'first_name', 'last_name',
+                  'short_bio', 'is_official', 'followers_count']
+        pks = follows.get_friends(request.user, follows.get_brand_followers_key(brand.pk))
+        users = get_user_model().objects.filter(pk__in=pks[:settings.SOCIAL_PROOF_MAX_USERS], is_active=True) \
+            .select_related('brand_user__brand').order_by('pk')
+        counters = get_counters([user.pk for user in users], ['followers_count'])
+        serializer = UserSerializer(users, many=True, fields=fields, context={'fields': fields, 'counters': counters})
+        return Response({
+            'success': True,
+            'data': serializer.data,
+            'data_length': len(pks),
+        }, status=status.HTTP_200_OK)
+
+
 class BrandMembersListAPI(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -303,7 +373,7 @@ class BrandMembersListAPI(APIView):
         brand = get_object_or_404(Brand, is_active=True, slug=brand_slug)
         user = self.request.user
         try:
-            if brand == user.brand_user.brand and user.brand_user.is_manager:
+            if brand.pk == user.brand_user.brand_id and user.brand_user.is_manager:
                 brand_members = brand.brand_user.all()
                 fields = ['user', 'is_manager']
                 serializer = BrandUserSerializer(brand_members, many=True, fields=fields)
@@ -319,7 +389,7 @@ class BrandMembersListAPI(APIView):
         brand = get_object_or_404(Brand, is_active=True, slug=brand_slug)
         user = self.request.user
         try:
-            if brand == user.brand_user.brand and user.brand_user.is_manager:
+            if brand.pk == user.brand_user.brand_id and user.brand_user.is_manager:
                 serializer = BrandUserCreateSerializer(data=request.data)
                 username = request.data.get('user')
                 member_user = get_object_or_404(get_user_model(), is_active=True, username__iexact=username)
@@ -352,7 +422,7 @@ class BrandMemberDetailAPI(APIView):
         brand = get_object_or_404(Brand, is_active=True, slug=brand_slug)
         user = self.request.user
         try:
-            if brand == user.brand_user.brand and user.brand_user.is_manager:
+            if brand.pk == user.brand_user.brand_id and user.brand_user.is_manager:
                 brand_member = get_object_or_404(BrandUser, user__username__iexact=member, brand=brand)
                 fields = ['user', 'is_manager']
                 serializer = BrandUserSerializer(brand_member, fields=fields)
@@ -390,10 +460,10 @@ class BrandMemberDetailAPI(APIView):
             if brand.owner == user and not brand_member.user == user:
                 brand_member.delete()
                 return Response({'success': True}, status=status.HTTP_204_NO_CONTENT)
-            elif brand == user.brand_user.brand and user.brand_user.is_manager and not brand_member.is_manager:
+            elif brand.pk == user.brand_user.brand_id and user.brand_user.is_manager and not brand_member.is_manager:
                 brand_member.delete()
                 return Response({'success': True}, status=status.HTTP_204_NO_CONTENT)
-            elif brand == user.brand_user.brand and user.brand_user.is_manager and brand_member.user == user and \
+            elif brand.pk == user.brand_user.brand_id and user.brand_user.is_manager and brand_member.user == user and \
                     not brand.owner == user:
                 brand_member.delete()
                 return Response({'success': True}, status=status.HTTP_204_NO_CONTENT)
@@ -429,7 +499,7 @@ class OwnCategoryListAPI(APIView):
         user = self.request.user
         categories = OwnCategory.objects.filter(brand=brand)
         try:
-            if brand == user.brand_user.brand:
+            if brand.pk == user.brand_user.brand_id:
                 if not categories.exists():
                     return Response({
                         'success': False,
@@ -449,7 +519,7 @@ class OwnCategoryListAPI(APIView):
         brand = get_object_or_404(Brand, is_active=True, slug=brand_slug)
         user = self.request.user
         try:
-            if brand == user.brand_user.brand and user.brand_user.is_manager:
+            if brand.pk == user.brand_user.brand_id and user.brand_user.is_manager:
                 category_count = OwnCategory.objects.filter(brand=brand).count()
                 # Validation
                 if category_count >= MAXIMUM_BRAND_CATEGORIES:
@@ -488,7 +558,7 @@ class OwnCategoryDetailAPI(APIView):
         user = self.request.user
         category = get_object_or_404(OwnCategory, brand=brand, uuid=uuid)
         try:
-            if brand == user.brand_user.brand and user.brand_user.is_manager:
+            if brand.pk == user.brand_user.brand_id and user.brand_user.is_manager:
                 fields = ['name', 'brand', 'description', 'order', 'uuid']
                 serializer = OwnCategorySerializer(category, data=request.data, fields=fields)
                 if serializer.is_valid():
@@ -513,7 +583,7 @@ class OwnCategoryDetailAPI(APIView):
                 return Response({
                     'success': False
                 }, status=status.HTTP_400_BAD_REQUEST)
-            if brand == user.brand_user.brand and user.brand_user.is_manager:
+            if brand.pk == user.brand_user.brand_id and user.brand_user.is_manager:
                 category.delete()
                 return Response({
                     'success': True
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from redis.client import Pipeline, Redis
+from rest_framework.serializers import BaseSerializer
+
+# costs of the request being served by this thread, None outside of requests
+current = threading.local()
+COSTS = ['db_queries', 'db_seconds', 'redis_commands', 'redis_seconds', 'serializer_seconds']
+
+
+def start_request():
+    current.costs = dict.fromkeys(COSTS, 0)
+    current.serializing = False
+
+
+def finish_request():
+    costs, current.costs = getattr(current, 'costs', None), None
+    return costs
+
+
+def get_costs():
+    return getattr(current, 'costs', None)
+
+
+def time_query(execute, sql, params, many, context):
+    costs = get_costs()
+    if costs is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        costs['db_queries'] += 1
+        costs['db_seconds'] += time.perf_counter() - start
+
+
+class InstrumentedPipeline(Pipeline):
+
+    def execute(self, raise_on_error=True):
+        costs = get_costs()
+        if costs is None:
+            return super().execute(raise_on_error)
+        commands = len(self.command_stack)
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            costs['redis_commands'] += commands
+            costs['redis_seconds'] += time.perf_counter() - start
+
+
+class InstrumentedRedis(Redis):
+    # set as REDIS_CLIENT_CLASS of the default cache, so every get_redis_connection client is counted
+
+    def execute_command(self, *args, **options):
+        costs = get_costs()
+        if costs is None:
+            return super().execute_command(*args, **options)
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            costs['redis_commands'] += 1
+            costs['redis_seconds'] += time.perf_counter() - start
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+serializer_data = BaseSerializer.data.fget
+
+
+def timed_serializer_data(self):
+    # only the outermost serializer is timed, nested ones run inside it
+    costs = get_costs()
+    if costs is None or current.serializing:
+        return serializer_data(self)
+    current.serializing = True
+    start = time.perf_counter()
+    try:
+        return serializer_data(self)
+    finally:
+        current.serializing = False
+        costs['serializer_seconds'] += time.perf_counter() - start
+
+
+def install():
+    BaseSerializer.data = property(timed_serializer_data)
@@ -0,0 +1,154 @@
+import hmac
+import threading
+import time
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from core import instrumentation, settings
+
+r = get_redis_connection("default")
+
+# samples of every worker are summed in one redis hash, keyed by their prometheus name and labels
+METRICS_KEY = 'metrics'
+METRICS = {
+    'http_requests_total': ('counter', "Requests served, by view, method and status"),
+    'http_request_duration_seconds': ('histogram', "Request latency by view"),
+    'db_queries_total': ('counter', "ORM queries by view"),
+    'db_query_duration_seconds_total': ('counter', "Time spent in ORM queries by view"),
+    'redis_commands_total': ('counter', "Redis commands by view, pipelined commands counted one by one"),
+    'redis_command_duration_seconds_total': ('counter', "Time spent in redis round trips by view"),
+    'serializer_duration_seconds_total': ('counter', "Time spent building serializer data by view, "
+                                                     "including the queries it triggers"),
+}
+COST_METRICS = {
+    'db_queries': 'db_queries_total',
+    'db_seconds': 'db_query_duration_seconds_total',
+    'redis_commands': 'redis_commands_total',
+    'redis_seconds': 'redis_command_duration_seconds_total',
+    'serializer_seconds': 'serializer_duration_seconds_total',
+}
+
+
+class Collector:
+    # requests only touch this dict, redis is written every METRICS_FLUSH_INTERVAL seconds
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.flushed_at = time.monotonic()
+
+    def add(self, samples, name, labels, value):
+        key = f"{name}{{{labels}}}"
+        samples[key] = samples.get(key, 0) + value
+
+    def observe(self, view, method, status, duration, costs):
+        labels = f'view="{view}"'
+        with self.lock:
+            samples = self.samples
+            self.add(samples, 'http_requests_total', f'{labels},method="{method}",status="{status}"', 1)
+            for bucket in settings.METRICS_BUCKETS:
+                # empty buckets are written too, so every series has all of them
+                self.add(samples, 'http_request_duration_seconds_bucket', f'{labels},le="{bucket}"',
+                         1 if duration <= bucket else 0)
+            self.add(samples, 'http_request_duration_seconds_bucket', f'{labels},le="+Inf"', 1)
+            self.add(samples, 'http_request_duration_seconds_sum', labels, duration)
+            self.add(samples, 'http_request_duration_seconds_count', labels, 1)
+            for cost, name in COST_METRICS.items():
+                if costs[cost]:
+                    self.add(samples, name, labels, costs[cost])
+
+    def flush(self):
+        with self.lock:
+            samples, self.samples = self.samples, {}
+            self.flushed_at = time.monotonic()
+        if not samples:
+            return
+        pipe = r.pipeline(transaction=False)
+        for key, value in samples.items():
+            pipe.hincrbyfloat(METRICS_KEY, key, value)
+        try:
+            pipe.execute()
+        except RedisError:
+            # kept for the next flush
+            with self.lock:
+                for key, value in samples.items():
+                    self.samples[key] = self.samples.get(key, 0) + value
+
+    def flush_due(self):
+        if time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+
+collector = Collector()
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        instrumentation.install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        instrumentation.start_request()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(instrumentation.time_query):
+                response = self.get_response(request)
+        finally:
+            costs = instrumentation.finish_request()
+        match = request.resolver_match
+        view = match.view_name if match is not None and match.view_name else 'unmatched'
+        collector.observe(view, request.method, response.status_code, time.perf_counter() - start, costs)
+        collector.flush_due()
+        return response
+
+
+def get_family(key):
+    name = key.split('{', 1)[0]
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+
+def sort_key(key):
+    # buckets of one histogram are listed by their upper bound
+    labels, _, le = key.partition(',le="')
+    le = le.rstrip('"}')
+    return get_family(key), labels, float('inf') if le == '+Inf' else float(le or 0)
+
+
+def render(samples):
+    lines, family = [], None
+    for key in sorted(samples, key=sort_key):
+        if get_family(key) != family:
+            family = get_family(key)
+            kind, description = METRICS.get(family, ('untyped', family))
+            lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {kind}")
+        lines.append(f"{key} {samples[key]}")
+    return '\n'.join(lines) + '\n'
+
+
+def is_allowed(request):
+    # scrapers send the configured token, without one only staff sessions can read the metrics
+    if settings.METRICS_TOKEN:
+        token = request.headers.get('Authorization', '')
+        if hmac.compare_digest(token.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+            return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_active and user.is_staff)
+
+
+def metrics_view(request):
+    if not is_allowed(request):
+        return HttpResponseForbidden()
+    collector.flush()
+    samples = {key.decode(): value.decode() for key, value in r.hgetall(METRICS_KEY).items()}
+    return HttpResponse(render(samples), content_type='text/plain; version=0.0.4; charset=utf-8')
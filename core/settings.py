@@ -33,7 +33,6 @@ THIRD_PARTY_APPS = [
     'rest_framework',
     'corsheaders',
     'django_filters',
-    'rest_framework_simplejwt.token_blacklist',
     'drf_spectacular',
     'cloudinary',
 ]
@@ -50,6 +49,7 @@ SYSTEM_APPS = [
 INSTALLED_APPS = LOCAL_APPS + THIRD_PARTY_APPS + SYSTEM_APPS
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', # whitenoise
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -102,6 +102,7 @@ CACHES = {
         'LOCATION': env('REDIS_LOCATION'),
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'REDIS_CLIENT_CLASS': 'core.instrumentation.InstrumentedRedis',
         }
     }
 }
@@ -124,12 +125,14 @@ AUTH_PASSWORD_VALIDATORS = [
 
 MAXIMUM_PRODUCT_IMAGES = 6
 
+PRODUCT_THUMBNAIL_OPTIONS = {'width': 320, 'height': 320, 'crop': 'fill', 'secure': True}
+
 MAXIMUM_BRAND_CATEGORIES = 8
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         # 'rest_framework.authentication.TokenAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     "DATE_INPUT_FORMATS": ["%d-%m-%Y"],
@@ -216,11 +219,115 @@ SMS_url = env('SMS_URL')
 SMS_headers = {
     'Authorization': env('SMS_BEARER')
 }
+SMS_FROM = '4546'
+SMS_CALLBACK_URL = 'https://imager.uz/sms.html'
+SMS_TIMEOUT = 5
+
+# Notification outbox
+NOTIFICATION_BATCH_SIZE = 50
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_RETRY_DELAY = 30
+NOTIFICATION_POLL_INTERVAL = 5
+# claimed notifications not marked sent within the lease are claimed again
+NOTIFICATION_LEASE = 300
+NOTIFICATION_SMS_CONCURRENCY = 10
+
+# Authenticated user snapshots
+AUTH_SNAPSHOT_TTL = 60 * 60
+AUTH_SNAPSHOT_LOCAL_SIZE = 2048
+
+# Password hashing pool, per web worker process; callers waiting longer than the wait get 429
+PASSWORD_HASHING_WORKERS = 2
+PASSWORD_HASHING_QUEUE_SIZE = 8
+PASSWORD_HASHING_WAIT = 0.5
+# Optional cap on hashes running at once across all web workers, None leaves only the per-process pools
+PASSWORD_HASHING_GLOBAL_LIMIT = env.int('PASSWORD_HASHING_GLOBAL_LIMIT', default=None)
+PASSWORD_HASHING_LEASE = 10
+
+# One-time codes
+OTP_TTL = 600
+OTP_MAX_ATTEMPTS = 5
+
+# Autocomplete indexes: term prefixes ranked by popularity up to this length, longer queries range the lex set
+# over at most SEARCH_LEX_CANDIDATES terms; SEARCH_MAX_RESULTS are returned
+SEARCH_PREFIX_LENGTH = 4
+SEARCH_LEX_CANDIDATES = 1000
+SEARCH_MAX_RESULTS = 200
+SEARCH_EXACT_BONUS = 10
+
+# Cached pages of the brand directory, dropped on every brand change
+BRAND_DIRECTORY_CACHE_TTL = 60
+
+# Friends who liked or follow: members checked per request, and users listed
+SOCIAL_PROOF_MAX_SCAN = 10000
+SOCIAL_PROOF_MAX_USERS = 50
+
+# Similar products, rebuilt offline by build_similar_products
+SIMILAR_TOP_K = 20
+SIMILAR_BLOCK_SIZE = 1000
+# Upper bound of the similarity scores one content block can hold, the rows of a block shrink in large groups
+SIMILAR_BLOCK_CELLS = 20000000
+SIMILAR_LIKE_WEIGHT = 1.0
+# Products a saved product is scored against, sampled from those sharing one of its features
+SIMILAR_CONTENT_CANDIDATES = 2000
+SIMILAR_UPDATE_BATCH_SIZE = 100
+SIMILAR_UPDATE_POLL_INTERVAL = 5
+# Content vectors hash tags, category, type, colors, sizes, brand and price band into this many dimensions
+CONTENT_FEATURE_DIM = 2 ** 20
+CONTENT_FEATURE_WEIGHTS = {
+    'brand': 1.0,
+    'category': 2.0,
+    'type': 1.0,
+    'tag': 1.0,
+    'color': 0.5,
+    'size': 0.3,
+    'price': 1.0,
+}
+
+# Followed brands feed: newest candidates ranked per user, half life in hours,
+# the pages past the ranked window list the older products chronologically
+FEED_CANDIDATES = 500
+FEED_CACHE_TTL = 5 * 60
+FEED_PROFILE_TTL = 60 * 60
+FEED_RECENCY_HALF_LIFE = 72
+FEED_BRAND_DECAY = 0.85
+FEED_WEIGHTS = {
+    'recency': 1.0,
+    'category': 0.6,
+    'color': 0.3,
+    'popularity': 0.4,
+    'like': 1.0,
+}
+
+# Nearby search: grid cell size in degrees, cells listed in one query, radius in km
+GEO_CELL_SIZE = 0.1
+GEO_MAX_CELLS = 400
+NEARBY_RADIUS = 10
+NEARBY_MAX_RADIUS = 200
+NEARBY_MAX_RESULTS = 200
+
+# Product filter bitmaps, kept current per worker from a redis change stream, synced in the background
+# at most every interval seconds
+BITMAP_STREAM_LENGTH = 100000
+BITMAP_SYNC_BATCH = 1000
+BITMAP_SYNC_INTERVAL = 1
+
+# Comment threads are listed with their first replies, the rest is paged from the replies endpoint
+COMMENT_REPLIES_PREVIEW = 3
+
+# Per-view latency, query, redis and serializer costs, summed across workers in redis and served at /metrics
+METRICS_ENABLED = True
+METRICS_FLUSH_INTERVAL = 10
+METRICS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# bearer token of the scraper, without it /metrics only answers staff sessions
+METRICS_TOKEN = env('METRICS_TOKEN', default=None)
+
+SENTRY_TRACES_SAMPLE_RATE = env.float('SENTRY_TRACES_SAMPLE_RATE', default=0.05)
 
 if LOCAL is False:
     sentry_sdk.init(
         dsn=env('SENTRY_DSN'),
         integrations=[DjangoIntegration(), RedisIntegration()],
-        traces_sample_rate=1.0,
+        traces_sample_rate=SENTRY_TRACES_SAMPLE_RATE,
         send_default_pii=True
     )
@@ -9,22 +9,25 @@ from rest_framework_simplejwt.views import (
 )
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
+from accounts.serializers import TokenRefreshSerializer, TokenVerifySerializer
+
 from django.urls import path
 
-from core import db_test
+from core import metrics
 
 def trigger_error(request):
     division_by_zero = 1 / 0
 
 urlpatterns = [
-    path('cfu/<int:count>', db_test.CreateFakerUsers.as_view()),
     path('sentry-debug/', trigger_error),
+    path('metrics', metrics.metrics_view, name='metrics'),
     # Admin
     path('admin-panel/', admin.site.urls),
     # Token
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
+    path('api/token/refresh/', TokenRefreshView.as_view(serializer_class=TokenRefreshSerializer),
+         name='token_refresh'),
+    path('api/token/verify/', TokenVerifyView.as_view(serializer_class=TokenVerifySerializer), name='token_verify'),
     # Api V1
     path('api/v1/', include('api.urls')),
     # Pattern UI:
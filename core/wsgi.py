@@ -5,3 +5,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# every worker scans products into its search filter bitmaps before serving
+from product.bitmap import index  # noqa: E402
+
+index.warm_up()
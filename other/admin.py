@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from other.models import City, Category, SubCategory, Tag, Comment, Color, Size, RegisterSecretCode, Type, Banner
+from other.models import City, Category, SubCategory, Tag, Comment, Color, Size, RegisterSecretCode, Type, Banner, \
+    MediaBlob, Notification
 
 admin.site.register(City)
 admin.site.register(Category)
@@ -11,6 +12,15 @@ admin.site.register(Size)
 admin.site.register(Type)
 admin.site.register(Banner)
 admin.site.register(RegisterSecretCode)
+admin.site.register(MediaBlob)
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('channel', 'recipient', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('channel', 'status', 'created_at')
+    search_fields = ('recipient',)
+    list_per_page = 100
+
 
 @admin.register(SubCategory)
 class SubcategoryAdmin(admin.ModelAdmin):
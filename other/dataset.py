@@ -0,0 +1,439 @@
+import io
+import multiprocessing
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Count, Max
+from django.utils.text import slugify
+from django_redis import get_redis_connection
+from faker import Faker
+
+from accounts.models import Follow, User
+from actions.models import Action
+from brand.models import Brand, BrandUser, Contact, OwnCategory
+from other import geo
+from other.choices import Verb
+from other.models import City, Color, Comment, Size, SubCategory, Tag
+from product.models import Product, ProductImage, ProductLike, ProductRating
+from product.utils import get_thumbnail_url
+
+r = get_redis_connection("default")
+
+PASSWORD = 'Gpw9n9bf1'
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL', '36', '37', '38', '39', '40', '41', '42', '43', '44', '45']
+TAGS = 300
+OWN_CATEGORIES = ['New', 'Sale', 'Basics', 'Outerwear', 'Shoes', 'Accessories', 'Home', 'Gifts']
+OWN_CATEGORIES_PER_BRAND = 4
+# city centres the coordinates are scattered around, users and brands are located near one of them
+CENTERS = [(41.311, 69.279), (39.654, 66.975), (39.768, 64.455), (40.998, 71.672), (40.782, 72.344),
+           (40.389, 71.784), (42.460, 59.617), (38.861, 65.789), (37.224, 67.278), (40.103, 65.374),
+           (41.550, 60.631), (40.116, 67.842), (40.489, 68.781), (40.528, 70.943)]
+# exponents of the power laws behind popularity: a few users, brands and products get most of the activity
+USER_ACTIVITY_SKEW = 0.9
+USER_FAME_SKEW = 1.1
+BRAND_SKEW = 1.0
+PRODUCT_SKEW = 1.05
+CATEGORY_SKEW = 0.8
+TAG_SKEW = 1.0
+RATINGS = [1, 2, 3, 4, 5]
+RATING_WEIGHTS = [0.05, 0.05, 0.15, 0.35, 0.4]
+
+ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def get_cdf(rng, size, exponent):
+    # ranks are shuffled, so popularity does not follow the primary key
+    weights = 1 / (rng.permutation(size) + 1.0) ** exponent
+    return np.cumsum(weights / weights.sum())
+
+
+def sample(rng, cdf, size):
+    return np.minimum(np.searchsorted(cdf, rng.random(size), side='right'), len(cdf) - 1)
+
+
+def to_datetime(timestamp):
+    return datetime.fromtimestamp(float(timestamp), tz=timezone.utc)
+
+
+def get_uuid(rng):
+    return uuid.UUID(bytes=rng.bytes(16), version=4)
+
+
+class Plan:
+    # everything the workers share, derived from the seed only, so a seed always produces the same rows
+
+    def __init__(self, seed, counts, days, end):
+        self.seed = seed
+        self.counts = counts
+        self.now = end.timestamp()
+        self.start = self.now - timedelta(days=days).total_seconds()
+        self.password = make_password(PASSWORD)
+        self.bases = {model: (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+                      for model in (User, Brand, BrandUser, OwnCategory, Product, Comment)}
+        self.categories = list(SubCategory.objects.order_by('pk').values_list('pk', 'type_id', 'name'))
+        self.cities = list(City.objects.order_by('pk').values_list('pk', flat=True))
+        self.colors = list(Color.objects.order_by('pk').values_list('pk', flat=True))
+        self.sizes = list(Size.objects.order_by('pk').values_list('pk', flat=True))
+        self.tags = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+        self.product_type = ContentType.objects.get_for_model(Product).pk
+
+        rng = np.random.default_rng([seed, 0])
+        activity = get_cdf(rng, counts['users'], USER_ACTIVITY_SKEW)
+        self.user_activity = np.diff(activity, prepend=0)
+        self.user_activity_cdf = activity
+        self.user_fame_cdf = get_cdf(rng, counts['users'], USER_FAME_SKEW)
+        self.brand_cdf = get_cdf(rng, counts['brands'], BRAND_SKEW)
+        self.product_cdf = get_cdf(rng, counts['products'], PRODUCT_SKEW)
+        self.category_cdf = get_cdf(rng, len(self.categories), CATEGORY_SKEW)
+        self.tag_cdf = get_cdf(rng, len(self.tags), TAG_SKEW)
+        # big brands get most of the catalogue
+        self.product_brands = sample(rng, get_cdf(rng, counts['brands'], BRAND_SKEW), counts['products'])
+
+    def get_times(self, kind, indexes):
+        # creation times grow with the primary key, brands open during the first half of the period
+        span = self.now - self.start
+        if kind == 'brands':
+            span /= 2
+        return self.start + span * np.asarray(indexes) / max(self.counts[kind], 1)
+
+    def get_product_times(self, indexes):
+        return np.maximum(self.get_times('products', indexes), self.get_times('brands', self.product_brands[indexes]))
+
+    def get_later_times(self, rng, earliest):
+        return earliest + rng.random(len(earliest)) * (self.now - earliest)
+
+    def get_location(self, rng):
+        lat, lon = CENTERS[rng.integers(len(CENTERS))]
+        lat, lon = round(lat + rng.normal(0, 0.05), 6), round(lon + rng.normal(0, 0.05), 6)
+        return f"{lat:.6f},{lon:.6f}", Decimal(f"{lat:.6f}"), Decimal(f"{lon:.6f}"), geo.get_cell(lat, lon)
+
+    def get_owner(self, index):
+        # every brand is owned by a different user, spread over the whole user range
+        return self.bases[User] + index * (self.counts['users'] // self.counts['brands'])
+
+
+def encode(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).translate(ESCAPES)
+
+
+def write(model, attnames, rows, now):
+    # COPY on postgres, plain executemany elsewhere; model save(), signals and auto_now are all bypassed
+    if not rows:
+        return 0
+    fields_by_attname = {field.attname: field for field in model._meta.concrete_fields}
+    fields = [fields_by_attname[attname] for attname in attnames]
+    defaults = []
+    for field in model._meta.concrete_fields:
+        if field.attname in attnames or field.primary_key or field.null:
+            continue
+        fields.append(field)
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            defaults.append(to_datetime(now))
+        else:
+            defaults.append(field.get_default())
+    values = [[field.get_db_prep_save(value, connection) for field, value in zip(fields, (*row, *defaults))]
+              for row in rows]
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            buffer = io.StringIO()
+            for row in values:
+                buffer.write('\t'.join(encode(value) for value in row))
+                buffer.write('\n')
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+        else:
+            cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(fields))})",
+                               values)
+    return len(rows)
+
+
+def get_name(value):
+    return re.sub(r'[^a-z0-9.]', '', value.lower())[:18] or 'user'
+
+
+def generate_users(plan, rng, faker, start, stop):
+    rows = []
+    joined = plan.get_times('users', np.arange(start, stop))
+    for index, timestamp in zip(range(start, stop), joined.tolist()):
+        pk = plan.bases[User] + index
+        username = f"{get_name(faker.user_name())}_{pk}"
+        geolocation = latitude = longitude = geocell = city = None
+        if rng.random() < 0.6:
+            geolocation, latitude, longitude, geocell = plan.get_location(rng)
+        if plan.cities and rng.random() < 0.7:
+            city = plan.cities[rng.integers(len(plan.cities))]
+        birth_date = faker.date_of_birth(minimum_age=14, maximum_age=70) if rng.random() < 0.5 else None
+        rows.append((pk, get_uuid(rng), plan.password, username, slugify(username.lower()),
+                     f"{username.lower()}@{faker.free_email_domain()}", str(900000000 + pk), faker.first_name(),
+                     faker.last_name(), ['man', 'woman', 'none'][rng.integers(3)], birth_date, city, geolocation,
+                     latitude, longitude, geocell, bool(rng.random() < 0.05), bool(rng.random() < 0.01),
+                     to_datetime(timestamp), to_datetime(timestamp)))
+    return [(User, ['id', 'uuid', 'password', 'username', 'slug', 'email', 'phone_number', 'first_name', 'last_name',
+                    'gender', 'birth_date', 'city_id', 'geolocation', 'latitude', 'longitude', 'geocell',
+                    'is_private', 'is_official', 'date_joined', 'updated_at'], rows)]
+
+
+def generate_brands(plan, rng, faker, start, stop):
+    brands, brand_users, own_categories, cities = [], [], [], []
+    created = plan.get_times('brands', np.arange(start, stop))
+    for index, timestamp in zip(range(start, stop), created.tolist()):
+        pk = plan.bases[Brand] + index
+        company = faker.company()
+        suffix = f"{re.sub(r'[^a-z0-9]', '', company.lower())[:30] or 'brand'}_{pk}"
+        geolocation = latitude = longitude = geocell = None
+        if rng.random() < 0.8:
+            geolocation, latitude, longitude, geocell = plan.get_location(rng)
+        delivery = bool(rng.random() < 0.5)
+        brands.append((pk, get_uuid(rng), plan.get_owner(index), f"{company[:50]} {pk}",
+                       f"{suffix}@{faker.free_email_domain()}", str(900000000 + pk), suffix,
+                       slugify(suffix, allow_unicode=True), faker.paragraph()[:500], faker.catch_phrase()[:60],
+                       int(rng.integers(6)), delivery, bool(rng.random() < 0.99), bool(rng.random() < 0.97),
+                       bool(rng.random() < 0.1), faker.address()[:200], geolocation, latitude, longitude, geocell,
+                       to_datetime(timestamp), to_datetime(timestamp)))
+        brand_users.append((plan.bases[BrandUser] + index, pk, plan.get_owner(index), True, to_datetime(timestamp)))
+        names = rng.choice(len(OWN_CATEGORIES), OWN_CATEGORIES_PER_BRAND, replace=False)
+        for position, name in enumerate(names.tolist()):
+            own_categories.append((plan.bases[OwnCategory] + index * OWN_CATEGORIES_PER_BRAND + position,
+                                   get_uuid(rng), OWN_CATEGORIES[name], slugify(OWN_CATEGORIES[name]), pk,
+                                   position + 1, to_datetime(timestamp)))
+        if delivery and plan.cities:
+            for city in rng.choice(plan.cities, min(len(plan.cities), int(rng.integers(1, 4))), replace=False):
+                cities.append((pk, int(city)))
+    return [
+        (Brand, ['id', 'uuid', 'owner_id', 'name', 'email', 'phone_number', 'suffix', 'slug', 'info', 'slogan',
+                 'rating', 'delivery', 'is_active', 'status', 'verified', 'address', 'geolocation', 'latitude',
+                 'longitude', 'geocell', 'created_at', 'updated_at'], brands),
+        (BrandUser, ['id', 'brand_id', 'user_id', 'is_manager', 'created_at'], brand_users),
+        (OwnCategory, ['id', 'uuid', 'name', 'slug', 'brand_id', 'order', 'created_at'], own_categories),
+        (Brand.cities.through, ['brand_id', 'city_id'], cities),
+    ]
+
+
+def generate_products(plan, rng, faker, start, stop):
+    products, colors, sizes, tags, images, actions = [], [], [], [], [], []
+    indexes = np.arange(start, stop)
+    created = plan.get_product_times(indexes)
+    categories = sample(rng, plan.category_cdf, stop - start)
+    prices = np.round(rng.lognormal(np.log(150000), 0.9, stop - start), -3) + 1000
+    for index, timestamp, category, price in zip(indexes.tolist(), created.tolist(), categories.tolist(),
+                                                 prices.tolist()):
+        pk = plan.bases[Product] + index
+        brand = int(plan.product_brands[index])
+        category_id, type_id, category_name = plan.categories[category]
+        name = f"{faker.word().title()} {category_name}"
+        discount = old_price = None
+        is_sale = bool(rng.random() < 0.2)
+        if is_sale:
+            discount = int(rng.integers(10, 51))
+            old_price = int(round(price * 100 / (100 - discount), -3))
+        image_count = int(rng.integers(1, 6))
+        for order in range(1, image_count + 1):
+            images.append((pk, f"dataset/products/{pk}-{order}.jpg", order, order == 1))
+        main_image = f"dataset/products/{pk}-1.jpg"
+        products.append((pk, get_uuid(rng), plan.bases[Brand] + brand, plan.bases[BrandUser] + brand, category_id,
+                         type_id, plan.bases[OwnCategory] + brand * OWN_CATEGORIES_PER_BRAND
+                         + int(rng.integers(OWN_CATEGORIES_PER_BRAND)), name, f"{slugify(name)}-{pk:x}",
+                         faker.bothify('??-####').upper(), faker.country()[:50], faker.ean13(), discount, int(price),
+                         old_price, int(rng.poisson(20)) if rng.random() < 0.95 else 0, faker.paragraph(),
+                         bool(rng.random() < 0.98), bool(rng.random() < 0.97), is_sale, main_image,
+                         get_thumbnail_url(main_image), to_datetime(timestamp), to_datetime(timestamp)))
+        if plan.colors:
+            for color in rng.choice(plan.colors, min(len(plan.colors), int(rng.integers(1, 4))), replace=False):
+                colors.append((pk, int(color)))
+        if plan.sizes:
+            for size in rng.choice(plan.sizes, min(len(plan.sizes), int(rng.integers(0, 5))), replace=False):
+                sizes.append((pk, int(size)))
+        if plan.tags:
+            for tag in set(sample(rng, plan.tag_cdf, int(rng.integers(0, 4))).tolist()):
+                tags.append((pk, plan.tags[tag]))
+        if rng.random() < 0.3:
+            verb = Verb.SALE if is_sale else [Verb.NEW, Verb.PRODUCT, Verb.PROMO][rng.integers(3)]
+            actions.append((plan.bases[Brand] + brand, plan.product_type, pk, verb.value, bool(rng.random() < 0.5),
+                            to_datetime(timestamp)))
+    return [
+        (Product, ['id', 'uuid', 'brand_id', 'user_id', 'category_id', 'type_id', 'own_category_id', 'name', 'slug',
+                   'vendor_code', 'origin', 'barcode', 'discount', 'price', 'old_price', 'stock', 'description',
+                   'is_active', 'status', 'is_sale', 'main_image', 'main_thumbnail', 'created_at', 'updated_at'],
+         products),
+        (Product.color.through, ['product_id', 'color_id'], colors),
+        (Product.sizes.through, ['product_id', 'size_id'], sizes),
+        (Product.tags.through, ['product_id', 'tag_id'], tags),
+        (ProductImage, ['product_id', 'image', 'order', 'is_main'], images),
+        (Action, ['brand_id', 'target_ct_id', 'target_id', 'verb', 'seen', 'created_at'], actions),
+    ]
+
+
+def get_interactions(plan, rng, start, stop, total, cdf):
+    # active users do more, popular targets get more, a user meets a target at most once
+    counts = rng.poisson(plan.user_activity[start:stop] * total)
+    users = np.repeat(np.arange(start, stop), counts)
+    pairs = np.unique(users * len(cdf) + sample(rng, cdf, len(users)))
+    return pairs // len(cdf), pairs % len(cdf)
+
+
+def generate_likes(plan, rng, faker, start, stop):
+    users, products = get_interactions(plan, rng, start, stop, plan.counts['likes'], plan.product_cdf)
+    times = plan.get_later_times(rng, np.maximum(plan.get_times('users', users), plan.get_product_times(products)))
+    rows = [(plan.bases[User] + user, plan.bases[Product] + product, to_datetime(timestamp))
+            for user, product, timestamp in zip(users.tolist(), products.tolist(), times.tolist())]
+    return [(ProductLike, ['user_id', 'product_id', 'liked_at'], rows)]
+
+
+def generate_ratings(plan, rng, faker, start, stop):
+    users, products = get_interactions(plan, rng, start, stop, plan.counts['ratings'], plan.product_cdf)
+    times = plan.get_later_times(rng, np.maximum(plan.get_times('users', users), plan.get_product_times(products)))
+    ratings = rng.choice(RATINGS, len(users), p=RATING_WEIGHTS)
+    rows = [(plan.bases[User] + user, plan.bases[Product] + product, rating, to_datetime(timestamp),
+             to_datetime(timestamp))
+            for user, product, rating, timestamp in zip(users.tolist(), products.tolist(), ratings.tolist(),
+                                                        times.tolist())]
+    return [(ProductRating, ['user_id', 'product_id', 'rating', 'created_at', 'updated_at'], rows)]
+
+
+def generate_follows(plan, rng, faker, start, stop):
+    users, targets = get_interactions(plan, rng, start, stop, plan.counts['follows'], plan.user_fame_cdf)
+    keep = users != targets
+    users, targets = users[keep], targets[keep]
+    times = plan.get_later_times(rng, np.maximum(plan.get_times('users', users), plan.get_times('users', targets)))
+    accepted = rng.random(len(users)) < 0.95
+    rows = [(plan.bases[User] + user, plan.bases[User] + target, status, to_datetime(timestamp),
+             to_datetime(timestamp) if status else None)
+            for user, target, status, timestamp in zip(users.tolist(), targets.tolist(), accepted.tolist(),
+                                                       times.tolist())]
+    return [(Follow, ['from_user_id', 'to_user_id', 'status', 'created_at', 'allowed_at'], rows)]
+
+
+def generate_contacts(plan, rng, faker, start, stop):
+    users, brands = get_interactions(plan, rng, start, stop, plan.counts['contacts'], plan.brand_cdf)
+    times = plan.get_later_times(rng, np.maximum(plan.get_times('users', users), plan.get_times('brands', brands)))
+    rows = [(plan.bases[User] + user, plan.bases[Brand] + brand, to_datetime(timestamp))
+            for user, brand, timestamp in zip(users.tolist(), brands.tolist(), times.tolist())]
+    return [(Contact, ['from_user_id', 'to_brand_id', 'created_at'], rows)]
+
+
+def generate_comments(plan, rng, faker, start, stop):
+    # threads live inside a chunk: a reply answers an earlier comment of the same chunk
+    rows, threads = [], []
+    users = sample(rng, plan.user_activity_cdf, stop - start)
+    products = sample(rng, plan.product_cdf, stop - start)
+    for index, user, product in zip(range(start, stop), users.tolist(), products.tolist()):
+        pk = plan.bases[Comment] + index
+        earliest = plan.get_times('users', [user])[0]
+        if threads and rng.random() < 0.35:
+            # half of the replies answer the top-level comment, the others a reply in its thread
+            thread = threads[rng.integers(len(threads))]
+            root, product, _ = thread[0]
+            parent, _, parent_created = thread[rng.integers(len(thread))] if rng.random() < 0.5 else thread[0]
+            created = plan.get_later_times(rng, np.array([max(earliest, parent_created)]))[0]
+            thread.append((pk, product, created))
+        else:
+            root = parent = None
+            created = plan.get_later_times(rng, np.array([max(earliest, plan.get_product_times([product])[0])]))[0]
+            threads.append([(pk, product, created)])
+        rows.append((pk, get_uuid(rng), plan.bases[User] + user, faker.sentence(nb_words=int(rng.integers(4, 20))),
+                     plan.bases[Product] + product, parent, root, bool(rng.random() < 0.97), to_datetime(created),
+                     to_datetime(created)))
+    return [(Comment, ['id', 'uuid', 'user_id', 'text', 'used_to_id', 'parent_id', 'root_id', 'is_active',
+                       'created_at', 'updated_at'], rows)]
+
+
+# phases run in this order, every phase only references rows of the phases before it;
+# the last value is what a phase is chunked by
+PHASES = [
+    ('users', generate_users, 'users'),
+    ('brands', generate_brands, 'brands'),
+    ('products', generate_products, 'products'),
+    ('likes', generate_likes, 'users'),
+    ('ratings', generate_ratings, 'users'),
+    ('follows', generate_follows, 'users'),
+    ('contacts', generate_contacts, 'users'),
+    ('comments', generate_comments, 'comments'),
+]
+GENERATORS = {name: generator for name, generator, _ in PHASES}
+
+worker_plan = None
+
+
+def init_worker(plan):
+    global worker_plan
+    worker_plan = plan
+
+
+def run_chunk(task):
+    name, number, start, stop = task
+    plan = worker_plan
+    rng = np.random.default_rng([plan.seed, [phase[0] for phase in PHASES].index(name) + 1, number])
+    faker = Faker()
+    faker.seed_instance(int(rng.integers(2 ** 32)))
+    with transaction.atomic():
+        return sum(write(model, attnames, rows, plan.now)
+                   for model, attnames, rows in GENERATORS[name](plan, rng, faker, start, stop))
+
+
+def ensure_catalog():
+    if not SubCategory.objects.exists():
+        call_command('loaddata', 'categories', verbosity=0)
+    if not Size.objects.exists():
+        Size.objects.bulk_create([Size(size=size) for size in SIZES])
+    if Tag.objects.count() < TAGS:
+        faker = Faker()
+        faker.seed_instance(0)
+        names = {tag.lower() for tag in Tag.objects.values_list('name', flat=True)}
+        words = [word for word in faker.words(TAGS * 3, unique=True) if word not in names]
+        Tag.objects.bulk_create([Tag(name=word, slug=slugify(word)) for word in words[:TAGS - len(names)]])
+
+
+def generate(plan, workers, chunk_size, log):
+    # forked workers open their own database connections
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    with context.Pool(workers, initializer=init_worker, initargs=(plan,)) as pool:
+        for name, _, chunked_by in PHASES:
+            total = plan.counts[chunked_by]
+            tasks = [(name, number, start, min(start + chunk_size, total))
+                     for number, start in enumerate(range(0, total, chunk_size))]
+            log(name, sum(pool.imap_unordered(run_chunk, tasks)))
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [User, Brand, BrandUser, OwnCategory, Product,
+                                                                  Comment]):
+            cursor.execute(sql)
+
+
+COUNTERS = [
+    (Follow.objects.filter(status=True), 'to_user_id', 'user:{}:followers_count'),
+    (Follow.objects.filter(status=True), 'from_user_id', 'user:{}:followings_count_user'),
+    (Contact.objects.all(), 'from_user_id', 'user:{}:followings_count_brand'),
+    (Contact.objects.all(), 'to_brand_id', 'brand:{}:followers_count'),
+    (ProductLike.objects.all(), 'user_id', 'user:{}:like_count'),
+    (ProductLike.objects.all(), 'product_id', 'product:{}:like_count'),
+    (ProductRating.objects.all(), 'user_id', 'user:{}:rating_count'),
+    (ProductRating.objects.all(), 'product_id', 'product:{}:rating_count'),
+]
+
+
+def write_counters(batch_size=10000):
+    # the counters signals keep in redis, computed once from the whole tables
+    pipe = r.pipeline(transaction=False)
+    for queryset, field, key in COUNTERS:
+        rows = queryset.order_by().values_list(field).annotate(count=Count('pk'))
+        for i, (pk, count) in enumerate(rows.iterator(chunk_size=batch_size), 1):
+            pipe.set(key.format(pk), count)
+            if i % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
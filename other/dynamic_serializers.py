@@ -0,0 +1,42 @@
+import copy
+from collections import OrderedDict
+
+from rest_framework import serializers
+
+# unbound fields of every (serializer class, field set) built so far, each instance gets a deep copy
+FIELDS = {}
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        self.allowed_fields = frozenset(fields) if fields is not None else None
+
+        super(DynamicFieldsModelSerializer, self).__init__(*args, **kwargs)
+
+    def get_fields(self):
+        key = (type(self), self.allowed_fields)
+        if key not in FIELDS:
+            FIELDS[key] = self.build_fields()
+        return copy.deepcopy(FIELDS[key])
+
+    def build_fields(self):
+        allowed = self.allowed_fields
+        if allowed is not None:
+            # declared serializers left out of the field set are never copied, and depth never nests them
+            self._declared_fields = OrderedDict(
+                (name, field) for name, field in self._declared_fields.items() if name in allowed)
+        try:
+            fields = super().get_fields()
+        finally:
+            self.__dict__.pop('_declared_fields', None)
+        if allowed is None:
+            return fields
+        return OrderedDict((name, field) for name, field in fields.items() if name in allowed)
+
+    def get_field_names(self, declared_fields, info):
+        names = super().get_field_names(declared_fields, info)
+        if self.allowed_fields is None:
+            return names
+        return [name for name in names if name in self.allowed_fields]
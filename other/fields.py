@@ -1,5 +1,7 @@
-from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, transaction, connections, router
+from django.db.models.fields.files import FieldFile
+from django.db.models import Max, Q, signals
+from django.utils.functional import cached_property
 
 
 class OrderField(models.PositiveIntegerField):
@@ -8,19 +10,111 @@ class OrderField(models.PositiveIntegerField):
         self.start = start
         super().__init__(*args, **kwargs)
 
+    @cached_property
+    def scope_attnames(self):
+        return [self.model._meta.get_field(field).attname for field in self.for_fields or []]
+
+    def get_scope(self, model_instance):
+        return tuple(getattr(model_instance, attname) for attname in self.scope_attnames)
+
+    def allocate(self, objs, using):
+        # Gives every instance without order the next free value of its scope,
+        # one aggregate query for all scopes instead of latest() per row
+        scopes = {}
+        for obj in objs:
+            if getattr(obj, self.attname) is None:
+                scopes.setdefault(self.get_scope(obj), []).append(obj)
+        if not scopes:
+            return
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            keys = sorted(f'{self.model._meta.db_table}:{self.attname}:{scope}' for scope in scopes)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(hashtext(k)) FROM unnest(%s::text[]) AS k', [keys])
+        qs = self.model._default_manager.using(using).order_by()
+        if self.scope_attnames:
+            query = Q()
+            for scope in scopes:
+                query |= Q(**dict(zip(self.scope_attnames, scope)))
+            last_values = {row[:-1]: row[-1] for row in
+                           qs.filter(query).values(*self.scope_attnames).annotate(last=Max(self.attname))
+                             .values_list(*self.scope_attnames, 'last')}
+        else:
+            last_values = {(): qs.aggregate(last=Max(self.attname))['last']}
+        for scope, scope_objs in scopes.items():
+            last = last_values.get(scope)
+            value = last + 1 if last is not None else (self.start if self.start is not None else 0)
+            for obj in scope_objs:
+                setattr(obj, self.attname, value)
+                value += 1
+
     def pre_save(self, model_instance, add):
         if getattr(model_instance, self.attname) is None:
-            try:
-                qs = self.model.objects.all()
-                if self.for_fields:
-                    query = {field: getattr(model_instance, field)\
-                             for field in self.for_fields}
-                    qs = qs.filter(**query)
-                last_item = qs.latest(self.attname)
-                value = last_item.order + 1
-            except ObjectDoesNotExist:
-                value = self.start if self.start is not None else 0
-            setattr(model_instance, self.attname, value)
-            return value
+            using = router.db_for_write(self.model, instance=model_instance)
+            # the advisory lock lasts until the outer transaction ends, so ordered models save atomically
+            with transaction.atomic(using=using):
+                self.allocate([model_instance], using=using)
+        return super().pre_save(model_instance, add)
+
+
+class OrderedQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            for field in self.model._meta.concrete_fields:
+                if isinstance(field, OrderField):
+                    field.allocate(objs, using=self.db)
+            for obj in objs:
+                if hasattr(obj, 'prepare_save'):
+                    obj.prepare_save()
+            return super().bulk_create(objs, *args, **kwargs)
+
+
+# Uploads are stored once per SHA-256 digest and shared through MediaBlob rows
+class ContentAddressedFileMixin:
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            signals.post_init.connect(self.remember_name, sender=cls)
+
+    @property
+    def loaded_attname(self):
+        return f'_{self.attname}_loaded'
+
+    def remember_name(self, instance, **kwargs):
+        # the name the row was loaded with, so clearing the field knows there is a blob to release
+        value = instance.__dict__.get(self.attname)
+        if isinstance(value, FieldFile):
+            value = value.name
+        instance.__dict__[self.loaded_attname] = value if isinstance(value, str) else None
+
+    def get_stored_name(self, model_instance):
+        return self.model._default_manager.filter(pk=model_instance.pk).values_list(self.attname, flat=True).first()
+
+    def pre_save(self, model_instance, add):
+        from other.models import MediaBlob
+
+        file = getattr(model_instance, self.attname)
+        # the counter changes inside the save of the row, models with these fields save atomically
+        if file and not file._committed:
+            previous = None if add else self.get_stored_name(model_instance)
+            file.name = MediaBlob.objects.attach(file.file, file.storage)
+            file._committed = True
+        elif not file and not add and model_instance.__dict__.get(self.loaded_attname):
+            previous = self.get_stored_name(model_instance)
         else:
             return super().pre_save(model_instance, add)
+        # the same content attached again is counted twice, so the previous reference is always dropped
+        MediaBlob.objects.release_on_commit(previous, file.storage)
+        model_instance.__dict__[self.loaded_attname] = file.name or None
+        return file
+
+
+class ContentAddressedFileField(ContentAddressedFileMixin, models.FileField):
+    pass
+
+
+class ContentAddressedImageField(ContentAddressedFileMixin, models.ImageField):
+    pass
@@ -0,0 +1,119 @@
+import math
+import re
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.db.models import Q
+
+from core import settings
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+GRID_COLUMNS = math.ceil(360 / settings.GEO_CELL_SIZE)
+
+COORDINATES = re.compile(r'^\s*([-+]?\d+(?:\.\d+)?)\s*[,\s]\s*([-+]?\d+(?:\.\d+)?)\s*$')
+
+
+def parse_geolocation(value):
+    # "lat, lon" strings as stored by the serializers, None when unusable
+    match = COORDINATES.match(value or '')
+    if match is None:
+        return None
+    try:
+        lat, lon = Decimal(match.group(1)), Decimal(match.group(2))
+    except InvalidOperation:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat.quantize(Decimal('0.000001')), lon.quantize(Decimal('0.000001'))
+
+
+def get_row(lat):
+    return min(int((float(lat) + 90) // settings.GEO_CELL_SIZE), math.ceil(180 / settings.GEO_CELL_SIZE) - 1)
+
+
+def get_column(lon):
+    return min(int((float(lon) + 180) // settings.GEO_CELL_SIZE), GRID_COLUMNS - 1)
+
+
+def get_cell(lat, lon):
+    return get_row(lat) * GRID_COLUMNS + get_column(lon)
+
+
+def set_coordinates(instance):
+    coordinates = parse_geolocation(instance.geolocation)
+    if coordinates is None:
+        instance.latitude = instance.longitude = instance.geocell = None
+    else:
+        instance.latitude, instance.longitude = coordinates
+        instance.geocell = get_cell(*coordinates)
+
+
+def get_bounding_box(lat, lon, radius):
+    lat_delta = radius / KM_PER_DEGREE
+    min_lat, max_lat = max(lat - lat_delta, -90), min(lat + lat_delta, 90)
+    if min_lat == -90 or max_lat == 90:
+        return min_lat, max_lat, -180, 180
+    lon_delta = radius / (KM_PER_DEGREE * math.cos(math.radians(max(abs(min_lat), abs(max_lat)))))
+    if lon_delta >= 180:
+        return min_lat, max_lat, -180, 180
+    return min_lat, max_lat, lon - lon_delta, lon + lon_delta
+
+
+def filter_bounding_box(queryset, lat, lon, radius):
+    # grid cells narrow the scan through the geocell index, the coordinates make the box exact
+    min_lat, max_lat, min_lon, max_lon = get_bounding_box(lat, lon, radius)
+    queryset = queryset.filter(latitude__gte=min_lat, latitude__lte=max_lat)
+    rows = range(get_row(min_lat), get_row(max_lat) + 1)
+    if min_lon < -180 or max_lon > 180:
+        # the box crosses the antimeridian, it is split into its western and eastern part
+        west, east = (min_lon + 360, max_lon) if min_lon < -180 else (min_lon, max_lon - 360)
+        columns = [*range(get_column(west), GRID_COLUMNS), *range(0, get_column(east) + 1)]
+        queryset = queryset.filter(Q(longitude__gte=west) | Q(longitude__lte=east))
+    else:
+        columns = range(get_column(min_lon), get_column(max_lon) + 1)
+        queryset = queryset.filter(longitude__gte=min_lon, longitude__lte=max_lon)
+    if len(rows) * len(columns) <= settings.GEO_MAX_CELLS:
+        queryset = queryset.filter(geocell__in=[row * GRID_COLUMNS + column for row in rows for column in columns])
+    return queryset
+
+
+def haversine(lat, lon, lats, lons):
+    lat, lon = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def nearest(queryset, lat, lon, radius, limit=None):
+    # [(pk, distance in km)] inside radius, closest first
+    rows = list(filter_bounding_box(queryset, lat, lon, radius).values_list('pk', 'latitude', 'longitude'))
+    if not rows:
+        return []
+    pks, lats, lons = zip(*rows)
+    distances = haversine(lat, lon, np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+    inside = np.flatnonzero(distances <= radius)
+    order = inside[np.argsort(distances[inside], kind='stable')][:limit]
+    return [(pks[i], round(float(distances[i]), 3)) for i in order]
+
+
+def get_point(request):
+    # lat and lon query parameters, or the requesting user's own location
+    lat, lon = request.query_params.get('lat'), request.query_params.get('lon')
+    if lat is not None or lon is not None:
+        point = parse_geolocation(f"{lat},{lon}")
+    elif request.user.is_authenticated:
+        point = parse_geolocation(request.user.geolocation)
+    else:
+        point = None
+    return (float(point[0]), float(point[1])) if point is not None else None
+
+
+def get_radius(request):
+    try:
+        radius = float(request.query_params.get('radius', settings.NEARBY_RADIUS))
+    except ValueError:
+        return None
+    if not 0 < radius <= settings.NEARBY_MAX_RADIUS:
+        return None
+    return radius
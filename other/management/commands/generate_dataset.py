@@ -0,0 +1,61 @@
+import os
+import time
+from datetime import datetime, timezone
+
+from django.core.management import BaseCommand, CommandError, call_command
+
+from other import dataset
+
+COUNTS = {
+    'users': 100000,
+    'brands': 2000,
+    'products': 200000,
+    'likes': 2000000,
+    'ratings': 400000,
+    'follows': 1000000,
+    'contacts': 300000,
+    'comments': 200000,
+}
+
+
+class Command(BaseCommand):
+    help = 'Generates a seeded synthetic dataset of users, brands, products and their interactions'
+
+    def add_arguments(self, parser):
+        for name, count in COUNTS.items():
+            parser.add_argument(f'--{name}', type=int, default=count)
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiplies every count')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--days', type=int, default=365, help='Period the creation times are spread over')
+        parser.add_argument('--end', type=str, default=None,
+                            help='Date the period ends on as YYYY-MM-DD, today by default; fix it to reproduce a seed')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=20000)
+        parser.add_argument('--skip-redis', action='store_true', help='Leave counters, sets and indexes unbuilt')
+
+    def handle(self, *args, **options):
+        counts = {name: int(options[name] * options['scale']) for name in COUNTS}
+        if not counts['users'] or not counts['brands'] or not counts['products']:
+            raise CommandError("At least one user, brand and product is needed")
+        if counts['brands'] > counts['users']:
+            raise CommandError("Every brand needs its own owner, so there can not be more brands than users")
+        try:
+            end = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else datetime.utcnow().date()
+        except ValueError:
+            raise CommandError("--end must be a date as YYYY-MM-DD")
+        dataset.ensure_catalog()
+        plan = dataset.Plan(options['seed'], counts, options['days'],
+                            datetime.combine(end, datetime.min.time(), tzinfo=timezone.utc))
+        started = time.monotonic()
+
+        def log(name, rows):
+            self.stdout.write(f"{name}: {rows} rows ({time.monotonic() - started:.0f}s)")
+
+        dataset.generate(plan, options['workers'], options['chunk_size'], log)
+        if not options['skip_redis']:
+            # bulk rows skip the signals, so everything they keep in redis is rebuilt once at the end
+            dataset.write_counters()
+            for command in ('rebuild_follow_sets', 'rebuild_search_index', 'rebuild_brand_directory',
+                            'rebuild_comment_threads'):
+                call_command(command, stdout=self.stdout)
+        self.stdout.write(f"Dataset generated in {time.monotonic() - started:.0f}s")
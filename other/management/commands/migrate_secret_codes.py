@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from core import settings
+from other import otp
+from other.models import RegisterSecretCode
+
+
+class Command(BaseCommand):
+    help = 'Moves unexpired RegisterSecretCode rows into the Redis code store and purges the table'
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        migrated, seen = 0, set()
+        # newest first, so only the latest code per recipient is kept, as the views did
+        for code in RegisterSecretCode.objects.order_by('-created_at').iterator():
+            ttl = settings.OTP_TTL - int((now - code.created_at).total_seconds())
+            if code.type == 'brand':
+                purpose, data = otp.BRAND, {'title': code.title}
+            elif code.password:
+                purpose, data = otp.REGISTER, {'username': code.username, 'password': code.password}
+            else:
+                purpose, data = otp.RESET, {'username': code.username}
+            if ttl <= 0 or not code.phone_or_email or (purpose, code.phone_or_email) in seen:
+                continue
+            seen.add((purpose, code.phone_or_email))
+            otp.set_code(purpose, code.phone_or_email, code.secret_code, ttl=ttl, **data)
+            migrated += 1
+        deleted, _ = RegisterSecretCode.objects.all().delete()
+        self.stdout.write(f"Migrated {migrated} codes, deleted {deleted} rows")
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from other.notifications import deliver_pending, wait_for_notifications
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued SMS and email notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the outbox and exit')
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            delivered = deliver_pending(batch_size)
+            if delivered:
+                self.stdout.write(f"Processed {delivered} notifications")
+            if delivered == batch_size:
+                continue
+            if options['once']:
+                break
+            wait_for_notifications(settings.NOTIFICATION_POLL_INTERVAL)
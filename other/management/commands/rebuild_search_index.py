@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand, CommandError
+
+from accounts import signals as accounts_signals
+from accounts.models import User
+from brand import signals as brand_signals
+from brand.models import Brand
+from other import search
+
+INDEXES = {
+    accounts_signals.SEARCH_INDEX: (lambda: User.objects.filter(is_active=True), accounts_signals.index_user),
+    brand_signals.SEARCH_INDEX: (lambda: Brand.objects.filter(is_active=True), brand_signals.index_brand),
+}
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the redis autocomplete indexes from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('indexes', nargs='*', help=f"Indexes to rebuild, one of {', '.join(INDEXES)}; all by default")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        unknown = set(options['indexes']) - set(INDEXES)
+        if unknown:
+            raise CommandError(f"Unknown indexes: {', '.join(sorted(unknown))}")
+        for index in options['indexes'] or INDEXES:
+            get_queryset, index_object = INDEXES[index]
+            search.clear_index(index)
+            indexed = 0
+            for instance in get_queryset().iterator(chunk_size=options['batch_size']):
+                index_object(instance)
+                indexed += 1
+            self.stdout.write(f"Indexed {indexed} objects into {search.get_index_key(index)}")
@@ -0,0 +1,44 @@
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Runs a local SMS gateway stub that accepts and prints outgoing messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8025)
+        parser.add_argument('--delay', type=float, default=0, help='Seconds to wait before answering')
+        parser.add_argument('--fail-rate', type=float, default=0, help='Share of requests answered with 503')
+
+    def handle(self, *args, **options):
+        stdout, delay, fail_rate = self.stdout, options['delay'], options['fail_rate']
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = {key: value[0] for key, value in parse_qs(self.rfile.read(length).decode()).items()}
+                time.sleep(delay)
+                failed = random.random() < fail_rate
+                stdout.write(f"{'FAIL' if failed else 'SENT'} {payload.get('mobile_phone')}: {payload.get('message')}")
+                body = json.dumps({'status': 'error' if failed else 'waiting'}).encode()
+                self.send_response(503 if failed else 200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), Handler)
+        self.stdout.write(f"SMS stub gateway listening on http://127.0.0.1:{options['port']}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from accounts.models import User
+from brand.models import Brand
+from other import geo
+
+
+class Command(BaseCommand):
+    help = 'Parses geolocation strings of users and brands into their latitude, longitude and geocell columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model in (User, Brand):
+            batch, updated = [], 0
+            for instance in model.objects.only('pk', 'geolocation').iterator(chunk_size=options['batch_size']):
+                geo.set_coordinates(instance)
+                batch.append(instance)
+                if len(batch) >= options['batch_size']:
+                    updated += model.objects.bulk_update(batch, ['latitude', 'longitude', 'geocell']) or len(batch)
+                    batch = []
+            if batch:
+                updated += model.objects.bulk_update(batch, ['latitude', 'longitude', 'geocell']) or len(batch)
+            self.stdout.write(f"Updated coordinates of {updated} {model._meta.verbose_name_plural}")
@@ -1,12 +1,16 @@
+import hashlib
 import secrets
 import uuid
 
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.core.files import File
+from django.db import models, router, transaction
+from django.db.models import F, prefetch_related_objects
+from django.utils import timezone
 from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
 
-from other.fields import OrderField
+from other.fields import OrderField, OrderedQuerySet
 from other.validators import UsernameValidator, TitleValidator
 
 
@@ -26,6 +30,111 @@ class RegisterSecretCode(models.Model):
         return f"{self.type} - {self.phone_or_email} - {self.secret_code}"
 
 
+def get_blob_path(key, filename):
+    ext = filename.split('.')[-1].lower()
+    return f'blobs/{key[:2]}/{key}.{ext}'
+
+
+class HashingFile(File):
+    # digests whatever storage reads, a rewind starts over
+
+    def __init__(self, file):
+        super().__init__(file, name=file.name)
+        self.sha256 = hashlib.sha256()
+
+    def read(self, *args, **kwargs):
+        data = self.file.read(*args, **kwargs)
+        self.sha256.update(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if offset == 0 and whence == 0:
+            self.sha256 = hashlib.sha256()
+        return self.file.seek(offset, whence)
+
+
+class MediaBlobManager(models.Manager):
+
+    def attach(self, file, storage):
+        # the upload is read once, hashed while it streams to storage under a name of its own
+        content = HashingFile(file)
+        name = storage.save(get_blob_path(secrets.token_hex(16), file.name), content)
+        blob, created = self.get_or_create(sha256=content.sha256.hexdigest(),
+                                           defaults={'name': name, 'size': content.size, 'ref_count': 1})
+        if not created:
+            # known content keeps its first copy, the one just written is dropped
+            self.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+            storage.delete(name)
+        return blob.name
+
+    def release(self, name, storage):
+        if not name:
+            return
+        with transaction.atomic(using=self.db):
+            blob = self.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+            if blob.ref_count > 1:
+                self.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+                return
+            blob.delete()
+        storage.delete(name)
+
+    def release_on_commit(self, name, storage):
+        # a rolled back delete or replace keeps referencing the blob
+        if name:
+            transaction.on_commit(lambda: self.release(name, storage), using=self.db)
+
+
+class MediaBlob(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=200, unique=True)
+    size = models.PositiveIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = MediaBlobManager()
+
+    class Meta:
+        ordering = ('-pk',)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+class Notification(models.Model):
+
+    class Channel(models.TextChoices):
+        SMS = 'sms', _('SMS')
+        EMAIL = 'email', _('Email')
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        SENDING = 'sending', _('Sending')
+        SENT = 'sent', _('Sent')
+        FAILED = 'failed', _('Failed')
+
+    channel = models.CharField(max_length=10, choices=Channel.choices)
+    recipient = models.CharField(max_length=100)
+    sender = models.CharField(max_length=100, blank=True)
+    subject = models.CharField(max_length=200, blank=True)
+    body = models.TextField()
+    html = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ('-pk',)
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.channel} - {self.recipient} - {self.status}"
+
+
 def get_upload_path(instance, filename):
     ext = filename.split('.')[-1]
     brand = instance.brand.slug.lower()
@@ -95,14 +204,20 @@ class Category(models.Model):
     order = OrderField(blank=True, start=1)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    objects = OrderedQuerySet.as_manager()
+
     class Meta:
         ordering = ('order',)
         verbose_name = _('category')
         verbose_name_plural = _('categories')
 
-    def save(self, *args, **kwargs):
+    def prepare_save(self):
         self.slug = slugify(self.name.lower(), allow_unicode=True)
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.prepare_save()
+        with transaction.atomic(using=router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -118,14 +233,20 @@ class SubCategory(models.Model):
     order = OrderField(for_fields=['parent', 'type'], start=1, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    objects = OrderedQuerySet.as_manager()
+
     class Meta:
         ordering = ('order',)
         verbose_name = _('sub category')
         verbose_name_plural = _('sub categories')
 
-    def save(self, *args, **kwargs):
+    def prepare_save(self):
         self.slug = slugify(self.name.lower(), allow_unicode=True)
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.prepare_save()
+        with transaction.atomic(using=router.db_for_write(type(self), instance=self)):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -149,18 +270,54 @@ class Tag(models.Model):
         return self.name
 
 
+class CommentManager(models.Manager):
+
+    def first_replies(self, root_ids, limit):
+        # the first replies of every thread in one query, oldest first within a thread
+        if not root_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(root_ids))
+        replies = list(self.raw(
+            f"SELECT * FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY root_id ORDER BY created_at, id) AS position "
+            f"FROM {self.model._meta.db_table} WHERE is_active AND root_id IN ({placeholders})) AS replies "
+            f"WHERE position <= %s ORDER BY root_id, position", [*root_ids, limit]))
+        prefetch_related_objects(replies, 'user')
+        return replies
+
+
 class Comment(models.Model):
     uuid = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey("accounts.User", on_delete=models.CASCADE, related_name='my_comments')
     text = models.CharField(max_length=1000)
     used_to = models.ForeignKey("product.Product", on_delete=models.CASCADE, related_name='comments')
     parent = models.ForeignKey("self", on_delete=models.SET_NULL, blank=True, null=True)
+    # top-level comment of the thread, null for the top-level comment itself; replies of a removed thread stay as
+    # threads of their own, like replies of a removed parent
+    root = models.ForeignKey("self", on_delete=models.SET_NULL, blank=True, null=True, related_name='replies')
     is_active = models.BooleanField(default=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommentManager()
+
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['used_to', 'root', 'is_active', '-created_at']),
+            models.Index(fields=['root', 'is_active', 'created_at']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the comment counters move on is_active transitions, None when is_active was deferred
+        instance.stored_is_active = instance.__dict__.get('is_active')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.parent_id is not None and self.root_id is None:
+            self.root_id = self.parent.root_id or self.parent_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user} commented to {self.used_to}"
@@ -0,0 +1,148 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django_redis import get_redis_connection
+from requests.adapters import HTTPAdapter
+
+from core import settings
+from other.models import Notification
+
+r = get_redis_connection("default")
+
+WAKEUP_KEY = 'notification:wakeup'
+
+_session = None
+
+
+def get_sms_session():
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.headers.update(settings.SMS_headers)
+        _session.mount('http://', HTTPAdapter(pool_maxsize=settings.NOTIFICATION_SMS_CONCURRENCY))
+        _session.mount('https://', HTTPAdapter(pool_maxsize=settings.NOTIFICATION_SMS_CONCURRENCY))
+    return _session
+
+
+def _wakeup():
+    r.rpush(WAKEUP_KEY, 1)
+
+
+def enqueue(channel, recipient, body, **kwargs):
+    notification = Notification.objects.create(channel=channel, recipient=recipient, body=body, **kwargs)
+    transaction.on_commit(_wakeup)
+    return notification
+
+
+def enqueue_sms(phone_number, message):
+    return enqueue(Notification.Channel.SMS, f"998{phone_number}", message)
+
+
+def enqueue_email(to, subject, text_content, html_content='', from_email=''):
+    return enqueue(Notification.Channel.EMAIL, to, text_content, subject=subject, html=html_content,
+                   sender=from_email)
+
+
+def wait_for_notifications(timeout):
+    if r.blpop(WAKEUP_KEY, timeout=timeout):
+        r.delete(WAKEUP_KEY)
+
+
+def send_sms(notification):
+    payload = {'mobile_phone': notification.recipient,
+               'message': notification.body,
+               'from': settings.SMS_FROM,
+               'callback_url': settings.SMS_CALLBACK_URL}
+    response = get_sms_session().post(settings.SMS_url, data=payload, timeout=settings.SMS_TIMEOUT)
+    response.raise_for_status()
+
+
+def send_email(notification, connection):
+    msg = EmailMultiAlternatives(notification.subject, notification.body, notification.sender or None,
+                                 [notification.recipient], connection=connection)
+    if notification.html:
+        msg.attach_alternative(notification.html, "text/html")
+    msg.send()
+
+
+def _finish(notification, error):
+    now = timezone.now()
+    if error is None:
+        notification.status = Notification.Status.SENT
+        notification.sent_at = now
+        notification.last_error = ''
+    else:
+        notification.last_error = str(error)[:1000]
+        if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+            notification.status = Notification.Status.FAILED
+        else:
+            delay = settings.NOTIFICATION_RETRY_DELAY * 2 ** (notification.attempts - 1)
+            notification.status = Notification.Status.PENDING
+            notification.next_attempt_at = now + datetime.timedelta(seconds=delay)
+    notification.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+
+
+def claim(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        # skip_locked lets several workers claim disjoint batches, next_attempt_at doubles as the lease
+        # so the batch of a crashed worker is claimed again once it runs out
+        notifications = list(Notification.objects.select_for_update(skip_locked=True)
+                             .filter(status__in=[Notification.Status.PENDING, Notification.Status.SENDING],
+                                     next_attempt_at__lte=now)
+                             .order_by('next_attempt_at', 'pk')[:batch_size])
+        # the attempt is counted when it starts, so a worker dying mid-send still uses it up
+        exhausted = [notification.pk for notification in notifications
+                     if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS]
+        Notification.objects.filter(pk__in=exhausted) \
+            .update(status=Notification.Status.FAILED, last_error='Lease expired on the last attempt')
+        notifications = [notification for notification in notifications if notification.pk not in exhausted]
+        Notification.objects.filter(pk__in=[notification.pk for notification in notifications]) \
+            .update(status=Notification.Status.SENDING, attempts=F('attempts') + 1,
+                    next_attempt_at=now + datetime.timedelta(seconds=settings.NOTIFICATION_LEASE))
+    for notification in notifications:
+        notification.attempts += 1
+    return notifications
+
+
+def send_emails(notifications):
+    # one SMTP connection for the whole batch
+    connection = None
+    try:
+        for notification in notifications:
+            try:
+                if connection is None:
+                    connection = get_connection()
+                    connection.open()
+                send_email(notification, connection)
+            except Exception as e:
+                # a broken connection would fail the rest of the batch, the next email opens a new one
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                _finish(notification, e)
+            else:
+                _finish(notification, None)
+    finally:
+        if connection is not None:
+            connection.close()
+
+
+def deliver_pending(batch_size=None):
+    # rows are claimed and committed before sending, each one is marked as soon as its send returns
+    notifications = claim(batch_size or settings.NOTIFICATION_BATCH_SIZE)
+    if not notifications:
+        return 0
+    sms = [notification for notification in notifications if notification.channel == Notification.Channel.SMS]
+    emails = [notification for notification in notifications if notification.channel != Notification.Channel.SMS]
+    with ThreadPoolExecutor(max_workers=settings.NOTIFICATION_SMS_CONCURRENCY) as executor:
+        futures = {executor.submit(send_sms, notification): notification for notification in sms}
+        send_emails(emails)
+        for future in as_completed(futures):
+            _finish(futures[future], future.exception())
+    return len(notifications)
@@ -0,0 +1,76 @@
+import secrets
+
+from django_redis import get_redis_connection
+
+from core import settings
+
+r = get_redis_connection("default")
+
+# Code is compared and consumed in one round trip, so two requests can not both use it;
+# a check without ARGV[3] leaves a correct code in place to be consumed once the request succeeded
+VERIFY_SCRIPT = r.register_script("""
+local code = redis.call('HGET', KEYS[1], 'code')
+if not code then
+    return {}
+end
+if code == ARGV[1] then
+    local data = redis.call('HGETALL', KEYS[1])
+    if ARGV[3] == '1' then
+        redis.call('DEL', KEYS[1])
+    end
+    return data
+end
+if redis.call('HINCRBY', KEYS[1], 'attempts', 1) >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+end
+return {}
+""")
+
+REGISTER = 'register'
+RESET = 'reset'
+BRAND = 'brand'
+
+
+def get_key(purpose, phone_or_email):
+    return f"otp:{purpose}:{str(phone_or_email).strip().lower()}"
+
+
+def _decode(values):
+    data = {}
+    for i in range(0, len(values), 2):
+        field = values[i].decode()
+        if field not in ('code', 'attempts'):
+            data[field] = values[i + 1].decode()
+    return data
+
+
+def set_code(purpose, phone_or_email, code, ttl=None, **data):
+    key = get_key(purpose, phone_or_email)
+    mapping = {'code': code, 'attempts': 0}
+    mapping.update({field: value for field, value in data.items() if value is not None})
+    pipe = r.pipeline()
+    pipe.delete(key)
+    pipe.hset(key, mapping=mapping)
+    pipe.expire(key, ttl or settings.OTP_TTL)
+    pipe.execute()
+
+
+def issue_code(purpose, phone_or_email, **data):
+    code = f"{secrets.randbelow(10 ** 6):06d}"
+    set_code(purpose, phone_or_email, code, **data)
+    return code
+
+
+def get_code_data(purpose, phone_or_email):
+    values = r.hgetall(get_key(purpose, phone_or_email))
+    if not values:
+        return None
+    return _decode([item for pair in values.items() for item in pair])
+
+
+def verify_code(purpose, phone_or_email, code, consume=True):
+    values = VERIFY_SCRIPT(keys=[get_key(purpose, phone_or_email)],
+                           args=[str(code).strip(), settings.OTP_MAX_ATTEMPTS, 1 if consume else 0])
+    if not values:
+        return None
+    return _decode(values)
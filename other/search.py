@@ -0,0 +1,170 @@
+import unicodedata
+
+from django_redis import get_redis_connection
+
+from core import settings
+
+r = get_redis_connection("default")
+
+SEPARATOR = '\x00'
+TERM = 'term'
+PREFIX = 'prefix'
+SIGNATURE = 'signature'
+WEIGHT_SCALE = 10 ** 9
+
+
+def get_index_key(index):
+    return f"search:{index}"
+
+
+def get_terms_key(index, pk):
+    return f"search:{index}:{pk}"
+
+
+def get_rank_key(index, kind, value):
+    return f"search:{index}:{kind}:{value}"
+
+
+def get_lex_key(index):
+    return f"search:{index}:lex"
+
+
+def get_lex_member(term, pk):
+    return f"{term}{SEPARATOR}{pk}"
+
+
+def normalize(value):
+    value = unicodedata.normalize('NFKC', str(value or '')).replace(SEPARATOR, '').casefold()
+    return ' '.join(value.split())
+
+
+def get_terms(values):
+    # every phrase is indexed whole and word by word, keeping the best weight of a term
+    terms = {}
+    for value, weight in values:
+        phrase = normalize(value)
+        if not phrase:
+            continue
+        for term in {phrase, *phrase.split()}:
+            terms[term] = max(terms.get(term, 0), weight)
+    return terms
+
+
+def get_entries(terms):
+    # rank sets an object is in, with the best weight it has there: one per term and one per term prefix
+    entries = {}
+    for term, weight in terms.items():
+        entries[f"{TERM}{SEPARATOR}{term}"] = weight
+        for length in range(1, min(len(term), settings.SEARCH_PREFIX_LENGTH) + 1):
+            field = f"{PREFIX}{SEPARATOR}{term[:length]}"
+            entries[field] = max(entries.get(field, 0), weight)
+    return entries
+
+
+def get_score(weight, popularity):
+    # weight first, popularity breaks ties, so the best candidates of a set are simply its top members
+    return int(weight) * WEIGHT_SCALE + min(int(popularity), WEIGHT_SCALE - 1)
+
+
+def get_rank_keys(index, fields):
+    return [get_rank_key(index, *field.split(SEPARATOR, 1)) for field in fields]
+
+
+def get_lex_members(pk, fields):
+    # every indexed term is also in the lex set, where queries longer than the ranked prefixes are ranged
+    return [get_lex_member(field.split(SEPARATOR, 1)[1], pk) for field in fields
+            if field.startswith(f"{TERM}{SEPARATOR}")]
+
+
+def index_object(index, pk, values, popularity=0):
+    signature = SEPARATOR.join(f"{normalize(value)}{SEPARATOR}{weight}" for value, weight in values)
+    terms_key = get_terms_key(index, pk)
+    if r.hget(terms_key, SIGNATURE) == signature.encode():
+        return
+    old_fields = [field.decode() for field in r.hkeys(terms_key) if field != SIGNATURE.encode()]
+    entries = get_entries(get_terms(values))
+    removed = set(old_fields) - set(entries)
+    pipe = r.pipeline()
+    for key in get_rank_keys(index, removed):
+        pipe.zrem(key, pk)
+    lex_members = get_lex_members(pk, removed)
+    if lex_members:
+        pipe.zrem(get_lex_key(index), *lex_members)
+    pipe.delete(terms_key)
+    if entries:
+        for key, weight in zip(get_rank_keys(index, entries), entries.values()):
+            pipe.zadd(key, {pk: get_score(weight, popularity)})
+        pipe.zadd(get_lex_key(index), dict.fromkeys(get_lex_members(pk, entries), 0))
+        pipe.hset(terms_key, mapping={SIGNATURE: signature, **entries})
+    pipe.execute()
+
+
+def set_popularity(index, pk, popularity):
+    entries = {field.decode(): weight for field, weight in r.hgetall(get_terms_key(index, pk)).items()
+               if field != SIGNATURE.encode()}
+    if not entries:
+        return
+    pipe = r.pipeline(transaction=False)
+    for key, weight in zip(get_rank_keys(index, entries), entries.values()):
+        pipe.zadd(key, {pk: get_score(weight, popularity)}, xx=True)
+    pipe.execute()
+
+
+def remove_object(index, pk):
+    fields = [field.decode() for field in r.hkeys(get_terms_key(index, pk)) if field != SIGNATURE.encode()]
+    pipe = r.pipeline()
+    for key in get_rank_keys(index, fields):
+        pipe.zrem(key, pk)
+    lex_members = get_lex_members(pk, fields)
+    if lex_members:
+        pipe.zrem(get_lex_key(index), *lex_members)
+    pipe.delete(get_terms_key(index, pk))
+    pipe.execute()
+
+
+def clear_index(index):
+    cursor = 0
+    while True:
+        cursor, keys = r.scan(cursor, match=f"{get_index_key(index)}:*", count=1000)
+        if keys:
+            r.delete(*keys)
+        if not cursor:
+            break
+
+
+def get_lex_candidates(index, query):
+    # terms starting with the whole query and their scores; a query this long matches few terms
+    start = query.encode()
+    members = r.zrangebylex(get_lex_key(index), b'[' + start, b'[' + start + b'\xff',
+                            start=0, num=settings.SEARCH_LEX_CANDIDATES)
+    members = [member.decode().rsplit(SEPARATOR, 1) for member in members]
+    pipe = r.pipeline(transaction=False)
+    for term, pk in members:
+        pipe.zscore(get_rank_key(index, TERM, term), pk)
+    return [(pk, score) for (term, pk), score in zip(members, pipe.execute()) if score is not None]
+
+
+def search(index, query):
+    # short queries read the ranked prefix set, longer ones range the lex set over the whole query
+    query = normalize(query)
+    if not query:
+        return []
+    limit = settings.SEARCH_MAX_RESULTS
+    pipe = r.pipeline(transaction=False)
+    pipe.zrevrange(get_rank_key(index, TERM, query), 0, limit - 1, withscores=True)
+    if len(query) <= settings.SEARCH_PREFIX_LENGTH:
+        pipe.zrevrange(get_rank_key(index, PREFIX, query), 0, limit - 1, withscores=True)
+        exact, prefixed = pipe.execute()
+    else:
+        exact, = pipe.execute()
+        prefixed = get_lex_candidates(index, query)
+    # both sets are ordered by weight and popularity, the union of their tops holds the best results
+    ranks = {}
+    for members, bonus in ((exact, settings.SEARCH_EXACT_BONUS), (prefixed, 0)):
+        for pk, score in members:
+            weight, popularity = divmod(int(score), WEIGHT_SCALE)
+            rank = (weight + bonus, popularity)
+            pk = int(pk)
+            ranks[pk] = max(ranks.get(pk, rank), rank)
+    pks = sorted(ranks, key=lambda pk: (-ranks[pk][0], -ranks[pk][1], pk))
+    return pks[:limit]
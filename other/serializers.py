@@ -3,24 +3,11 @@ from rest_framework.generics import get_object_or_404
 
 from accounts.export_serializers import UserSerializer
 from brand.export_serializers import BrandExportSerializer
+from .dynamic_serializers import DynamicFieldsModelSerializer
 from .models import City, Category, SubCategory, Tag, Comment, Color, Size, Type, Banner
 from .validators import NameValidator, validate_name, PhoneNumberValidator, TitleValidator
 
 
-class DynamicFieldsModelSerializer(serializers.ModelSerializer):
-
-    def __init__(self, *args, **kwargs):
-        fields = kwargs.pop('fields', None)
-
-        super(DynamicFieldsModelSerializer, self).__init__(*args, **kwargs)
-
-        if fields is not None:
-            allowed = set(fields)
-            existing = set(self.fields.keys())
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
-
-
 class CitySerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = City
@@ -104,6 +91,7 @@ class CommentSerializer(DynamicFieldsModelSerializer):
             "uuid": {'read_only': True},
             "used_to": {'read_only': True},
             "parent": {'read_only': True},
+            "root": {'read_only': True},
             "is_active": {'read_only': True},
             "created_at": {'format': '%Y-%m-%d %H:%M:%S'},
             "updated_at": {'format': '%Y-%m-%d %H:%M:%S'},
@@ -0,0 +1,93 @@
+import datetime
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from core import settings
+from other import notifications
+from other.models import Notification
+
+
+def create_sms(**kwargs):
+    return Notification.objects.create(channel=Notification.Channel.SMS, recipient='998901234567', body='code',
+                                       **kwargs)
+
+
+def create_email(**kwargs):
+    return Notification.objects.create(channel=Notification.Channel.EMAIL, recipient='user@example.com',
+                                       subject='subject', body='body', **kwargs)
+
+
+class ClaimTests(TestCase):
+
+    def test_claim_counts_the_attempt_and_leases_the_row(self):
+        notification = create_sms()
+        claimed = notifications.claim(10)
+        notification.refresh_from_db()
+        self.assertEqual([row.pk for row in claimed], [notification.pk])
+        self.assertEqual(notification.status, Notification.Status.SENDING)
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+
+    def test_leased_row_is_not_claimed_again(self):
+        create_sms()
+        notifications.claim(10)
+        self.assertEqual(notifications.claim(10), [])
+
+    def test_expired_lease_is_claimed_again_with_a_new_attempt(self):
+        notification = create_sms()
+        notifications.claim(10)
+        Notification.objects.filter(pk=notification.pk) \
+            .update(next_attempt_at=timezone.now() - datetime.timedelta(seconds=1))
+        claimed = notifications.claim(10)
+        self.assertEqual([row.attempts for row in claimed], [2])
+
+    def test_expired_lease_on_the_last_attempt_fails_the_row(self):
+        notification = create_sms(status=Notification.Status.SENDING, attempts=settings.NOTIFICATION_MAX_ATTEMPTS)
+        self.assertEqual(notifications.claim(10), [])
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.Status.FAILED)
+
+
+class DeliveryTests(TestCase):
+
+    def test_sent_row_is_marked_sent(self):
+        notification = create_sms()
+        with mock.patch.object(notifications, 'send_sms'):
+            self.assertEqual(notifications.deliver_pending(), 1)
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.Status.SENT)
+        self.assertEqual(notification.attempts, 1)
+
+    def test_failed_send_is_retried_with_backoff(self):
+        notification = create_sms()
+        with mock.patch.object(notifications, 'send_sms', side_effect=RuntimeError('gateway down')):
+            notifications.deliver_pending()
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.Status.PENDING)
+        self.assertEqual(notification.last_error, 'gateway down')
+        self.assertGreater(notification.next_attempt_at,
+                           timezone.now() + datetime.timedelta(seconds=settings.NOTIFICATION_RETRY_DELAY - 5))
+
+    def test_failed_send_on_the_last_attempt_fails_the_row(self):
+        notification = create_sms(attempts=settings.NOTIFICATION_MAX_ATTEMPTS - 1)
+        with mock.patch.object(notifications, 'send_sms', side_effect=RuntimeError('gateway down')):
+            notifications.deliver_pending()
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.Status.FAILED)
+        self.assertEqual(notification.attempts, settings.NOTIFICATION_MAX_ATTEMPTS)
+
+    def test_failed_email_reopens_the_connection(self):
+        first, second = create_email(), create_email()
+        connections = [mock.Mock(), mock.Mock()]
+        sent = mock.Mock(side_effect=[RuntimeError('connection dropped'), None])
+        with mock.patch.object(notifications, 'get_connection', side_effect=connections), \
+                mock.patch.object(notifications, 'send_email', sent):
+            notifications.deliver_pending()
+        self.assertEqual([call.args[1] for call in sent.call_args_list], connections)
+        connections[0].close.assert_called_once()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, Notification.Status.PENDING)
+        self.assertEqual(second.status, Notification.Status.SENT)
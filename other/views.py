@@ -17,7 +17,7 @@ class MainCategoryListAPI(APIView):
     @staticmethod
     def get(request):
         fields = ['id', 'name', 'slug', 'children']
-        categories = Category.objects.all()
+        categories = Category.objects.prefetch_related('children__type')
         serializer = CategorySerializer(categories, many=True, fields=fields)
         return Response({
             'success': True,
@@ -30,7 +30,7 @@ class SubCategoryListAPI(APIView):
     @staticmethod
     def get(request, main_category_slug):
         fields = ['id', 'name', 'parent', 'slug', 'type']
-        categories = SubCategory.objects.filter(parent__slug=main_category_slug)
+        categories = SubCategory.objects.filter(parent__slug=main_category_slug).select_related('type')
         serializer = SubCategorySerializer(categories, many=True, fields=fields)
         return Response({
             'success': True,
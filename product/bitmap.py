@@ -0,0 +1,332 @@
+import contextlib
+import threading
+import time
+
+import numpy as np
+from django.db import Error as DatabaseError, connections
+from django.db.models import Q
+from django_redis import get_redis_connection
+
+from brand.models import Brand
+from core import settings
+from .models import Product
+
+r = get_redis_connection("default")
+
+STREAM_KEY = 'products:changes'
+ACTIVE = ('active', 'true')
+# query parameters resolved from bitmaps, values of one parameter are ORed and parameters ANDed
+DIMENSIONS = ['color', 'category', 'type', 'brand', 'own_category', 'is_sale', 'city']
+CONTAINS = ['brand']
+# matched like the SQL filters, brand with icontains and own_category with iexact, the rest exactly
+CASE_INSENSITIVE = ['brand', 'own_category']
+# a value per brand would cost a full bitset each, these keep sorted ordinal arrays instead
+SPARSE = ['brand', 'own_category']
+BOOLEANS = {'true': 'true', '1': 'true', 'false': 'false', '0': 'false'}
+# stream fields and the products each of them points at
+CHANGES = {
+    'product': lambda pks: Q(pk__in=pks),
+    'brand': lambda pks: Q(brand_id__in=pks),
+    'category': lambda pks: Q(category_id__in=pks),
+    'type': lambda pks: Q(type_id__in=pks),
+    'own_category': lambda pks: Q(own_category_id__in=pks),
+    'color': lambda pks: Q(pk__in=Product.color.through.objects.filter(color_id__in=pks).values('product_id')),
+}
+# set bits of every byte value
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def publish(kind, *pks):
+    pipeline = r.pipeline(transaction=False)
+    for pk in pks:
+        pipeline.xadd(STREAM_KEY, {kind: pk}, maxlen=settings.BITMAP_STREAM_LENGTH, approximate=True)
+    pipeline.execute()
+
+
+def normalize(dimension, value):
+    value = str(value).strip()
+    return value.lower() if dimension in CASE_INSENSITIVE else value
+
+
+def get_rows(condition=None):
+    products = Product.objects.order_by('created_at', 'pk')
+    if condition is not None:
+        products = products.filter(condition)
+    rows = products.values_list('pk', 'brand_id', 'is_active', 'status', 'is_sale', 'category__slug', 'type__slug',
+                                'own_category__name', 'brand__suffix', 'brand__is_active', 'brand__status',
+                                'brand__delivery')
+    colors = Product.color.through.objects.values_list('product_id', 'color__name')
+    cities = Brand.cities.through.objects.values_list('brand_id', 'city__slug')
+    if condition is not None:
+        rows = list(rows)
+        colors = colors.filter(product_id__in=[row[0] for row in rows])
+        cities = cities.filter(brand_id__in={row[1] for row in rows})
+    else:
+        rows = rows.iterator()
+    product_colors, brand_cities = {}, {}
+    for pk, name in colors.iterator():
+        product_colors.setdefault(pk, []).append(name)
+    for pk, slug in cities.iterator():
+        brand_cities.setdefault(pk, []).append(slug)
+    for (pk, brand_id, is_active, status, is_sale, category, type_, own_category, suffix,
+         brand_is_active, brand_status, delivery) in rows:
+        keys = [('is_sale', 'true' if is_sale else 'false'), ('brand', normalize('brand', suffix))]
+        if is_active and status and brand_is_active and brand_status:
+            keys.append(ACTIVE)
+        for dimension, value in (('category', category), ('type', type_), ('own_category', own_category)):
+            if value is not None:
+                keys.append((dimension, normalize(dimension, value)))
+        keys.extend(('color', normalize('color', name)) for name in product_colors.get(pk, []) if name)
+        if delivery:
+            keys.extend(('city', normalize('city', slug)) for slug in brand_cities.get(brand_id, []) if slug)
+        yield pk, keys
+
+
+class Bitmaps:
+    # bitsets are packed uint8 arrays over dense product ordinals, assigned oldest first
+
+    def __init__(self, capacity):
+        self.capacity = max(-(-capacity // 8) * 8, 1024)
+        self.size = 0
+        self.pks = np.zeros(self.capacity, dtype=np.int64)
+        self.ordinals = {}
+        self.keys = {}
+        self.bitmaps = {}
+        self.postings = {}
+        self.last_id = '0-0'
+
+    def grow(self):
+        self.capacity *= 2
+        self.pks = np.resize(self.pks, self.capacity)
+        for key, bitmap in self.bitmaps.items():
+            self.bitmaps[key] = np.concatenate([bitmap, np.zeros(self.capacity // 8 - len(bitmap), dtype=np.uint8)])
+
+    def get_bitmap(self, key):
+        bitmap = self.bitmaps.get(key)
+        if bitmap is None:
+            bitmap = self.bitmaps[key] = np.zeros(self.capacity // 8, dtype=np.uint8)
+        return bitmap
+
+    def get_ordinal(self, pk):
+        ordinal = self.ordinals.get(pk)
+        if ordinal is None:
+            if self.size == self.capacity:
+                self.grow()
+            ordinal = self.ordinals[pk] = self.size
+            self.pks[ordinal] = pk
+            self.size += 1
+        else:
+            self.clear(ordinal)
+        return ordinal
+
+    def clear(self, ordinal):
+        for key in self.keys.pop(ordinal, ()):
+            if key[0] in SPARSE:
+                postings = self.postings[key]
+                postings = np.delete(postings, np.searchsorted(postings, ordinal))
+                if len(postings):
+                    self.postings[key] = postings
+                else:
+                    del self.postings[key]
+            else:
+                self.bitmaps[key][ordinal >> 3] &= ~np.uint8(128 >> (ordinal & 7))
+
+    def put(self, pk, keys):
+        ordinal = self.get_ordinal(pk)
+        for key in keys:
+            if key[0] in SPARSE:
+                postings = self.postings.get(key)
+                if postings is None:
+                    self.postings[key] = np.array([ordinal], dtype=np.int64)
+                else:
+                    self.postings[key] = np.insert(postings, np.searchsorted(postings, ordinal), ordinal)
+            else:
+                self.get_bitmap(key)[ordinal >> 3] |= np.uint8(128 >> (ordinal & 7))
+        self.keys[ordinal] = tuple(keys)
+
+    def load(self, rows):
+        # ordinals only grow during a scan, so sparse arrays are collected as lists and sorted already
+        postings = {}
+        for pk, keys in rows:
+            ordinal = self.get_ordinal(pk)
+            for key in keys:
+                if key[0] in SPARSE:
+                    postings.setdefault(key, []).append(ordinal)
+                else:
+                    self.get_bitmap(key)[ordinal >> 3] |= np.uint8(128 >> (ordinal & 7))
+            self.keys[ordinal] = tuple(keys)
+        for key, ordinals in postings.items():
+            self.postings[key] = np.array(ordinals, dtype=np.int64)
+
+    def sync(self, lock=None):
+        # False when the stream was trimmed past the last applied entry and nothing can be replayed,
+        # the stream and the database are read outside the lock, which is only held to apply the rows
+        while True:
+            # the range starts at the last applied entry, so a trimmed stream is noticed
+            entries = r.xrange(STREAM_KEY, min=self.last_id, count=settings.BITMAP_SYNC_BATCH + 1)
+            if self.last_id != '0-0':
+                if not entries or entries[0][0].decode() != self.last_id:
+                    return False
+                entries = entries[1:]
+            if not entries:
+                return True
+            changes = {}
+            for entry_id, fields in entries:
+                for kind, pk in fields.items():
+                    if kind.decode() in CHANGES:
+                        changes.setdefault(kind.decode(), set()).add(int(pk))
+            rows = list(get_rows(get_condition(changes)))
+            with lock or contextlib.nullcontext():
+                self.apply(changes, rows)
+                self.last_id = entries[-1][0].decode()
+            if len(entries) < settings.BITMAP_SYNC_BATCH:
+                return True
+
+    def apply(self, changes, rows):
+        seen = set()
+        for pk, keys in rows:
+            self.put(pk, keys)
+            seen.add(pk)
+        # deleted products lose every bit but keep their ordinal
+        for pk in changes.get('product', set()) - seen:
+            ordinal = self.ordinals.get(pk)
+            if ordinal is not None:
+                self.clear(ordinal)
+
+    def resolve(self, dimension, values):
+        values = {normalize(dimension, value) for value in values}
+        if dimension in CONTAINS:
+            keys = [key for key in self.postings if key[0] == dimension and any(value in key[1] for value in values)]
+        else:
+            keys = [(dimension, value) for value in values]
+        if dimension in SPARSE:
+            bits = np.zeros(self.capacity, dtype=bool)
+            for key in keys:
+                if key in self.postings:
+                    bits[self.postings[key]] = True
+            return np.packbits(bits)
+        bitmap = np.zeros(self.capacity // 8, dtype=np.uint8)
+        for key in keys:
+            if key in self.bitmaps:
+                bitmap |= self.bitmaps[key]
+        return bitmap
+
+    def search(self, filters):
+        result = self.get_bitmap(ACTIVE).copy()
+        for dimension, values in filters.items():
+            result &= self.resolve(dimension, values)
+        # ordinals are never reassigned, so the pks seen now stay valid after the lock is released
+        return Matches(result, self.pks)
+
+
+class Matches:
+    # matching product pks newest first, counted from the bytes and unpacked only for the sliced page
+
+    def __init__(self, bitmap, pks):
+        self.bitmap = bitmap
+        self.pks = pks
+        # running match counts over the bytes, newest byte first
+        self.counts = np.cumsum(POPCOUNT[bitmap[::-1]])
+
+    def count(self):
+        return int(self.counts[-1]) if len(self.counts) else 0
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        # the paginator only slices
+        start, stop = index.start or 0, min(index.stop, self.count())
+        if start >= stop:
+            return []
+        first = int(np.searchsorted(self.counts, start, side='right'))
+        last = int(np.searchsorted(self.counts, stop - 1, side='right'))
+        low, high = len(self.bitmap) - 1 - last, len(self.bitmap) - first
+        ordinals = np.flatnonzero(np.unpackbits(self.bitmap[low:high]))[::-1] + low * 8
+        skipped = int(self.counts[first - 1]) if first else 0
+        return self.pks[ordinals[start - skipped:stop - skipped]].tolist()
+
+
+class BitmapIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bitmaps = None
+        self.refreshing = None
+        self.synced_at = 0
+
+    def build(self):
+        # scanned without the lock, changes made during the scan are replayed from the stream afterwards
+        while True:
+            last = r.xrevrange(STREAM_KEY, count=1)
+            bitmaps = Bitmaps(Product.objects.count() * 2)
+            bitmaps.load(get_rows())
+            bitmaps.last_id = last[0][0].decode() if last else '0-0'
+            if bitmaps.sync():
+                break
+        with self.lock:
+            self.bitmaps = bitmaps
+        self.synced_at = time.monotonic()
+
+    def refresh(self):
+        # the only writer of the bitmaps, runs in one background thread at a time
+        try:
+            if self.bitmaps is not None and not self.bitmaps.sync(self.lock):
+                # the stream was trimmed past this worker, nothing to replay from
+                with self.lock:
+                    self.bitmaps = None
+            if self.bitmaps is None:
+                self.build()
+            else:
+                self.synced_at = time.monotonic()
+        except DatabaseError:
+            pass
+        finally:
+            connections.close_all()
+
+    def warm_up(self):
+        # an unreachable database only postpones the scan to a background rebuild
+        try:
+            self.build()
+        except DatabaseError:
+            pass
+
+    def search(self, filters):
+        # products matching every filter newest first, None while the bitmaps are being rebuilt,
+        # changes are synced in the background at most every BITMAP_SYNC_INTERVAL seconds
+        with self.lock:
+            stale = time.monotonic() - self.synced_at >= settings.BITMAP_SYNC_INTERVAL
+            if (self.bitmaps is None or stale) and (self.refreshing is None or not self.refreshing.is_alive()):
+                self.refreshing = threading.Thread(target=self.refresh, daemon=True)
+                self.refreshing.start()
+            if self.bitmaps is None:
+                return None
+            return self.bitmaps.search(filters)
+
+
+def get_condition(changes):
+    condition = Q(pk__in=[])
+    for kind, pks in changes.items():
+        condition |= CHANGES[kind](pks)
+    return condition
+
+
+def get_filters(query_params):
+    # None when a parameter can not be answered from the bitmaps
+    filters = {}
+    for key in query_params:
+        if key == 'p':
+            continue
+        if key not in DIMENSIONS:
+            return None
+        values = [value for value in query_params.get(key).split(',') if value.strip()]
+        if key == 'is_sale':
+            if len(values) != 1 or values[0].strip().lower() not in BOOLEANS:
+                return None
+            values = [BOOLEANS[values[0].strip().lower()]]
+        if values:
+            filters[key] = values
+    return filters
+
+
+index = BitmapIndex()
@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+
+from core import settings
+from product import similarity
+
+
+class Command(BaseCommand):
+    help = 'Computes item-item cosine neighbours from likes and ratings and stores them in redis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=settings.SIMILAR_TOP_K)
+        parser.add_argument('--block-size', type=int, default=settings.SIMILAR_BLOCK_SIZE)
+
+    def handle(self, *args, **options):
+        stored = similarity.rebuild(options['top_k'], options['block_size'])
+        self.stdout.write(f"Stored similar products for {stored} products")
@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from core import settings
+from product import similarity
+
+
+class Command(BaseCommand):
+    help = 'Updates the content neighbours of products saved since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+        parser.add_argument('--batch-size', type=int, default=settings.SIMILAR_UPDATE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            updated = similarity.update_pending(batch_size)
+            if updated:
+                self.stdout.write(f"Updated content neighbours of {updated} products")
+            if updated == batch_size:
+                continue
+            if options['once']:
+                break
+            similarity.wait_for_updates(settings.SIMILAR_UPDATE_POLL_INTERVAL)
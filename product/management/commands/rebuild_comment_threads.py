@@ -0,0 +1,43 @@
+from django.core.management import BaseCommand
+from django.db.models import Count
+from django_redis import get_redis_connection
+
+from other.models import Comment
+
+r = get_redis_connection("default")
+
+
+class Command(BaseCommand):
+    help = 'Sets the thread root of every reply and rebuilds the product comment and thread reply counters'
+
+    def handle(self, *args, **options):
+        parents = dict(Comment.objects.values_list('pk', 'parent_id').iterator())
+        roots = {}
+        for pk in parents:
+            # walk up to the top-level comment, a parent lost to SET_NULL ends the thread there
+            chain = [pk]
+            while parents.get(chain[-1]) is not None and chain[-1] not in roots:
+                chain.append(parents[chain[-1]])
+            root = roots.get(chain[-1], chain[-1])
+            for child in chain:
+                roots[child] = root
+        threads = {}
+        for pk, root in roots.items():
+            if pk != root:
+                threads.setdefault(root, []).append(pk)
+        Comment.objects.exclude(pk__in=[pk for pk, root in roots.items() if pk != root]) \
+            .exclude(root=None).update(root=None)
+        for root, pks in threads.items():
+            Comment.objects.filter(pk__in=pks).exclude(root_id=root).update(root_id=root)
+
+        for pattern in ['product:*:comment_count', 'comment:*:reply_count']:
+            for key in r.scan_iter(match=pattern, count=1000):
+                r.delete(key)
+        pipe = r.pipeline(transaction=False)
+        active = Comment.objects.filter(is_active=True).order_by()
+        for product_id, count in active.values_list('used_to_id').annotate(count=Count('pk')).iterator():
+            pipe.set(f"product:{product_id}:comment_count", count)
+        for root_id, count in active.exclude(root=None).values_list('root_id').annotate(count=Count('pk')).iterator():
+            pipe.set(f"comment:{root_id}:reply_count", count)
+        pipe.execute()
+        self.stdout.write(f"{len(threads)} comment threads rebuilt")
@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from product.models import Product, ProductImage
+from product.utils import get_thumbnail_url
+
+
+class Command(BaseCommand):
+    help = 'Copies main images of products into their denormalized cover fields'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        covers = ProductImage.objects.filter(is_main=True).order_by('product_id').values_list('product_id', 'image')
+        batch, updated = [], 0
+        for product_id, image in covers.iterator(chunk_size=batch_size):
+            batch.append(Product(pk=product_id, main_image=image, main_thumbnail=get_thumbnail_url(image)))
+            if len(batch) >= batch_size:
+                updated += Product.objects.bulk_update(batch, ['main_image', 'main_thumbnail']) or len(batch)
+                batch = []
+        if batch:
+            updated += Product.objects.bulk_update(batch, ['main_image', 'main_thumbnail']) or len(batch)
+        self.stdout.write(f"Synced covers of {updated} products")
@@ -3,12 +3,13 @@ import secrets
 import uuid
 
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, router, transaction
 from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
 
-from other.fields import OrderField
+from other.fields import OrderField, OrderedQuerySet, ContentAddressedImageField
 from other.validators import NameValidator, TitleValidator
+from .utils import get_thumbnail_url
 
 
 class Product(models.Model):
@@ -41,6 +42,9 @@ class Product(models.Model):
     is_active = models.BooleanField(_("active"), default=True)
     status = models.BooleanField(_("status"), default=True)
     is_sale = models.BooleanField(_("sale"), default=False)
+    """Cover"""
+    main_image = models.ImageField(_("main image"), max_length=200, blank=True, null=True, editable=False)
+    main_thumbnail = models.URLField(_("main thumbnail"), max_length=300, blank=True, null=True, editable=False)
     """Info"""
     created_at = models.DateTimeField(_("created"), auto_now_add=True)
     updated_at = models.DateTimeField(_("updated"), auto_now=True)
@@ -55,8 +59,7 @@ class Product(models.Model):
         super().save(*args, **kwargs)
 
     def get_photo(self):
-        photo = ProductImage.objects.filter(product=self, is_main=True).first()
-        return photo.image
+        return self.main_image
 
     def __str__(self):
         return self.name
@@ -73,22 +76,50 @@ def get_image_upload_path(instance, filename):
     return f'brands/{brand}/products/{product}/{file_name}'
 
 
+class ProductImageQuerySet(OrderedQuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            for image in objs:
+                if image.is_main:
+                    image.update_product_cover()
+        return objs
+
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to=get_image_upload_path, max_length=200)
+    image = ContentAddressedImageField(upload_to=get_image_upload_path, max_length=200)
     order = OrderField(blank=True, for_fields=['product'], start=1)
     is_main = models.BooleanField(default=False, blank=True)
 
+    objects = ProductImageQuerySet.as_manager()
+
     class Meta:
         ordering = ('order',)
 
     def __str__(self):
         return f'{self.product}-{self.order}'
 
-    def save(self, *args, **kwargs):
+    def prepare_save(self):
         if self.order == 1:
             self.is_main = True
-        super().save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        using = router.db_for_write(ProductImage, instance=self)
+        with transaction.atomic(using=using):
+            # order is allocated before insert, so the first image is saved as main at once
+            ProductImage._meta.get_field('order').allocate([self], using=using)
+            self.prepare_save()
+            super().save(*args, **kwargs)
+            if self.is_main:
+                ProductImage.objects.filter(product_id=self.product_id, is_main=True) \
+                    .exclude(pk=self.pk).update(is_main=False)
+                self.update_product_cover()
+
+    def update_product_cover(self):
+        Product.objects.filter(pk=self.product_id).update(main_image=self.image.name,
+                                                          main_thumbnail=get_thumbnail_url(self.image.name))
 
 
 class ProductRating(models.Model):
@@ -2,6 +2,8 @@ from collections import OrderedDict
 
 from rest_framework.pagination import PageNumberPagination
 
+from accounts.paginator import FollowListPaginator
+
 
 class ProductListPaginator(PageNumberPagination):
     page_query_param = 'p'
@@ -23,3 +25,11 @@ class ProductListPaginator(PageNumberPagination):
 
 class ProductSearchPaginator(ProductListPaginator):
     pass
+
+
+class CommentListPaginator(FollowListPaginator):
+    page_size = 20
+
+
+class CommentReplyPaginator(CommentListPaginator):
+    ordering = 'created_at'
@@ -0,0 +1,168 @@
+import numpy as np
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from accounts import follows
+from core import settings
+from .models import Product, ProductLike, ProductRating
+
+r = get_redis_connection("default")
+
+ID_DTYPE = np.dtype('<u4')
+
+
+def get_feed_key(user_id):
+    return f"user:{user_id}:feed"
+
+
+def get_profile_key(user_id):
+    return f"user:{user_id}:feed_profile"
+
+
+def invalidate_feed(user_id, profile=False):
+    if profile:
+        r.delete(get_feed_key(user_id), get_profile_key(user_id))
+    else:
+        r.delete(get_feed_key(user_id))
+
+
+def build_profile(user_id):
+    # category and color affinities from likes and ratings, scaled to 0..1
+    categories, colors = {}, {}
+    for preferences, field in ((categories, 'product__category_id'), (colors, 'product__color')):
+        likes = ProductLike.objects.filter(user_id=user_id, **{f"{field}__isnull": False}) \
+            .values_list(field).annotate(count=Count('pk')).order_by()
+        for pk, count in likes:
+            preferences[pk] = preferences.get(pk, 0) + count * settings.FEED_WEIGHTS['like']
+        ratings = ProductRating.objects.filter(user_id=user_id, rating__gt=0, **{f"{field}__isnull": False}) \
+            .values_list(field).annotate(total=Sum('rating')).order_by()
+        for pk, total in ratings:
+            preferences[pk] = preferences.get(pk, 0) + total / 5
+    profile = {}
+    for prefix, preferences in (('c', categories), ('o', colors)):
+        top = max(preferences.values(), default=0)
+        for pk, value in preferences.items():
+            profile[f"{prefix}:{pk}"] = value / top
+    return profile
+
+
+def get_profile(user_id):
+    key = get_profile_key(user_id)
+    cached = r.hgetall(key)
+    if cached:
+        return {field.decode(): float(value) for field, value in cached.items()}
+    profile = build_profile(user_id)
+    pipe = r.pipeline()
+    # an empty profile is cached too, as a single placeholder field
+    pipe.hset(key, mapping=profile or {'-': 0})
+    pipe.expire(key, settings.FEED_PROFILE_TTL)
+    pipe.execute()
+    return profile
+
+
+def get_brand_ids(user_id):
+    return [int(pk) for pk in r.smembers(follows.get_following_brands_key(user_id))]
+
+
+def get_candidates(brand_ids):
+    return Product.objects.filter(is_active=True, status=True, stock__gt=0, brand_id__in=brand_ids) \
+        .order_by('-created_at', '-pk')
+
+
+def rank(user_id, brand_ids):
+    if not brand_ids:
+        return []
+    candidates = list(get_candidates(brand_ids).values_list('pk', 'brand_id', 'category_id', 'created_at')
+                      [:settings.FEED_CANDIDATES])
+    if not candidates:
+        return []
+    pks, brands, categories, created = zip(*candidates)
+    pks = np.asarray(pks, dtype=np.int64)
+    profile = get_profile(user_id)
+    weights = settings.FEED_WEIGHTS
+
+    now = timezone.now()
+    age = np.fromiter(((now - value).total_seconds() / 3600 for value in created), dtype=np.float64, count=len(pks))
+    recency = np.exp2(-age / settings.FEED_RECENCY_HALF_LIFE)
+
+    category_affinity = np.fromiter((profile.get(f"c:{pk}", 0) for pk in categories), dtype=np.float64,
+                                    count=len(pks))
+    color_affinity = np.zeros(len(pks))
+    color_rows = list(Product.color.through.objects.filter(product_id__in=pks.tolist())
+                      .values_list('product_id', 'color_id'))
+    if color_rows:
+        positions = {pk: i for i, pk in enumerate(pks.tolist())}
+        index = np.fromiter((positions[pk] for pk, _ in color_rows), dtype=np.int64, count=len(color_rows))
+        values = np.fromiter((profile.get(f"o:{pk}", 0) for _, pk in color_rows), dtype=np.float64,
+                             count=len(color_rows))
+        # the best liked color of a product counts
+        np.maximum.at(color_affinity, index, values)
+
+    counters = r.mget([f"product:{pk}:{stroke}" for pk in pks.tolist() for stroke in ('like_count', 'rating_count')])
+    popularity = np.log1p(np.fromiter((int(value or 0) for value in counters), dtype=np.float64,
+                                      count=len(counters)).reshape(-1, 2).sum(axis=1))
+    if popularity.max() > 0:
+        popularity /= popularity.max()
+
+    scores = weights['recency'] * recency + weights['category'] * category_affinity \
+        + weights['color'] * color_affinity + weights['popularity'] * popularity
+
+    # every further product of the same brand counts a bit less, so prolific brands do not fill the page
+    brands = np.asarray(brands, dtype=np.int64)
+    order = np.lexsort((-scores, brands))
+    sorted_brands = brands[order]
+    starts = np.r_[0, np.flatnonzero(sorted_brands[1:] != sorted_brands[:-1]) + 1]
+    position = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    scores[order] *= settings.FEED_BRAND_DECAY ** position
+
+    return pks[np.argsort(-scores, kind='stable')].tolist()
+
+
+class Feed:
+    # the ranked window first, then the older products of followed brands in chronological order
+
+    def __init__(self, ranked, user_id, brand_ids=None):
+        self.ranked = ranked
+        self.user_id = user_id
+        self.brand_ids = brand_ids
+
+    def get_candidates(self):
+        # a cached ranking reads the followed brands only when the tail is needed
+        if self.brand_ids is None:
+            self.brand_ids = get_brand_ids(self.user_id)
+        return get_candidates(self.brand_ids)
+
+    def is_full(self):
+        return len(self.ranked) >= settings.FEED_CANDIDATES
+
+    def count(self):
+        if not self.is_full():
+            return len(self.ranked)
+        return max(len(self.ranked), self.get_candidates().count())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        # the paginator only slices
+        start, stop = index.start or 0, index.stop
+        pks = self.ranked[start:stop]
+        if stop > len(self.ranked) and self.is_full():
+            # products added since the ranking shift the tail, the ones already ranked are skipped
+            ranked = set(self.ranked)
+            tail = self.get_candidates().values_list('pk', flat=True)[max(start, len(self.ranked)):stop]
+            pks += [pk for pk in tail if pk not in ranked]
+        return pks
+
+
+def get_feed(user_id):
+    key = get_feed_key(user_id)
+    cached = r.get(key)
+    if cached is not None:
+        return Feed(np.frombuffer(cached, dtype=ID_DTYPE).tolist(), user_id)
+    brand_ids = get_brand_ids(user_id)
+    pks = rank(user_id, brand_ids)
+    # pages of one session come from the same ranking
+    r.set(key, np.asarray(pks, dtype=ID_DTYPE).tobytes(), ex=settings.FEED_CACHE_TTL)
+    return Feed(pks, user_id, brand_ids)
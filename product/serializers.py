@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django_redis import get_redis_connection
+from django.db import transaction
 from django.utils.translation import ugettext_lazy as _
 
 from actions.utils import brand_create_action
@@ -9,25 +10,13 @@ from other.utils import tag_get_or_create, size_get_or_create, color_get, catego
 from other.serializers import SubCategorySerializer, TagSerializer, ColorSerializer, SizeSerializer, TypeSerializer
 from other.validators import NameValidator, TitleValidator
 from other.choices import Verb
+from other.dynamic_serializers import DynamicFieldsModelSerializer
+from . import similarity
 from .models import Product, ProductImage
 
 r = get_redis_connection("default")
 
 
-class DynamicFieldsModelSerializer(serializers.ModelSerializer):
-
-    def __init__(self, *args, **kwargs):
-        fields = kwargs.pop('fields', None)
-
-        super(DynamicFieldsModelSerializer, self).__init__(*args, **kwargs)
-
-        if fields is not None:
-            allowed = set(fields)
-            existing = set(self.fields.keys())
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
-
-
 class ProductImageSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = ProductImage
@@ -100,6 +89,7 @@ class ProductCreateSerializer(DynamicFieldsModelSerializer):
         product.category = category_get(category, type_)
         product.save()
         brand_create_action(product.brand, Verb.PRODUCT, product)
+        transaction.on_commit(lambda: similarity.enqueue_content_update(product.pk))
         return product
 
 
@@ -173,4 +163,5 @@ class ProductSerializer(DynamicFieldsModelSerializer):
         if category is not None:
             instance.category = category_get(category, type_)
         instance.save()
+        transaction.on_commit(lambda: similarity.enqueue_content_update(instance.pk))
         return instance
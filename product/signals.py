@@ -1,15 +1,22 @@
-from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
 from django_redis import get_redis_connection
 
-from .models import ProductLike, ProductRating, Product
+from accounts import follows
+from brand.models import OwnCategory
+from other.models import Color, Comment, MediaBlob, SubCategory, Type
+from . import bitmap, ranking, similarity
+from .models import ProductLike, ProductRating, Product, ProductImage
 
 r = get_redis_connection("default")
 
-
-def image_is_main_checker(instance, *args, **kwargs):
-    if instance.order == 1:
-        instance.is_main = True
-        instance.save()
+# catalog models products are indexed under by slug or name, keyed to the product field pointing at them
+CATALOG = {
+    SubCategory: 'category',
+    Type: 'type',
+    OwnCategory: 'own_category',
+    Color: 'color',
+}
 
 
 def like_changed(instance, *args, **kwargs):
@@ -20,15 +27,111 @@ def like_changed(instance, *args, **kwargs):
     r.set(f"product:{product.pk}:like_count", product_like_count)
 
 
+def like_saved(instance, *args, **kwargs):
+    follows.set_product_like(instance.user_id, instance.product_id, True)
+    ranking.invalidate_feed(instance.user_id, profile=True)
+    like_changed(instance)
+
+
+def like_deleted(instance, *args, **kwargs):
+    follows.set_product_like(instance.user_id, instance.product_id, False)
+    ranking.invalidate_feed(instance.user_id, profile=True)
+    like_changed(instance)
+
+
 def rating_changed(instance, *args, **kwargs):
     user, product = instance.user, instance.product
+    ranking.invalidate_feed(user.pk, profile=True)
     user_rating_count = ProductRating.objects.filter(user=user).count()
     product_rating_count = ProductRating.objects.filter(product=product).count()
     r.set(f"user:{user.pk}:rating_count", user_rating_count)
     r.set(f"product:{product.pk}:rating_count", product_rating_count)
 
 
-post_save.connect(like_changed, sender=ProductLike)
-post_delete.connect(like_changed, sender=ProductLike)
+def count_comment(instance, step):
+    # lists read these counters instead of counting comments, rebuild_comment_threads repairs them
+    product_id, root_id = instance.used_to_id, instance.root_id
+
+    def update():
+        pipe = r.pipeline(transaction=False)
+        pipe.incrby(f"product:{product_id}:comment_count", step)
+        if root_id is not None:
+            pipe.incrby(f"comment:{root_id}:reply_count", step)
+        pipe.execute()
+
+    transaction.on_commit(update)
+
+
+def comment_saved(instance, created, *args, **kwargs):
+    was_active = False if created else getattr(instance, 'stored_is_active', None)
+    instance.stored_is_active = instance.is_active
+    # an instance not loaded with is_active can not tell a transition
+    if was_active is not None and was_active != instance.is_active:
+        count_comment(instance, 1 if instance.is_active else -1)
+
+
+def comment_deleted(instance, *args, **kwargs):
+    # before the delete, so a deferred is_active can still be read
+    was_active = getattr(instance, 'stored_is_active', None)
+    if was_active if was_active is not None else instance.is_active:
+        count_comment(instance, -1)
+    if instance.root_id is None:
+        pk = instance.pk
+        transaction.on_commit(lambda: r.delete(f"comment:{pk}:reply_count"))
+
+
+def image_deleted(instance, *args, **kwargs):
+    MediaBlob.objects.release_on_commit(instance.image.name, instance.image.storage)
+    if instance.is_main:
+        next_image = ProductImage.objects.filter(product_id=instance.product_id).order_by('order').first()
+        if next_image is not None:
+            next_image.is_main = True
+            next_image.save(update_fields=['is_main'])
+        else:
+            Product.objects.filter(pk=instance.product_id).update(main_image=None, main_thumbnail=None)
+
+
+def product_changed(instance, *args, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: bitmap.publish('product', pk))
+
+
+def product_colors_changed(instance, action, reverse, pk_set, *args, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    for pk in (pk_set if reverse else [instance.pk]) or ():
+        transaction.on_commit(lambda pk=pk: bitmap.publish('product', pk))
+
+
+def product_deleted(instance, *args, **kwargs):
+    similarity.remove_content(instance.pk)
+    product_changed(instance)
+
+
+def catalog_changed(sender, instance, raw=False, *args, **kwargs):
+    # fixtures load the catalog before any product points at it
+    if raw:
+        return
+    kind, pk = CATALOG[sender], instance.pk
+    transaction.on_commit(lambda: bitmap.publish(kind, pk))
+
+
+def catalog_deleted(sender, instance, *args, **kwargs):
+    # products lose the reference through SET_NULL or the m2m cascade without signals of their own
+    pks = list(Product.objects.filter(**{CATALOG[sender]: instance}).values_list('pk', flat=True))
+    transaction.on_commit(lambda: bitmap.publish('product', *pks))
+
+
+post_save.connect(like_saved, sender=ProductLike)
+post_delete.connect(like_deleted, sender=ProductLike)
 post_save.connect(rating_changed, sender=ProductRating)
 post_delete.connect(rating_changed, sender=ProductRating)
+post_delete.connect(image_deleted, sender=ProductImage)
+post_save.connect(comment_saved, sender=Comment)
+pre_delete.connect(comment_deleted, sender=Comment)
+post_save.connect(product_changed, sender=Product)
+post_delete.connect(product_deleted, sender=Product)
+m2m_changed.connect(product_colors_changed, sender=Product.color.through)
+for model in CATALOG:
+    post_save.connect(catalog_changed, sender=model)
+    pre_delete.connect(catalog_deleted, sender=model)
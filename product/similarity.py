@@ -0,0 +1,365 @@
+import math
+import zlib
+
+import numpy as np
+from django_redis import get_redis_connection
+from scipy import sparse
+
+from core import settings
+from .models import Product, ProductLike, ProductRating
+
+r = get_redis_connection("default")
+
+# neighbour ids are stored as little-endian uint32, best first
+ID_DTYPE = np.dtype('<u4')
+NEIGHBOUR_DTYPE = np.dtype([('id', '<u4'), ('score', '<f4')])
+FEATURE_DTYPE = np.dtype([('index', '<u4'), ('value', '<f4')])
+
+CONTENT_GROUP_KEY = 'products:content:group'
+# products saved since their content neighbours were last updated, drained by content_similarity_worker
+PENDING_KEY = 'products:content:pending'
+WAKEUP_KEY = 'products:content:wakeup'
+
+
+def get_similar_key(product_id):
+    return f"product:{product_id}:similar"
+
+
+def get_similar_content_key(product_id):
+    return f"product:{product_id}:similar_content"
+
+
+def get_content_vectors_key(group):
+    return f"products:content:vectors:{group}"
+
+
+def get_postings_key(group, feature):
+    # products of a group having the feature, where update candidates are sampled from
+    return f"products:content:postings:{group}:{feature}"
+
+
+def get_similar_ids(product_id):
+    # interaction neighbours first, topped up with content neighbours for products nobody liked yet
+    pipe = r.pipeline(transaction=False)
+    pipe.get(get_similar_key(product_id))
+    pipe.get(get_similar_content_key(product_id))
+    by_interactions, by_content = pipe.execute()
+    pks = np.frombuffer(by_interactions, dtype=ID_DTYPE).tolist() if by_interactions else []
+    if by_content and len(pks) < settings.SIMILAR_TOP_K:
+        seen = set(pks)
+        for pk in np.frombuffer(by_content, dtype=NEIGHBOUR_DTYPE)['id'].tolist():
+            if pk not in seen:
+                pks.append(pk)
+                seen.add(pk)
+    return pks[:settings.SIMILAR_TOP_K]
+
+
+def delete_stale(pattern, written):
+    # lists of products that lost all their neighbours
+    cursor = 0
+    while True:
+        cursor, keys = r.scan(cursor, match=pattern, count=1000)
+        stale = [key for key in keys if key not in written]
+        if stale:
+            r.delete(*stale)
+        if not cursor:
+            break
+
+
+def build_interactions():
+    # a like and a rating of the same product count once, the stronger one wins
+    weights = {}
+    for user_id, product_id in ProductLike.objects.values_list('user_id', 'product_id').iterator():
+        weights[user_id, product_id] = settings.SIMILAR_LIKE_WEIGHT
+    for user_id, product_id, rating in ProductRating.objects.filter(rating__gt=0) \
+            .values_list('user_id', 'product_id', 'rating').iterator():
+        weights[user_id, product_id] = max(weights.get((user_id, product_id), 0), rating / 5)
+    if not weights:
+        return np.empty(0, dtype=np.int64), sparse.csr_matrix((0, 0), dtype=np.float32)
+    pairs = np.fromiter((value for pair in weights for value in pair), dtype=np.int64).reshape(-1, 2)
+    user_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    product_ids, cols = np.unique(pairs[:, 1], return_inverse=True)
+    values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=(len(user_ids), len(product_ids)))
+    return product_ids, matrix
+
+
+def iter_neighbours(matrix, top_k, block_size):
+    # cosine similarity of product columns, computed a block of products at a time
+    if not matrix.nnz:
+        return
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1
+    normalized = (matrix @ sparse.diags(1 / norms)).tocsc()
+    products = normalized.T.tocsr()
+    for start in range(0, products.shape[0], block_size):
+        block = (products[start:start + block_size] @ normalized).tocsr()
+        for i in range(block.shape[0]):
+            yield start + i, top_k_row(block, i, start + i, top_k)[0]
+
+
+def top_k_row(block, i, own, top_k):
+    # best columns of a sparse block row and their scores, best first, leaving out the product itself
+    cols = block.indices[block.indptr[i]:block.indptr[i + 1]]
+    scores = block.data[block.indptr[i]:block.indptr[i + 1]]
+    keep = (cols != own) & (scores > 0)
+    cols, scores = cols[keep], scores[keep]
+    if len(cols) > top_k:
+        best = np.argpartition(-scores, top_k)[:top_k]
+        cols, scores = cols[best], scores[best]
+    order = np.argsort(-scores, kind='stable')
+    return cols[order], scores[order]
+
+
+def flush(pipe, size=1000):
+    if len(pipe) >= size:
+        pipe.execute()
+
+
+def chunked(items, size=1000):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def rebuild(top_k=None, block_size=None):
+    top_k = top_k or settings.SIMILAR_TOP_K
+    block_size = block_size or settings.SIMILAR_BLOCK_SIZE
+    product_ids, matrix = build_interactions()
+    written = set()
+    pipe = r.pipeline(transaction=False)
+    for index, neighbours in iter_neighbours(matrix, top_k, block_size):
+        if not len(neighbours):
+            continue
+        key = get_similar_key(product_ids[index])
+        pipe.set(key, product_ids[neighbours].astype(ID_DTYPE).tobytes())
+        written.add(key.encode())
+        flush(pipe)
+    pipe.execute()
+    delete_stale(get_similar_key('*'), written)
+    return len(written)
+
+
+def get_content_group(product):
+    # neighbours are searched among products of the same parent category
+    category = product.category
+    return category.parent_id if category is not None and category.parent_id is not None else 'none'
+
+
+def hash_feature(name):
+    return zlib.crc32(name.encode()) % settings.CONTENT_FEATURE_DIM
+
+
+def get_content_features(product):
+    weights = settings.CONTENT_FEATURE_WEIGHTS
+    features = {}
+
+    def add(name, weight):
+        index = hash_feature(name)
+        features[index] = features.get(index, 0) + weight
+
+    add(f"brand:{product.brand_id}", weights['brand'])
+    if product.category_id is not None:
+        add(f"category:{product.category_id}", weights['category'])
+    if product.type_id is not None:
+        add(f"type:{product.type_id}", weights['type'])
+    for tag in product.tags.all():
+        add(f"tag:{tag.pk}", weights['tag'])
+    for color in product.color.all():
+        add(f"color:{color.pk}", weights['color'])
+    for size in product.sizes.all():
+        add(f"size:{size.pk}", weights['size'])
+    if product.price and product.price > 0:
+        # log2 price bands, neighbouring bands match at half weight
+        band = int(math.log2(product.price))
+        add(f"price:{band}", weights['price'])
+        add(f"price:{band - 1}", weights['price'] / 2)
+        add(f"price:{band + 1}", weights['price'] / 2)
+    vector = np.array(sorted(features.items()), dtype=FEATURE_DTYPE)
+    vector['value'] /= np.linalg.norm(vector['value'])
+    return vector
+
+
+def get_content_queryset():
+    return Product.objects.filter(is_active=True, status=True, brand__is_active=True) \
+        .select_related('category').prefetch_related('tags', 'color', 'sizes')
+
+
+def build_content_matrix(vectors):
+    indptr = np.zeros(len(vectors) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(vector) for vector in vectors])
+    data = np.concatenate(vectors) if vectors else np.empty(0, dtype=FEATURE_DTYPE)
+    return sparse.csr_matrix((data['value'], data['index'].astype(np.int64), indptr),
+                             shape=(len(vectors), settings.CONTENT_FEATURE_DIM))
+
+
+def pack_neighbours(ids, scores):
+    neighbours = np.empty(len(ids), dtype=NEIGHBOUR_DTYPE)
+    neighbours['id'] = ids
+    neighbours['score'] = scores
+    return neighbours.tobytes()
+
+
+def top_k_rows(scores, top_k):
+    # batched top-K over a dense block of similarities, best first
+    k = min(top_k, scores.shape[1])
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def rebuild_content(top_k=None, block_size=None):
+    top_k = top_k or settings.SIMILAR_TOP_K
+    block_size = block_size or settings.SIMILAR_BLOCK_SIZE
+    groups = {}
+    for product in get_content_queryset().iterator(chunk_size=2000):
+        ids, vectors = groups.setdefault(get_content_group(product), ([], []))
+        ids.append(product.pk)
+        vectors.append(get_content_features(product))
+    # the pipeline is flushed every thousand commands, a group is never buffered whole
+    pipe = r.pipeline(transaction=False)
+    for pattern in (get_content_vectors_key('*'), get_postings_key('*', '*')):
+        for key in r.scan_iter(match=pattern, count=1000):
+            pipe.delete(key)
+            flush(pipe)
+    pipe.delete(CONTENT_GROUP_KEY)
+    written = set()
+    for group, (pks, vectors) in groups.items():
+        for chunk in chunked(list(zip(pks, vectors))):
+            pipe.hset(get_content_vectors_key(group), mapping={pk: vector.tobytes() for pk, vector in chunk})
+            pipe.hset(CONTENT_GROUP_KEY, mapping={pk: group for pk, vector in chunk})
+            flush(pipe)
+        postings = {}
+        for pk, vector in zip(pks, vectors):
+            for feature in vector['index'].tolist():
+                postings.setdefault(feature, []).append(pk)
+        for feature, members in postings.items():
+            for chunk in chunked(members):
+                pipe.sadd(get_postings_key(group, feature), *chunk)
+                flush(pipe)
+        ids = np.asarray(pks, dtype=np.int64)
+        matrix = build_content_matrix(vectors)
+        transposed = matrix.T.tocsc()
+        # block products stay sparse, the rows are bounded so a block holds at most SIMILAR_BLOCK_CELLS scores
+        rows = max(1, min(block_size, settings.SIMILAR_BLOCK_CELLS // max(len(ids), 1)))
+        for start in range(0, len(ids), rows):
+            block = (matrix[start:start + rows] @ transposed).tocsr()
+            for i in range(block.shape[0]):
+                cols, scores = top_k_row(block, i, start + i, top_k)
+                if len(cols):
+                    key = get_similar_content_key(ids[start + i])
+                    pipe.set(key, pack_neighbours(ids[cols], scores))
+                    written.add(key.encode())
+                    flush(pipe)
+    pipe.execute()
+    delete_stale(get_similar_content_key('*'), written)
+    return len(written)
+
+
+def get_stored_content(product_id):
+    group = r.hget(CONTENT_GROUP_KEY, product_id)
+    if group is None:
+        return None, None
+    group = group.decode()
+    vector = r.hget(get_content_vectors_key(group), product_id)
+    return group, np.frombuffer(vector, dtype=FEATURE_DTYPE) if vector else None
+
+
+def remove_content(product_id):
+    group, vector = get_stored_content(product_id)
+    pipe = r.pipeline()
+    if group is not None:
+        pipe.hdel(get_content_vectors_key(group), product_id)
+        for feature in vector['index'].tolist() if vector is not None else []:
+            pipe.srem(get_postings_key(group, feature), product_id)
+    pipe.hdel(CONTENT_GROUP_KEY, product_id)
+    pipe.delete(get_similar_content_key(product_id))
+    pipe.execute()
+
+
+def sample_candidates(group, vector, limit=None):
+    limit = limit or settings.SIMILAR_CONTENT_CANDIDATES
+    features = vector['index'].tolist()
+    if not features:
+        return set()
+    pipe = r.pipeline(transaction=False)
+    for feature in features:
+        pipe.srandmember(get_postings_key(group, feature), -(-limit // len(features)))
+    return {int(pk) for members in pipe.execute() for pk in members}
+
+
+def update_content(product_id, top_k=None):
+    # scored against a bounded sample of products sharing a feature rather than the whole group; products
+    # that shared the old features or listed it before are candidates too, so lists it dropped out of are fixed
+    top_k = top_k or settings.SIMILAR_TOP_K
+    product = get_content_queryset().filter(pk=product_id).first()
+    old_group, old_vector = get_stored_content(product_id)
+    old_neighbours = r.get(get_similar_content_key(product_id))
+    candidates = set(np.frombuffer(old_neighbours, dtype=NEIGHBOUR_DTYPE)['id'].tolist()) if old_neighbours else set()
+    if old_vector is not None:
+        candidates |= sample_candidates(old_group, old_vector)
+    remove_content(product_id)
+    scores = {}
+    pipe = r.pipeline()
+    if product is not None:
+        group = get_content_group(product)
+        vector = get_content_features(product)
+        candidates |= sample_candidates(group, vector)
+        candidates.discard(product_id)
+        pipe.hset(get_content_vectors_key(group), product_id, vector.tobytes())
+        pipe.hset(CONTENT_GROUP_KEY, product_id, group)
+        for feature in vector['index'].tolist():
+            pipe.sadd(get_postings_key(group, feature), product_id)
+        pks = sorted(candidates)
+        stored = r.hmget(get_content_vectors_key(group), pks) if pks else []
+        found = [(pk, np.frombuffer(value, dtype=FEATURE_DTYPE)) for pk, value in zip(pks, stored) if value]
+        if found:
+            matrix = build_content_matrix([value for pk, value in found])
+            values = (matrix @ build_content_matrix([vector]).T).toarray().ravel()
+            scores = {pk: score for (pk, value), score in zip(found, values.tolist()) if score > 0}
+        if scores:
+            ids = np.fromiter(scores, dtype=np.int64, count=len(scores))
+            best, best_scores = top_k_rows(np.fromiter(scores.values(), dtype=np.float64)[np.newaxis, :], top_k)
+            pipe.set(get_similar_content_key(product_id), pack_neighbours(ids[best[0]], best_scores[0]))
+    candidates.discard(product_id)
+    pks = sorted(candidates)
+    neighbour_lists = r.mget([get_similar_content_key(pk) for pk in pks]) if pks else []
+    for pk, data in zip(pks, neighbour_lists):
+        neighbours = np.frombuffer(data, dtype=NEIGHBOUR_DTYPE) if data else np.empty(0, dtype=NEIGHBOUR_DTYPE)
+        kept = neighbours[neighbours['id'] != product_id]
+        score = scores.get(pk, 0)
+        if score > 0 and (len(kept) < top_k or score > kept['score'][-1]):
+            kept = np.append(kept, np.array([(product_id, score)], dtype=NEIGHBOUR_DTYPE))
+            kept = kept[np.argsort(-kept['score'], kind='stable')][:top_k]
+        elif len(kept) == len(neighbours):
+            continue
+        # a product that no longer matches is taken out, an emptied list is dropped
+        if len(kept):
+            pipe.set(get_similar_content_key(pk), kept.tobytes())
+        else:
+            pipe.delete(get_similar_content_key(pk))
+    pipe.execute()
+
+
+def enqueue_content_update(product_id):
+    pipe = r.pipeline()
+    pipe.sadd(PENDING_KEY, product_id)
+    pipe.rpush(WAKEUP_KEY, 1)
+    pipe.execute()
+
+
+def update_pending(batch_size):
+    pks = [int(pk) for pk in r.spop(PENDING_KEY, batch_size) or []]
+    for i, pk in enumerate(pks):
+        try:
+            update_content(pk)
+        except Exception:
+            # the rest of the batch is queued again for the next run
+            r.sadd(PENDING_KEY, *pks[i:])
+            raise
+    return len(pks)
+
+
+def wait_for_updates(timeout):
+    if r.blpop(WAKEUP_KEY, timeout=timeout):
+        r.delete(WAKEUP_KEY)
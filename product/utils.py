@@ -0,0 +1,13 @@
+from cloudinary import CloudinaryResource
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+
+def get_thumbnail_url(name):
+    if not name:
+        return None
+    if settings.DEFAULT_FILE_STORAGE.startswith('cloudinary_storage.'):
+        # Cloudinary derives the thumbnail on its side from the transformation in url
+        resource = CloudinaryResource(default_storage._prepend_prefix(name), default_resource_type='image')
+        return resource.build_url(**settings.PRODUCT_THUMBNAIL_OPTIONS)
+    return default_storage.url(name)
@@ -8,21 +8,39 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from accounts import follows
+from accounts.models import User
+from accounts.serializers import UserSerializer, get_counters
 from actions.utils import brand_remove_action
-from brand.models import BrandUser
+from brand.models import Brand, BrandUser
 
 from core import settings
+from other import geo
 from other.choices import Verb
 from other.models import Comment
 from other.serializers import CommentSerializer
 from other.utils import get_client_ip
 from other.views import CharArrayFilter
+from . import bitmap, ranking, similarity
 from .models import Product, ProductLike, ProductRating, ProductImage
-from .paginator import ProductListPaginator, ProductSearchPaginator
+from .paginator import ProductListPaginator, ProductSearchPaginator, CommentListPaginator, CommentReplyPaginator
 from .serializers import ProductSerializer, ProductCreateSerializer
 
 r = get_redis_connection("default")
 
+# relations ProductSerializer renders in lists, loaded once per page instead of once per product
+PRODUCT_RELATED = ['brand', 'category__type', 'type', 'own_category']
+PRODUCT_PREFETCH = {
+    'brand': ['brand__contacts'],
+    'color': ['color'],
+    'rating': ['rating__groups', 'rating__user_permissions', 'rating__followings_user'],
+}
+
+
+def with_relations(products, fields):
+    return products.select_related(*PRODUCT_RELATED) \
+        .prefetch_related(*[lookup for field in fields for lookup in PRODUCT_PREFETCH.get(field, [])])
+
 
 class ProductListFilter(df_filters.FilterSet):
     type = CharArrayFilter(field_name='type__slug', lookup_expr='in')
@@ -37,9 +55,9 @@ class ProductListAPI(APIView, ProductListPaginator):
     filterset_class = ProductListFilter
 
     def get(self, request):
-        fields = ['id', 'name', 'type', 'brand', 'images', 'category', 'own_category', 'slug', 'description',
-                  'price', 'old_price', 'stock', 'status', 'is_sale', 'created_at']
-        products = Product.objects.filter(status=True)
+        fields = ['id', 'name', 'type', 'brand', 'main_image', 'main_thumbnail', 'category', 'own_category', 'slug',
+                  'description', 'price', 'old_price', 'stock', 'status', 'is_sale', 'created_at']
+        products = with_relations(Product.objects.filter(status=True), fields)
         for backend in list(self.filter_backends):
             products = backend().filter_queryset(self.request, products, self)
         paginated_products = self.paginate_queryset(products, self.request)
@@ -50,17 +68,28 @@ class ProductListAPI(APIView, ProductListPaginator):
         }, status=status.HTTP_200_OK)
 
 
-class ProductCommentAPI(APIView):
+class ProductCommentAPI(APIView, CommentListPaginator):
 
-    @staticmethod
-    def get(request, product_slug):
+    def get(self, request, product_slug):
         fields = ['uuid', 'user', 'text', 'parent', 'created_at', 'updated_at']
-        product = get_object_or_404(Product, is_active=True, slug=product_slug)
-        comments = Comment.objects.filter(used_to=product, is_active=True).order_by('-created_at')
-        serializer = CommentSerializer(comments, fields=fields, many=True)
+        product = get_object_or_404(Product.objects.only('pk'), is_active=True, slug=product_slug)
+        comments = Comment.objects.filter(used_to=product, root=None, is_active=True).select_related('user')
+        threads = self.paginate_queryset(comments, self.request)
+        pks = [comment.pk for comment in threads]
+        replies = {}
+        for reply in Comment.objects.first_replies(pks, settings.COMMENT_REPLIES_PREVIEW):
+            replies.setdefault(reply.root_id, []).append(reply)
+        reply_counts = r.mget([f"comment:{pk}:reply_count" for pk in pks]) if pks else []
+        data = CommentSerializer(threads, fields=fields, many=True).data
+        for pk, reply_count, thread in zip(pks, reply_counts, data):
+            thread['reply_count'] = int(reply_count) if reply_count else 0
+            thread['replies'] = CommentSerializer(replies.get(pk, []), fields=fields, many=True).data
+        response = self.get_paginated_response(data)
+        count = r.get(f"product:{product.pk}:comment_count")
+        response['count'] = int(count) if count else 0
         return Response({
             'success': True,
-            'data': serializer.data
+            'data': response
         }, status=status.HTTP_200_OK)
 
     def post(self, request, product_slug):
@@ -69,9 +98,15 @@ class ProductCommentAPI(APIView):
         if not user.is_authenticated:
             raise exceptions.AuthenticationFailed({"detail": _("You must authenticate.")})
         product = get_object_or_404(Product, is_active=True, slug=product_slug)
+        parent = None
+        if request.data.get('parent'):
+            try:
+                parent = Comment.objects.get(used_to=product, is_active=True, pk=request.data.get('parent'))
+            except (ObjectDoesNotExist, ValueError, TypeError):
+                raise exceptions.ValidationError({"parent": _("Comment not found.")})
         serializer = CommentSerializer(data=request.data, fields=fields)
         if serializer.is_valid():
-            serializer.save(user=user, used_to=product)
+            serializer.save(user=user, used_to=product, parent=parent)
             return Response({
                 'success': True,
                 'data': serializer.data
@@ -83,6 +118,20 @@ class ProductCommentAPI(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ProductCommentRepliesAPI(APIView, CommentReplyPaginator):
+
+    def get(self, request, uuid):
+        fields = ['uuid', 'user', 'text', 'parent', 'created_at', 'updated_at']
+        thread = get_object_or_404(Comment.objects.only('pk'), is_active=True, root=None, uuid=uuid)
+        replies = Comment.objects.filter(root=thread, is_active=True).select_related('user')
+        page = self.paginate_queryset(replies, self.request)
+        serializer = CommentSerializer(page, fields=fields, many=True)
+        return Response({
+            'success': True,
+            'data': self.get_paginated_response(serializer.data)
+        }, status=status.HTTP_200_OK)
+
+
 class ProductCommentDetailAPI(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -162,11 +211,17 @@ class ProductFilter(df_filters.FilterSet):
     own_category = df_filters.CharFilter(field_name='own_category__name', lookup_expr='iexact')
     brand = df_filters.CharFilter(field_name='brand__suffix', lookup_expr='icontains')
     name = df_filters.CharFilter(field_name='name', lookup_expr='icontains')
+    type = CharArrayFilter(field_name='type__slug', lookup_expr='in')
+    city = CharArrayFilter(method='filter_city')
 
     class Meta:
         model = Product
         fields = ['is_sale', 'sort_by', 'rating', 'own_category', 'color', 'name', 'brand', 'min_price', 'max_price',
-                  'created_at', 'category']
+                  'created_at', 'category', 'type', 'city']
+
+    @staticmethod
+    def filter_city(queryset, name, value):
+        return queryset.filter(brand__delivery=True, brand__cities__slug__in=value)
 
 
 class ProductSearchListAPI(APIView, ProductSearchPaginator):
@@ -175,18 +230,33 @@ class ProductSearchListAPI(APIView, ProductSearchPaginator):
 
     def get(self, request):
         fields = ['brand', 'rating', 'type', 'category', 'name', 'slug', 'price', 'color',
-                  'old_price', 'is_sale', 'images', 'status', 'own_category']
+                  'old_price', 'is_sale', 'main_image', 'main_thumbnail', 'status', 'own_category']
         user = self.request.user
         for key in request.query_params.keys():
-            if key == 'p':
+            if key in ['p', 'lat', 'lon', 'radius']:
                 continue
             elif key not in ProductFilter.Meta.fields:
                 raise exceptions.NotFound()
-        products = Product.objects.filter(is_active=True, status=True, brand__is_active=True, brand__status=True)
-        for backend in list(self.filter_backends):
-            products = backend().filter_queryset(self.request, products, self)
-        paginated_products = self.paginate_queryset(list(dict.fromkeys(products)), self.request)
-        serializer = ProductSerializer(paginated_products, many=True, fields=fields)
+        filters = bitmap.get_filters(request.query_params)
+        pks = bitmap.index.search(filters) if filters is not None else None
+        if pks is not None:
+            # filters answered from the in-memory bitmaps, the database only loads the page
+            pks = self.paginate_queryset(pks, self.request)
+        else:
+            products = Product.objects.filter(is_active=True, status=True, brand__is_active=True, brand__status=True)
+            if {'lat', 'lon', 'radius'} & set(request.query_params):
+                point, radius = geo.get_point(request), geo.get_radius(request)
+                if point is None or radius is None:
+                    raise exceptions.ValidationError({'detail': _("Wrong location input. Example: '?lat=42.123456&lon=60.654321'")})
+                nearest = geo.nearest(Brand.objects.filter(is_active=True, status=True), *point, radius)
+                products = products.filter(brand_id__in=[pk for pk, distance in nearest])
+            for backend in list(self.filter_backends):
+                products = backend().filter_queryset(self.request, products, self)
+            # joined filters repeat products, only the first occurrence keeps its place
+            pks = self.paginate_queryset(list(dict.fromkeys(products.values_list('pk', flat=True))), self.request)
+        products = with_relations(Product.objects.filter(pk__in=pks), fields).in_bulk()
+        serializer = ProductSerializer([products[pk] for pk in pks if pk in products], many=True, fields=fields,
+                                       context={'fields': fields})
         return Response({
             'success': True,
             'data': self.get_paginated_response(serializer.data)
@@ -198,13 +268,12 @@ class FollowedBrandProductsAPI(APIView, ProductListPaginator):
 
     def get(self, request):
         fields = ['brand', 'rating', 'type', 'category', 'name', 'slug', 'price', 'color',
-                  'old_price', 'is_sale', 'images', 'own_category', 'status']
+                  'old_price', 'is_sale', 'main_image', 'main_thumbnail', 'own_category', 'status']
         user = self.request.user
-        followed_brand_ids = user.followings_brand.values_list('id', flat=True)
-        followed_products = Product.objects.filter(is_active=True, status=True, stock__gt=0,
-                                                   brand__pk__in=followed_brand_ids)
-        paginated_products = self.paginate_queryset(followed_products, self.request)
-        serializer = ProductSerializer(paginated_products, many=True, fields=fields, context={'fields': fields})
+        pks = self.paginate_queryset(ranking.get_feed(user.pk), self.request)
+        products = with_relations(Product.objects.filter(pk__in=pks, is_active=True, status=True), fields).in_bulk()
+        products = [products[pk] for pk in pks if pk in products]
+        serializer = ProductSerializer(products, many=True, fields=fields, context={'fields': fields})
         return Response({
             'success': True,
             'data': self.get_paginated_response(serializer.data)
@@ -215,14 +284,15 @@ class ProductMemberListAPI(APIView, ProductListPaginator):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        fields = ['id', 'name', 'type', 'brand', 'images', 'category', 'own_category', 'slug', 'description',
-                  'price', 'old_price', 'stock', 'status', 'is_sale', 'created_at']
+        fields = ['id', 'name', 'type', 'brand', 'main_image', 'main_thumbnail', 'category', 'own_category', 'slug',
+                  'description', 'price', 'old_price', 'stock', 'status', 'is_sale', 'created_at']
         user = self.request.user
         try:
-            brand = user.brand_user.brand
+            brand_id = user.brand_user.brand_id
         except ObjectDoesNotExist:
             raise exceptions.NotFound()
-        products = Product.objects.filter(is_active=True, brand=brand, brand__is_active=True)
+        products = with_relations(Product.objects.filter(is_active=True, brand_id=brand_id, brand__is_active=True),
+                                  fields)
         paginated_products = self.paginate_queryset(products, self.request)
         serializer = ProductSerializer(paginated_products, many=True, fields=fields)
         return Response({
@@ -275,8 +345,7 @@ class ProductMemberListAPI(APIView, ProductListPaginator):
                                           sizes=sizes,
                                           brand=brand,
                                           own_category=own_category)
-                for image in images:
-                    ProductImage.objects.create(product=product, image=image)
+                ProductImage.objects.bulk_create([ProductImage(product=product, image=image) for image in images])
                 return Response({
                     'success': True,
                     'data': serializer.data
@@ -299,8 +368,8 @@ class ProductMemberDetailAPI(APIView):
                   'like_count', 'rating_count']
         user = self.request.user
         try:
-            brand = user.brand_user.brand
-            product = get_object_or_404(Product, is_active=True, brand=brand, brand__is_active=True, slug=product_slug)
+            product = get_object_or_404(Product, is_active=True, brand_id=user.brand_user.brand_id,
+                                        brand__is_active=True, slug=product_slug)
             serializer = ProductSerializer(product, fields=fields, context={'fields': fields})
             return Response({
                 'success': True,
@@ -318,7 +387,7 @@ class ProductMemberDetailAPI(APIView):
             brand = user.brand_user.brand
             product = get_object_or_404(Product, is_active=True, brand=brand, brand__is_active=True, slug=product_slug)
             manager = True if user.brand_user.is_manager else False
-            seller = True if product.user == user.brand_user else False
+            seller = True if product.user_id == user.brand_user.pk else False
         except BrandUser.DoesNotExist:
             raise exceptions.NotFound()
         if manager or seller:
@@ -364,7 +433,7 @@ class ProductMemberDetailAPI(APIView):
             brand = user.brand_user.brand
             product = get_object_or_404(Product, is_active=True, brand=brand, brand__is_active=True, slug=product_slug)
             manager = True if user.brand_user.is_manager else False
-            seller = True if product.user == user.brand_user else False
+            seller = True if product.user_id == user.brand_user.pk else False
         except BrandUser.DoesNotExist:
             raise exceptions.NotFound()
         if manager or seller:
@@ -388,7 +457,45 @@ class ProductDetailAPI(APIView):
         serializer = ProductSerializer(product, fields=fields, context={'fields': fields})
         ip = get_client_ip(request)
         r.zincrby(f"product:views:{product.pk}", 1, ip)
+        data = serializer.data
+        data['friends_liked_count'] = len(follows.get_friends(user, follows.get_product_likers_key(product.pk)))
+        return Response({
+            'success': True,
+            'data': data
+        }, status=status.HTTP_200_OK)
+
+
+class ProductSimilarAPI(APIView):
+
+    def get(self, request, product_slug):
+        fields = ['id', 'name', 'type', 'brand', 'main_image', 'main_thumbnail', 'category', 'own_category', 'slug',
+                  'description', 'price', 'old_price', 'stock', 'status', 'is_sale', 'created_at']
+        product = get_object_or_404(Product.objects.only('pk'), is_active=True, brand__is_active=True,
+                                    slug=product_slug)
+        pks = similarity.get_similar_ids(product.pk)
+        products = Product.objects.filter(pk__in=pks, is_active=True, status=True, brand__is_active=True).in_bulk()
+        products = [products[pk] for pk in pks if pk in products]
+        serializer = ProductSerializer(products, many=True, fields=fields, context={'fields': fields})
         return Response({
             'success': True,
             'data': serializer.data
         }, status=status.HTTP_200_OK)
+
+
+class ProductFriendsLikedAPI(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, product_slug):
+        product = get_object_or_404(Product, is_active=True, brand__is_active=True, slug=product_slug)
+        fields = ['uuid', 'username', 'slug', 'picture', 'first_name', 'last_name',
+                  'short_bio', 'is_official', 'followers_count']
+        pks = follows.get_friends(request.user, follows.get_product_likers_key(product.pk))
+        users = User.objects.filter(pk__in=pks[:settings.SOCIAL_PROOF_MAX_USERS], is_active=True) \
+            .select_related('brand_user__brand').order_by('pk')
+        counters = get_counters([user.pk for user in users], ['followers_count'])
+        serializer = UserSerializer(users, many=True, fields=fields, context={'fields': fields, 'counters': counters})
+        return Response({
+            'success': True,
+            'data': serializer.data,
+            'data_length': len(pks),
+        }, status=status.HTTP_200_OK)